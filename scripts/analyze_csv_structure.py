@@ -1,12 +1,18 @@
+import io
 import os
 import glob
 import zipfile
 import pandas as pd
-import shutil
 import logging
 import re
 from datetime import datetime
 import csv
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from pcf_blobstore import open_archive, default_store
+from pcf_encoding import encoding_candidates
+from pcf_manifest import CACHE_DB, ParseCache, read_manifest, manifest_signature
 
 path = r"C:\Users\yota-\Desktop\study\data\JPX\ETF保有銘柄\data\1306tsepcf_Dec042025.csv"
 
@@ -14,6 +20,13 @@ path = r"C:\Users\yota-\Desktop\study\data\JPX\ETF保有銘柄\data\1306tsepcf_D
 # ロギング設定: INFOレベル以上のメッセージをコンソールに出力
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# 各CSVから読む先頭の行数と、固定する列数
+HEAD_ROWS = 10
+NUM_COLS = 30
+
+# 構造解析のバージョン。出力が変わる修正をしたら上げる (アーカイブごとのキャッシュが使われなくなる)
+STRUCTURE_VERSION = 1
+
 def parse_date_from_filename(filename):
     """ファイル名から日付を抽出し、datetimeオブジェクトを返す"""
     # YYYYMMDD形式のパターン
@@ -26,22 +39,34 @@ def parse_date_from_filename(filename):
         return datetime.strptime(match.group(1), '%Y-%m-%d')
     return None
 
-def parse_csv(csv_path, encoding='cp932'):
+def read_head(zip_ref, name, max_lines=HEAD_ROWS * 2):
+    """
+    ZIPのメンバーの先頭 max_lines 行だけを展開して返す (ファイル全体は展開しない)。
+    戻り値: (バイト列, ファイル全体を読んだか)
     """
-    指定されたCSVファイルの先頭10行を、列数を30に固定して読み込み、DataFrameを返す。
-    区切り文字は自動で判別する。
+    lines = []
+    with zip_ref.open(name) as f:
+        for line in f:
+            lines.append(line)
+            if len(lines) >= max_lines:
+                return b''.join(lines), f.read(1) == b''
+    return b''.join(lines), True
+
+def parse_csv(csv_path, encoding='cp932', label=None):
+    """
+    指定されたCSVファイル (パスまたはバイト列のバッファ) の先頭10行を、列数を30に固定して読み込み、DataFrameを返す。
+    区切り文字は自動で判別する。label はエラーメッセージに表示する名前。
     """
     try:
-        # 固定する列数を定義し、列名を生成 (例: col_1, col_2, ...)
-        num_cols = 30
-        col_names = [f'col_{i+1}' for i in range(num_cols)]
+        # 列名を生成 (例: col_1, col_2, ...)
+        col_names = [f'col_{i+1}' for i in range(NUM_COLS)]
 
         # namesオプションで列数を固定して読み込む
         df = pd.read_csv(
             csv_path,
             header=None,
             names=col_names,
-            nrows=10,
+            nrows=HEAD_ROWS,
             encoding=encoding,
             engine='python',
             sep=None,
@@ -50,14 +75,115 @@ def parse_csv(csv_path, encoding='cp932'):
         )
         return df
     except Exception as e:
-        print(f"Error parsing file {csv_path} with encoding {encoding}: {e}")
+        print(f"Error parsing file {label or csv_path} with encoding {encoding}: {e}")
+        return None
+
+def parse_with_pandas(csv_path, file, data):
+    """
+    CSVのバイト列を parse_csv で読み、転置して列ごとに [path, file_name, row_1, row_2, ...] を返す (読めない場合はNone)。
+    data はファイル全体でも先頭の行だけでもよい (parse_csv は先頭 HEAD_ROWS 行しか読まない)。
+    """
+    # 先頭のバイト列から判定したエンコーディングを最初に試す
+    df_parsed = None
+    for enc in encoding_candidates(data):
+        # parse_csvはDataFrameを返す（またはNone）
+        df_parsed = parse_csv(io.BytesIO(data), encoding=enc, label=csv_path)
+        if df_parsed is not None and not df_parsed.empty:
+            break
+    if df_parsed is None or df_parsed.empty:
         return None
+    # DataFrameを転置
+    return [[csv_path, file] + ['' if pd.isna(v) else str(v) for v in values]
+            for values in df_parsed.transpose().itertuples(index=False)]
+
+def analyze_archive(vendor_path, zip_filename):
+    """
+    1つのアーカイブ (ZIPまたはブロブストア) の各CSVの先頭行を転置し、
+    [path, file_name, row_1, row_2, ...] のリストを返す。ワーカープロセスで実行する。
+    """
+    zip_filepath = os.path.join(vendor_path, zip_filename)
+    # 出力の path 列は従来どおり解凍先のパスで表す (ファイルは展開せずメモリ上で読む)
+    extract_dir = os.path.join(vendor_path, os.path.splitext(zip_filename)[0])
+
+    results = []
+    with open_archive(zip_filepath) as zip_ref:
+        for name in zip_ref.namelist():
+            if not name.lower().endswith('.csv'):
+                continue
+            csv_path = os.path.join(extract_dir, *name.split('/'))
+            file = os.path.basename(csv_path)
+            # 先頭の行だけを展開してpandasで読む
+            data, complete = read_head(zip_ref, name)
+            records = parse_with_pandas(csv_path, file, data)
+            if not complete and (not records or len(records[0]) - 2 < HEAD_ROWS):
+                # 空行が多いなどで先頭の行に HEAD_ROWS 行が収まらない場合はファイル全体を読む
+                records = parse_with_pandas(csv_path, file, zip_ref.read(name))
+
+            if not records:
+                print(f"Could not parse or file is empty: {csv_path}")
+                continue
+            results.extend(records)
+    return results
+
+def list_archives(download_dir, vendors=None, ends_only=False):
+    """
+    対象のアーカイブ (ベンダーのディレクトリ, ファイル名) を返す。
+    ダウンロード済みのZIPとブロブストアに保存したアーカイブ (ZIPを削除したものを含む) のすべてを対象にする。
+    ends_only=True の場合はベンダーごとに最古と最新のみ。
+    """
+    store = default_store()
+    stored = {}
+    if store is not None:
+        for vendor, archive in store.archives():
+            stored.setdefault(vendor, set()).add(archive)
+
+    targets = []
+    vendor_dirs = set(os.listdir(download_dir)) if os.path.isdir(download_dir) else set()
+    for vendor in sorted(vendor_dirs | set(stored)):
+        if vendors and vendor not in vendors:
+            continue
+        vendor_path = os.path.join(download_dir, vendor)
+        zip_files = set(stored.get(vendor, ()))
+        if os.path.isdir(vendor_path):
+            zip_files.update(f for f in os.listdir(vendor_path) if f.endswith('.zip'))
+        zip_files = sorted(zip_files)
+        if ends_only and len(zip_files) > 2:
+            zip_files = [zip_files[0], zip_files[-1]] # 最古と最新
+        targets.extend((vendor_path, zip_filename) for zip_filename in zip_files)
+    return targets
+
+def analyze_archives(pending, executor=None):
+    """
+    pending: ((ベンダーのディレクトリ, ファイル名), 付随する値) のリスト。
+    完了した順に (pendingの要素, analyze_archive の結果) を返す。読めないアーカイブは例外オブジェクトを返す。
+    """
+    if executor is None:
+        for item in pending:
+            try:
+                yield item, analyze_archive(*item[0])
+            except (zipfile.BadZipFile, OSError, KeyError) as e:
+                yield item, e
+        return
+    futures = {executor.submit(analyze_archive, *item[0]): item for item in pending}
+    for future in as_completed(futures):
+        try:
+            yield futures[future], future.result()
+        except (zipfile.BadZipFile, OSError, KeyError) as e:
+            yield futures[future], e
 
 def main():
     """
     メイン関数
     """
-    print("--- PCF Parser and Unzip Script ---")
+    parser = argparse.ArgumentParser(description="Record the first rows of every PCF CSV to data/csv_structure.csv.")
+    parser.add_argument("--vendors", nargs='+', help="Vendors to analyze (default: all).")
+    parser.add_argument("--ends-only", action='store_true', help="Analyze only the oldest and newest archive per vendor.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Number of worker processes (default: number of CPUs).")
+    parser.add_argument("--no-cache", action='store_true', help="Analyze every archive again instead of reusing cached results.")
+    args = parser.parse_args()
+
+    print("--- PCF CSV Structure Analysis ---")
 
     # ダウンロードディレクトリを設定
     download_dir = 'data/downloads'
@@ -67,99 +193,54 @@ def main():
     if os.path.exists(output_csv_path):
         os.remove(output_csv_path)
 
-    # ベンダーごとに処理
-    results = []
-    if not os.path.isdir(download_dir):
+    targets = list_archives(download_dir, args.vendors, args.ends_only)
+    if not targets and not os.path.isdir(download_dir):
         print(f"Error: Download directory not found at '{download_dir}'")
         return
 
-    for vendor in os.listdir(download_dir):
-        vendor_path = os.path.join(download_dir, vendor)
-        if os.path.isdir(vendor_path):
-            # 日付の形式がベンダーごとに異なる可能性があるため、ファイル名から日付を抽出してソート
-            zip_files = sorted([f for f in os.listdir(vendor_path) if f.endswith('.zip')])
-            if not zip_files:
+    # アーカイブごとの結果。マニフェスト (メンバー名とCRC32) が前回と同じアーカイブはキャッシュを使う
+    results = {}
+    pending = []
+    with ParseCache(CACHE_DB) as cache:
+        for target in targets:
+            zip_filepath = os.path.join(*target)
+            try:
+                signature = manifest_signature(read_manifest(zip_filepath), STRUCTURE_VERSION)
+            except (zipfile.BadZipFile, OSError) as e:
+                print(f"Error: {zip_filepath} could not be read ({e}). Skipping.")
                 continue
-
-            # 最新と最古のZIPファイルを選択
-            target_zip_files = []
-            if len(zip_files) > 0:
-                target_zip_files.append(zip_files[0]) # 最古
-            if len(zip_files) > 1:
-                target_zip_files.append(zip_files[-1]) # 最新
-
-            for zip_filename in set(target_zip_files): # 重複を避ける
-                zip_filepath = os.path.join(vendor_path, zip_filename)
-                extract_dir = os.path.join(vendor_path, os.path.splitext(zip_filename)[0])
-
-                # ZIPファイルを解凍
-                if os.path.exists(extract_dir):
-                    shutil.rmtree(extract_dir)
-                os.makedirs(extract_dir, exist_ok=True)
-                print(f"Extracting {zip_filepath}...")
-                try:
-                    with zipfile.ZipFile(zip_filepath, 'r') as zip_ref:
-                        zip_ref.extractall(extract_dir)
-                    print("Extraction complete.")
-                except zipfile.BadZipFile:
-                    print(f"Error: {zip_filepath} is not a valid zip file. Skipping.")
+            cached = None if args.no_cache else cache.structure(zip_filepath, signature)
+            if cached is not None:
+                results[target] = cached
+            else:
+                pending.append((target, signature))
+        print(f"{len(targets)} archives: {len(results)} cached, {len(pending)} to analyze")
+
+        executor = ProcessPoolExecutor(max_workers=args.workers) if args.workers > 1 and len(pending) > 1 else None
+        try:
+            for (target, signature), records in analyze_archives(pending, executor):
+                zip_filepath = os.path.join(*target)
+                if isinstance(records, Exception):
+                    print(f"Error: {zip_filepath} could not be read ({records}). Skipping.")
                     continue
-
-
-                # 解凍したディレクトリ内のCSVファイルを処理
-                for root, _, files in os.walk(extract_dir):
-                    for file in files:
-                        if file.lower().endswith('.csv'):
-                            csv_path = os.path.join(root, file)
-                            
-                            # 複数のエンコーディングを試す
-                            encodings_to_try = ['cp932', 'utf-8', 'sjis']
-                            df_parsed = None
-                            for enc in encodings_to_try:
-                                # parse_csvはDataFrameを返す（またはNone）
-                                df_parsed = parse_csv(csv_path, encoding=enc)
-                                if df_parsed is not None and not df_parsed.empty:
-                                    break
-                            
-                            if df_parsed is None or df_parsed.empty:
-                                print(f"Could not parse or file is empty: {csv_path}")
-                                continue
-
-                            # DataFrameを転置
-                            df_transposed = df_parsed.transpose()
-
-                            # カラム名を 'row_1', 'row_2', ... に設定
-                            df_transposed.columns = [f'row_{i+1}' for i in range(df_transposed.shape[1])]
-
-                            # パスとファイル名を追加
-                            df_transposed['path'] = csv_path
-                            df_transposed['file_name'] = file
-                            
-                            results.append(df_transposed)
-
-                # 解凍したファイルとディレクトリを削除
-                shutil.rmtree(extract_dir)
-                print(f"Cleaned up {extract_dir}")
-
-
-    # 結果をCSVファイルに出力
-    if results:
-        df_output = pd.concat(results, ignore_index=True)
-        
-        # カラムの順序を整理
-        # 'path' と 'file_name' 以外のカラム（row_...）を取得
-        row_cols = [col for col in df_output.columns if col.startswith('row_')]
-        # row_X カラムを数値でソート
-        if row_cols:
-            row_cols.sort(key=lambda x: int(x.split('_')[1]))
-        
-        # 最終的なカラム順序
-        cols = ['path', 'file_name'] + row_cols
-        # 存在しないカラムが指定されるのを防ぐ
-        cols = [col for col in cols if col in df_output.columns]
-        df_output = df_output[cols]
-
-        df_output.to_csv(output_csv_path, index=False, encoding='utf-8-sig')
+                print(f"Analyzed {zip_filepath}")
+                # CSVのないアーカイブも空のリストとして保存し、次回は解析しない
+                results[target] = records
+                cache.put_structure(zip_filepath, signature, records)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+    # 結果をCSVファイルに出力 (アーカイブの順序は並列処理の完了順によらず一定)
+    records = [record for target in targets for record in results.get(target, [])]
+    if records:
+        # 'path', 'file_name' と、最も行の多いファイルに合わせた row_1, row_2, ...
+        width = max(len(record) for record in records)
+        header = ['path', 'file_name'] + [f'row_{i+1}' for i in range(width - 2)]
+        with open(output_csv_path, 'w', newline='', encoding='utf-8-sig') as f:
+            writer = csv.writer(f, lineterminator=os.linesep)
+            writer.writerow(header)
+            writer.writerows(record + [''] * (width - len(record)) for record in records)
         print(f"--- Structure analysis complete. Output saved to {output_csv_path} ---")
     else:
         print("--- No CSV files found or processed. ---")
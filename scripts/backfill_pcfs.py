@@ -0,0 +1,128 @@
+import os
+import time
+import logging
+import argparse
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+from parse_pcfs_by_date import (
+    find_archives, parse_archives, commit_manifests, collect_results, save_results, open_cache, ARCHIVE_ORDER,
+)
+from pcf_state import open_store, to_date_key
+
+# ダウンロード済みで未解析のアーカイブを、1つのプロセスでまとめて解析する。
+# 対象は状態ストアの download_status = 1 かつ parse_status = 0 の (ベンダー, 日付)。
+# 日付ごとに結果を保存した後で unzip_status・parse_status を 1 にするため、
+# 中断した場合も次回は未完了の日付から再開できる。
+
+
+def pending_archives(store, start=None, end=None, vendors=None, force=False):
+    """
+    解析が必要な (ベンダー, 日付) を {日付キー: [ベンダー, ...]} で返す (日付の昇順)。
+    force=True の場合は解析済みのものも含める。
+    """
+    pending = {}
+    for vendor in ARCHIVE_ORDER:
+        if vendors is not None and vendor not in vendors:
+            continue
+        dates = store.dates_with(vendor, start, end, download_status=1)
+        if not force:
+            dates -= store.dates_with(vendor, start, end, parse_status=1)
+        for d in dates:
+            pending.setdefault(d, []).append(vendor)
+    return dict(sorted(pending.items()))
+
+
+def backfill_date(store, date_key, vendors, workers=1, fmt='csv', executor=None, cache=None, derived=None):
+    """
+    1日分の未解析アーカイブを解析して保存し、状態を更新する。
+    cache: 解析結果のキャッシュ (変更のないメンバーは解析しない)
+    derived: save_results() に渡す index / latest / validate の指定 (None の場合はすべて行う)
+    戻り値: 解析したアーカイブの数
+    """
+    target_date = datetime.strptime(date_key, '%Y-%m-%d')
+    archives = find_archives(target_date, vendors)
+    missing = set(vendors) - {vendor for vendor, _ in archives}
+    for vendor in sorted(missing):
+        logging.warning(f"  {vendor} {date_key}: marked as downloaded but the archive is missing. Skipping.")
+    if not archives:
+        return 0
+
+    failed = []
+    results, manifests = parse_archives([path for _, path in archives], workers, executor, cache=cache, failed=failed)
+    final_base_df, final_holdings_df = collect_results(results)
+
+    parsed_vendors = [vendor for vendor, path in archives if path not in failed]
+    # 一部のベンダーのみ解析した場合、CSVに含まれる他のベンダーの行は残す
+    save_results(final_base_df, final_holdings_df, date_key, fmt, replace_sources=parsed_vendors, **(derived or {}))
+    if cache is not None:
+        commit_manifests(cache, manifests)
+
+    with store.transaction():
+        for vendor in parsed_vendors:
+            store.update(vendor, date_key, unzip_status=1, parse_status=1)
+    return len(parsed_vendors)
+
+
+def run_backfill(store, start=None, end=None, vendors=None, workers=1, fmt='csv', force=False, use_cache=True,
+                 derived=None):
+    """
+    期間内 (start/end が None の場合は全期間) の未解析アーカイブをまとめて解析する。
+    プロセスプールは実行全体で1つを使い回す。
+    use_cache: 解析結果のキャッシュを使う (force で再解析する場合も、変更のないメンバーは解析しない)
+    derived: backfill_date() を参照
+    """
+    pending = pending_archives(store, start, end, vendors, force)
+    total = sum(len(v) for v in pending.values())
+    logging.info(f"{total} archive(s) on {len(pending)} date(s) to parse.")
+    if not pending:
+        return 0
+
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    cache = open_cache() if use_cache else None
+    started = time.perf_counter()
+    done = 0
+    try:
+        for i, (date_key, date_vendors) in enumerate(pending.items(), 1):
+            logging.info(f"--- [{i}/{len(pending)}] {date_key}: {', '.join(date_vendors)} ---")
+            done += backfill_date(store, date_key, date_vendors, workers, fmt, executor, cache, derived)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        if cache is not None:
+            cache.close()
+        # 旧形式のログ (flag_unzip_*) にも反映する
+        store.export_legacy_log()
+    logging.info(f"Parsed {done}/{total} archive(s) in {time.perf_counter() - started:.1f}s.")
+    return done
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Parse every downloaded but unparsed PCF archive in one process.")
+    parser.add_argument("--from", dest="start", default=None, help="First date to parse (YYYY-MM-DD). Default: no lower bound.")
+    parser.add_argument("--to", dest="end", default=None, help="Last date to parse (YYYY-MM-DD). Default: no upper bound.")
+    parser.add_argument("--vendors", nargs='+', choices=ARCHIVE_ORDER, default=None, help="Vendors to parse (default: all).")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Number of worker processes used to parse CSV files (default: CPU count).")
+    parser.add_argument("--format", choices=['csv', 'parquet', 'arrow'], default='csv',
+                        help="Output format, as in parse_pcfs_by_date.py (default: csv).")
+    parser.add_argument("--force", action='store_true', help="Re-parse archives that are already marked as parsed.")
+    parser.add_argument("--no-cache", action='store_true', help="Re-parse every CSV file instead of reusing cached results.")
+    parser.add_argument("--no-validate", action='store_true', help="Do not validate the results or write quality reports.")
+    parser.add_argument("--no-index", action='store_true', help="Do not build the holdings reverse index.")
+    parser.add_argument("--no-latest", action='store_true', help="Do not update the latest-holdings store.")
+    args = parser.parse_args()
+
+    start = to_date_key(args.start) if args.start else None
+    end = to_date_key(args.end) if args.end else None
+    if start and end and start > end:
+        parser.error("--from must not be after --to")
+
+    with open_store() as store:
+        derived = {'index': not args.no_index, 'latest': not args.no_latest, 'validate': not args.no_validate}
+        run_backfill(store, start, end, args.vendors, args.workers, args.format, args.force, not args.no_cache, derived)
+
+
+if __name__ == '__main__':
+    main()
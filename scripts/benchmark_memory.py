@@ -0,0 +1,93 @@
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import resource
+import tempfile
+import subprocess
+from datetime import datetime
+
+# 1日分を連結してから保存する従来の処理 (batch) と、ZIPメンバー単位で書き出す pcf_stream (stream) の
+# ピークメモリ (最大RSS) と処理時間を、処理する日付の数を増やしながら比較する。
+# 計測ごとに子プロセスを起動するため、各値はその実行だけの最大RSSになる。
+
+MODES = ['batch', 'stream']
+
+
+def _max_rss_mb():
+    # Linux では ru_maxrss の単位は KB (macOS では bytes)
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+
+def run_batch(dates, output_dir, workers):
+    from parse_pcfs_by_date import find_archives, list_work_items, parse_work_items, collect_results, save_results
+    for d in dates:
+        found_files = [path for _, path in find_archives(datetime.strptime(d, '%Y-%m-%d'))]
+        if not found_files:
+            continue
+        results = parse_work_items(list_work_items(found_files), workers=workers)
+        final_base_df, final_holdings_df = collect_results(results)
+        save_results(final_base_df, final_holdings_df, d, output_dir=output_dir, index=False, latest=False, validate=False)
+
+
+def run_stream(dates, output_dir, workers, chunk_rows):
+    from concurrent.futures import ProcessPoolExecutor
+    from pcf_stream import CsvSink, stream_date
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        for d in dates:
+            stream_date(d, [CsvSink(d, output_dir, chunk_rows)], workers, executor)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+
+def child(args):
+    """子プロセス側: 1つの設定で処理し、結果をJSONで標準出力に書く"""
+    logging.basicConfig(level=logging.WARNING)
+    started = time.perf_counter()
+    with tempfile.TemporaryDirectory() as output_dir:
+        if args.mode == 'batch':
+            run_batch(args.dates, output_dir, args.workers)
+        else:
+            run_stream(args.dates, output_dir, args.workers, args.chunk_rows)
+    print(json.dumps({
+        'elapsed': time.perf_counter() - started,
+        'max_rss_mb': _max_rss_mb(),
+    }))
+
+
+def measure(mode, dates, workers, chunk_rows):
+    cmd = [sys.executable, os.path.abspath(__file__), '--child', '--mode', mode,
+           '--workers', str(workers), '--chunk-rows', str(chunk_rows), *dates]
+    out = subprocess.run(cmd, check=True, capture_output=True, text=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare peak memory of batch parsing and the streaming pipeline.")
+    parser.add_argument("dates", nargs='+', help="Dates to process (YYYY-MM-DD). Each step adds one more date.")
+    parser.add_argument("--modes", nargs='+', choices=MODES, default=MODES, help="Pipelines to measure (default: both).")
+    parser.add_argument("--workers", type=int, default=1, help="Number of worker processes (default: 1).")
+    parser.add_argument("--chunk-rows", type=int, default=50000, help="Rows per write for the stream mode (default: 50000).")
+    parser.add_argument("--child", action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument("--mode", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args)
+        return
+
+    print(f"{'dates':>5} {'mode':>7} {'max RSS (MB)':>13} {'elapsed (s)':>12}")
+    for n in range(1, len(args.dates) + 1):
+        for mode in args.modes:
+            result = measure(mode, args.dates[:n], args.workers, args.chunk_rows)
+            print(f"{n:>5} {mode:>7} {result['max_rss_mb']:>13.1f} {result['elapsed']:>12.2f}")
+    print("(max RSS includes the interpreter and imported libraries; with --workers > 1 only the parent process is measured)")
+
+
+if __name__ == '__main__':
+    main()
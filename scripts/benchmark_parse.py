@@ -0,0 +1,220 @@
+import os
+import io
+import time
+import logging
+import argparse
+import tempfile
+import statistics
+from zipfile import ZipFile
+
+import pandas as pd
+
+from parse_pcfs_by_date import parse_pcf_file, attach_source
+from pcf_encoding import ENCODINGS_TO_TRY
+
+# PCFファイル1件あたりの解析時間を、旧実装 (行分割 + pythonエンジン) と現在の実装で比較する。
+# 入力はダウンロード済みのZIP、または data/csv_structure.csv に記録された各ファイルの先頭行から復元したサンプル。
+# --derived を指定した場合は、全ファイルを1日分として保存した後の処理 (正規化・検証・逆引き索引・最新のPCFのストア) の時間も測る。
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(script_dir)
+
+
+# --- 旧実装 (比較用) ---
+def legacy_find_header_row_and_data(file_content_lines, key_column):
+    header_row_index = -1
+    for i, line in enumerate(file_content_lines):
+        columns = [col.strip() for col in line.strip().split(',')]
+        if key_column in columns:
+            header_row_index = i
+            break
+    if header_row_index != -1:
+        return header_row_index, file_content_lines[header_row_index:]
+    return -1, []
+
+
+def legacy_parse_pcf_file(csv_content):
+    lines = csv_content.strip().splitlines()
+    if lines:
+        lines[0] = lines[0].lstrip('\ufeff')
+
+    base_header_index, base_data_lines = legacy_find_header_row_and_data(lines, 'ETF Code')
+    df_base_info = pd.DataFrame()
+    if base_header_index != -1:
+        df_base_info = pd.read_csv(
+            io.StringIO("\n".join(base_data_lines[:2])), sep=',', engine='python'
+        ).dropna(how='all', axis=1)
+
+    holdings_header_index, holdings_data_lines = legacy_find_header_row_and_data(lines, 'Code')
+    df_holdings = pd.DataFrame()
+    if holdings_header_index != -1:
+        df_holdings = pd.read_csv(
+            io.StringIO("\n".join(holdings_data_lines)), sep=',', engine='python'
+        ).dropna(how='all', axis=1).dropna(how='all')
+
+    if df_base_info.empty and df_holdings.empty:
+        return None
+    return {'base_info': df_base_info, 'holdings': df_holdings}
+
+
+def legacy_decode_and_parse(file_bytes):
+    """旧実装と同じ手順でエンコーディングを探す。戻り値: (エンコーディング, 解析結果)"""
+    for enc in ENCODINGS_TO_TRY:
+        try:
+            parsed = legacy_parse_pcf_file(file_bytes.decode(enc))
+        except UnicodeDecodeError:
+            continue
+        except Exception:
+            continue
+        if parsed:
+            return enc, parsed
+    return None, None
+
+
+# --- 入力データ ---
+def members_from_archives(zip_paths):
+    """ZIP内のCSVを (ベンダー, レイアウト名, メンバー名, バイト列) で列挙する"""
+    for zip_path in zip_paths:
+        vendor = os.path.basename(os.path.dirname(zip_path))
+        with ZipFile(zip_path) as zf:
+            for name in zf.namelist():
+                if name.lower().endswith('.csv'):
+                    yield vendor, os.path.basename(zip_path), name, zf.read(name)
+
+
+def members_from_structure(structure_csv, holdings_rows):
+    """
+    csv_structure.csv (各ファイルの先頭10行 x 30列を転置したもの) からファイルを復元する。
+    保有銘柄の行は holdings_rows 行になるまで繰り返して実際のファイルサイズに近づける。
+    """
+    df = pd.read_csv(structure_csv, dtype=str, keep_default_na=False)
+    row_cols = [c for c in df.columns if c.startswith('row_')]
+    for path, group in df.groupby('path', sort=False):
+        parts = path.replace('\\', '/').split('/')
+        vendor, layout = parts[-3], parts[-2]
+        lines = []
+        for col in row_cols:
+            fields = list(group[col])
+            while fields and fields[-1] == '':
+                fields.pop()
+            lines.append(','.join(f'"{f}"' if ',' in f else f for f in fields))
+        while lines and lines[-1] == '':
+            lines.pop()
+        header = next((i for i, line in enumerate(lines) if 'Code' in [c.strip() for c in line.split(',')]), None)
+        if header is None or header + 1 >= len(lines):
+            continue
+        body = lines[header + 1:]
+        body = (body * (holdings_rows // len(body) + 1))[:holdings_rows]
+        text = '\r\n'.join(lines[:header + 1] + body) + '\r\n'
+        yield vendor, layout, group['file_name'].iloc[0], text.encode('utf-8')
+
+
+def best_of(func, repeat):
+    """repeat回実行した中で最短の時間 (秒)"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def benchmark_derived(frames, repeat):
+    """
+    解析結果を1日分として save_results() の後の処理 (update_derived) を1つずつ測る。
+    比較のため、一部のベンダーのみ解析した場合に以前行っていた、保存したCSVの読み直しの時間も測る。
+    出力・ストアは一時ディレクトリに作る。戻り値: 処理名 -> 秒
+    """
+    from parse_pcfs_by_date import collect_results, _write_csv
+    from pcf_schema import normalize_base, normalize_holdings
+    from pcf_validate import validate_date
+    from pcf_index import build_index
+    from pcf_latest import update_latest
+    from load_pcfs import read_parsed_csv
+
+    date_str = time.strftime('%Y-%m-%d')
+    final_base_df, final_holdings_df = collect_results(frames)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        _write_csv(final_base_df, os.path.join(tmp_dir, f"base_info_{date_str}.csv"))
+        _write_csv(final_holdings_df, os.path.join(tmp_dir, f"holdings_{date_str}.csv"))
+        base = normalize_base(final_base_df, default_date=date_str, valuation=True)
+        holdings = normalize_holdings(final_holdings_df, base, valuation=True)
+        # 最新のPCFのストアは内容が同じETFを更新しないため、毎回新しいファイルに書く
+        latest_paths = (os.path.join(tmp_dir, f'latest_{i}.db') for i in range(repeat))
+        return {
+            'normalize': best_of(lambda: normalize_holdings(
+                final_holdings_df, normalize_base(final_base_df, default_date=date_str, valuation=True), valuation=True
+            ), repeat),
+            'validate': best_of(lambda: validate_date(base, holdings, date_str, os.path.join(tmp_dir, 'quality')), repeat),
+            'index': best_of(lambda: build_index(base, holdings, date_str, os.path.join(tmp_dir, 'index')), repeat),
+            'latest': best_of(lambda: update_latest(base, holdings, date_str, path=next(latest_paths)), repeat),
+            'csv read-back (previous)': best_of(lambda: read_parsed_csv(date_str, tmp_dir, valuation=True), repeat),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark per-file PCF parse time against the previous implementation.")
+    parser.add_argument("archives", nargs='*', help="ZIP archives to benchmark (default: samples rebuilt from data/csv_structure.csv).")
+    parser.add_argument("--structure", default=os.path.join(project_root, 'data', 'csv_structure.csv'),
+                        help="csv_structure.csv used to rebuild sample files when no archive is given.")
+    parser.add_argument("--holdings-rows", type=int, default=300,
+                        help="Number of holdings rows per rebuilt sample file (default: 300).")
+    parser.add_argument("--repeat", type=int, default=3, help="Timing repeats per file; the best run is kept (default: 3).")
+    parser.add_argument("--derived", action='store_true',
+                        help="Also time the steps run after saving a day (normalize, validate, index, latest store), "
+                             "treating every benchmarked file as one day.")
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+
+    if args.archives:
+        members = members_from_archives(args.archives)
+    else:
+        members = members_from_structure(args.structure, args.holdings_rows)
+
+    results = []
+    frames = []
+    mismatches = 0
+    for vendor, layout, name, file_bytes in members:
+        enc, legacy = legacy_decode_and_parse(file_bytes)
+        if enc is None:
+            continue
+        current = parse_pcf_file(file_bytes, enc, name)
+        if not (current and legacy['base_info'].equals(current['base_info']) and legacy['holdings'].equals(current['holdings'])):
+            mismatches += 1
+        t_legacy = best_of(lambda: legacy_parse_pcf_file(file_bytes.decode(enc)), args.repeat)
+        t_current = best_of(lambda: parse_pcf_file(file_bytes, enc, name), args.repeat)
+        results.append({'vendor': vendor, 'layout': layout, 'bytes': len(file_bytes),
+                        'legacy_us': t_legacy * 1e6, 'current_us': t_current * 1e6})
+        if args.derived and current:
+            frames.append(attach_source(current, vendor))
+
+    if not results:
+        print("No PCF files found to benchmark.")
+        return
+
+    df = pd.DataFrame(results)
+    summary = df.groupby(['vendor', 'layout']).agg(
+        files=('bytes', 'size'),
+        median_kb=('bytes', lambda s: statistics.median(s) / 1024),
+        legacy_us=('legacy_us', 'median'),
+        current_us=('current_us', 'median'),
+    )
+    summary['speedup'] = summary['legacy_us'] / summary['current_us']
+    pd.set_option('display.float_format', lambda v: f'{v:,.1f}')
+    print("Median parse time per file (microseconds)")
+    print(summary.to_string())
+    print(f"\nTotal: {len(df)} files, legacy {df['legacy_us'].sum() / 1e6:.2f}s, "
+          f"current {df['current_us'].sum() / 1e6:.2f}s, speedup x{df['legacy_us'].sum() / df['current_us'].sum():.2f}")
+    print(f"Files whose parsed frames differ from the previous implementation: {mismatches}")
+
+    if args.derived and frames:
+        timings = benchmark_derived(frames, args.repeat)
+        parse_s = df['current_us'].sum() / 1e6
+        print(f"\nSteps after saving all {len(frames)} files as one day (seconds; parse total {parse_s:.2f}s)")
+        for step, seconds in timings.items():
+            print(f"  {step:<26}{seconds:8.3f}  ({seconds / parse_s:.0%} of parse time)")
+
+
+if __name__ == '__main__':
+    main()
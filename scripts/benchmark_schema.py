@@ -0,0 +1,76 @@
+import logging
+import argparse
+from datetime import datetime
+
+import pandas as pd
+
+from parse_pcfs_by_date import find_archives, list_work_items, parse_work_items, collect_results
+from pcf_schema import normalize_base, normalize_holdings, compact, expand, concat_compact
+
+# 1日分の保有銘柄のメモリ使用量を、解析直後 (ベンダーごとの列名・object型)・正規化後 (pcf_schema の列)・
+# 省メモリな型 (pcf_schema.compact) の3段階で比較する。
+# 複数の日付を指定すると、compact した表を連結した履歴全体の大きさも表示する。
+
+
+def _mb(nbytes):
+    return nbytes / (1024 * 1024)
+
+
+def memory_bytes(df):
+    """文字列の中身を含めたメモリ使用量 (bytes)"""
+    return int(df.memory_usage(deep=True, index=False).sum())
+
+
+def parse_date(target_date_str, workers):
+    """指定日のアーカイブを解析し、(解析直後の保有銘柄, 正規化後の保有銘柄) を返す。アーカイブがない場合はNone"""
+    found_files = [path for _, path in find_archives(datetime.strptime(target_date_str, '%Y-%m-%d'))]
+    if not found_files:
+        return None
+    final_base_df, final_holdings_df = collect_results(parse_work_items(list_work_items(found_files), workers=workers))
+    if final_base_df is None or final_holdings_df is None:
+        return None
+    base = normalize_base(final_base_df, default_date=target_date_str)
+    return final_holdings_df, normalize_holdings(final_holdings_df, base)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the memory footprint of parsed, normalized and compact holdings.")
+    parser.add_argument("dates", nargs='+', help="Dates to parse (YYYY-MM-DD).")
+    parser.add_argument("--workers", type=int, default=1, help="Number of worker processes (default: 1).")
+    parser.add_argument("--by-column", action='store_true', help="Also print the normalized and compact size of each column.")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    history = []
+    normalized_total = 0
+    print(f"{'date':>10} {'rows':>9} {'parsed (MB)':>12} {'normalized':>11} {'compact':>9} {'ratio':>6}")
+    for d in args.dates:
+        parsed = parse_date(d, args.workers)
+        if parsed is None:
+            print(f"{d:>10} (no archives)")
+            continue
+        raw, holdings = parsed
+        small = compact(holdings)
+        if not expand(small).equals(holdings):
+            logging.warning(f"{d}: compact holdings do not convert back to the normalized frame")
+        sizes = [memory_bytes(raw), memory_bytes(holdings), memory_bytes(small)]
+        print(f"{d:>10} {len(holdings):>9} {_mb(sizes[0]):>12.1f} {_mb(sizes[1]):>11.1f} {_mb(sizes[2]):>9.1f} "
+              f"{sizes[1] / max(sizes[2], 1):>5.1f}x")
+        if args.by_column:
+            for col in holdings.columns:
+                before = holdings[col].memory_usage(deep=True, index=False)
+                after = small[col].memory_usage(deep=True, index=False)
+                print(f"    {col:<14} {str(holdings[col].dtype):>16} {_mb(before):>8.2f} MB -> "
+                      f"{str(small[col].dtype):>30} {_mb(after):>8.2f} MB")
+        history.append(small)
+        normalized_total += sizes[1]
+
+    if len(history) > 1:
+        combined = concat_compact(history)
+        size = memory_bytes(combined)
+        print(f"{len(history)} dates: {len(combined)} rows, normalized {_mb(normalized_total):.1f} MB, "
+              f"compact history {_mb(size):.1f} MB ({size / max(len(combined), 1):.1f} bytes/row)")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,108 +1,419 @@
 import os
+import time
+import random
+import hashlib
+import argparse
+import threading
 import requests
-import pandas as pd
 import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
-from dateutil.relativedelta import relativedelta
-
-# 設定
-# このスクリプトがどこから実行されても正しくパスを解決するための設定
-script_dir = os.path.dirname(os.path.abspath(__file__))
-project_root = os.path.dirname(script_dir)
-
-LOG_CSV = os.path.join(project_root, 'download_log.csv')
-BASE_DIR = os.path.join(project_root, 'data', 'downloads')
-
-for src in ['ice', 'ihs', 'solactive']:
-    os.makedirs(os.path.join(BASE_DIR, src), exist_ok=True)
-
-# ログ読み込み／初期化
-if os.path.exists(LOG_CSV):
-    log_df = pd.read_csv(LOG_CSV, parse_dates=['date']).set_index('date')
-else:
-    cols = [
-        'flag_load_ice','flag_unzip_ice',
-        'flag_load_ihs','flag_unzip_ihs',
-        'flag_load_solactive','flag_unzip_solactive'
-    ]
-    log_df = pd.DataFrame(columns=cols)
+from requests.adapters import HTTPAdapter
+
+from pcf_vendors import VENDORS, BASE_DIR, archive_url, archive_path, format_date, publishing_days
+from pcf_state import open_store
+
+# ホストごとの同時リクエスト数の既定値
+DEFAULT_WORKERS_PER_HOST = 4
+
+# ストリーミング書き込み時のチャンクサイズ (bytes)
+CHUNK_SIZE = 1024 * 1024
+
+# 取得済みアーカイブを条件付きGETで再検証する日数の既定値
+DEFAULT_REVALIDATE_DAYS = 7
+
+# タイムアウト (秒): 接続確立と、受信データの間隔を別々に設定する
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 30
+
+# 1リクエストあたりの最大試行回数と、指数バックオフの設定 (秒)
+MAX_ATTEMPTS = 5
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+
+# 再試行の対象とするHTTPステータス
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+
+# 「その日付のファイルは存在しない」とみなすHTTPステータス
+MISSING_STATUSES = {404, 410}
+
+# 未公開 (404・ZIP以外の応答) だった日付を再確認するまでの間隔
+# (日付の古さ[日] の上限, 前回の欠損確認からの経過時間)。
+# 表より古い日付は、一度欠損を確認したら再取得しない。
+NEGATIVE_CACHE_TTL = [
+    (7, timedelta(0)),
+    (30, timedelta(days=1)),
+    (365, timedelta(days=7)),
+]
+
+# 再試行の対象とする通信エラー
+TRANSIENT_ERRORS = (
+    requests.exceptions.ConnectionError,
+    requests.exceptions.Timeout,
+    requests.exceptions.ChunkedEncodingError,
+)
+
+
+def create_session(pool_size):
+    """
+    ベンダーごとに使い回すHTTPセッションを作成する。
+    Keep-Aliveで接続を再利用し、同時リクエスト数ぶんのコネクションをプールする。
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
 
 # ダウンロードヘルパー
-def try_download(url, path, check_zip=False):
-    try:
-        r = requests.get(url, timeout=10)
+def file_sha256(path, chunk_size=CHUNK_SIZE):
+    """既存ファイルのSHA-256をチャンク単位で計算する"""
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+class TransientHTTPError(Exception):
+    """再試行すれば成功する可能性のあるHTTPエラー (5xx, 429 など)"""
+
+
+class RetryBudget:
+    """
+    ベンダーごとの再試行回数の上限。スレッド間で共有する。
+    障害中のホストに対して再試行を繰り返し続けないようにする。
+    """
+
+    def __init__(self, total):
+        self.remaining = total
+        self._lock = threading.Lock()
+
+    def take(self):
+        """再試行を1回分消費する。上限に達していればFalse"""
+        with self._lock:
+            if self.remaining <= 0:
+                return False
+            self.remaining -= 1
+            return True
+
+
+def backoff_delay(attempt):
+    """指数バックオフ + フルジッターによる待ち時間 (秒)"""
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+class PartFile:
+    """
+    ダウンロード途中の一時ファイル (.part)。
+    受信済みのバイト数とSHA-256を保持し、Rangeリクエストによる再開に使う。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.reset()
+
+    def reset(self):
+        """受信内容を破棄して最初からやり直す"""
+        self.size = 0
+        self.sha256 = hashlib.sha256()
+        self.validator = None
+        self.etag = None
+        self.last_modified = None
+        open(self.path, 'wb').close()
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def fetch_to_part(session, url, part, headers, timeout, chunk_size=CHUNK_SIZE):
+    """
+    アーカイブを一時ファイルへチャンク単位で書き込む。書き込みと同時にサイズとSHA-256を計算するため、
+    アーカイブの大きさによらずメモリ使用量は一定。
+    受信途中のデータがあり、サーバーがRangeに対応していれば続きから受信する。
+    戻り値: ('complete' | 'not_modified' (304) | 'missing' (404/410), HTTPステータス)
+    """
+    req_headers = dict(headers)
+    resuming = part.size > 0 and part.validator is not None
+    if resuming:
+        req_headers['Range'] = f'bytes={part.size}-'
+        req_headers['If-Range'] = part.validator
+    with session.get(url, timeout=timeout, stream=True, headers=req_headers) as r:
+        if r.status_code == 304:
+            return 'not_modified', r.status_code
+        if r.status_code in RETRY_STATUSES:
+            raise TransientHTTPError(f"HTTP {r.status_code}")
+        if r.status_code in MISSING_STATUSES:
+            return 'missing', r.status_code
         r.raise_for_status()
-        with open(path, 'wb') as f:
-            f.write(r.content)
-        # ZIP検証
-        if check_zip:
-            if not zipfile.is_zipfile(path):
-                os.remove(path)
-                return 0
-        return 1
+        if resuming and r.status_code == 206 and r.headers.get('Content-Range', '').startswith(f'bytes {part.size}-'):
+            mode = 'ab'
+        else:
+            # Range非対応、または内容が変わっている場合は最初から受信し直す
+            part.reset()
+            mode = 'wb'
+            part.etag = r.headers.get('ETag')
+            part.last_modified = r.headers.get('Last-Modified')
+            # 強いETagを優先し、なければLast-ModifiedをIf-Rangeの検証子に使う
+            if part.etag and not part.etag.startswith('W/'):
+                part.validator = part.etag
+            else:
+                part.validator = part.last_modified
+        with open(part.path, mode) as f:
+            try:
+                for chunk in r.iter_content(chunk_size=chunk_size):
+                    if not chunk:
+                        continue
+                    f.write(chunk)
+                    part.sha256.update(chunk)
+                    part.size += len(chunk)
+            finally:
+                f.flush()
+                os.fsync(f.fileno())
+        return 'complete', r.status_code
+
+
+def finalize_part(part, path, known_sha256=None):
+    """
+    受信を終えた一時ファイルを検証し、保存先へアトミックに置き換える。
+    known_sha256 と内容が一致した場合は保存先を書き換えずに一時ファイルを破棄する。
+    戻り値: {'result': 'saved' | 'unchanged', 'size', 'sha256', 'etag', 'last_modified'}。
+    ZIPとして不正な場合はNone。
+    """
+    digest = part.sha256.hexdigest()
+    info = {'size': part.size, 'sha256': digest, 'etag': part.etag, 'last_modified': part.last_modified}
+    if digest == known_sha256 and os.path.exists(path):
+        part.remove()
+        return {'result': 'unchanged', **info}
+    # ZIP検証 (一時ファイルの End of Central Directory を確認)
+    if not zipfile.is_zipfile(part.path):
+        part.remove()
+        return None
+    os.replace(part.path, path)
+    return {'result': 'saved', **info}
+
+
+def try_download(session, url, path, previous=None, budget=None, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT)):
+    """
+    アーカイブを1件ダウンロードする。
+    previous (状態ストアの既存レコード) がある場合は ETag / Last-Modified による条件付きGETで再検証する。
+    通信エラーや5xxは指数バックオフで再試行し (ベンダーごとの budget を消費)、受信済みの部分は再利用する。
+    戻り値: (成功フラグ, 結果の辞書 または None)
+      結果の 'result' は 'saved' (新規・更新), 'unchanged' (内容が同一), 'not_modified' (304),
+      'missing' (未公開: 'reason' に 'http_404' / 'http_410' などの理由) のいずれか。
+      一時的なエラーで失敗した場合は (0, None)。
+    """
+    headers = {}
+    known_sha256 = None
+    if previous:
+        if previous.get('etag'):
+            headers['If-None-Match'] = previous['etag']
+        if previous.get('last_modified'):
+            headers['If-Modified-Since'] = previous['last_modified']
+        known_sha256 = previous.get('sha256')
+        # 旧ログから取り込んだ行はハッシュを持たないため、手元のファイルから計算する
+        if known_sha256 is None and os.path.exists(path):
+            known_sha256 = file_sha256(path)
+
+    # 以前の実行で残った一時ファイルは検証子が分からないため破棄して作り直す
+    part = PartFile(path + '.part')
+    try:
+        attempt = 0
+        while True:
+            try:
+                outcome, status = fetch_to_part(session, url, part, headers, timeout)
+                break
+            except (TransientHTTPError, *TRANSIENT_ERRORS):
+                attempt += 1
+                if attempt >= MAX_ATTEMPTS or (budget is not None and not budget.take()):
+                    part.remove()
+                    return 0, None
+                time.sleep(backoff_delay(attempt))
+        if outcome == 'not_modified':
+            part.remove()
+            return 1, {'result': 'not_modified'}
+        if outcome == 'missing':
+            part.remove()
+            return 0, {'result': 'missing', 'reason': f'http_{status}'}
+        info = finalize_part(part, path, known_sha256=known_sha256)
+        if info is None:
+            return 0, {'result': 'missing', 'reason': 'not_zip'}
+        return 1, info
     except Exception:
-        # 異常時はファイル削除の可能性を考慮
-        if os.path.exists(path):
-            os.remove(path)
-        return 0
-
-today = datetime.today().date()
-
-# ICE: 過去14日分 (ZIP 形式の検証を有効化)
-start = today - timedelta(days=10)
-for d in pd.date_range(start, today):
-    dt = d.date()
-    ds = dt.strftime('%Y%m%d')
-    if d not in log_df.index:
-        log_df.loc[d] = 0
-    if log_df.at[d, 'flag_load_ice'] == 1:
-        continue
-    url = f"https://inav.ice.com/pcf-download/all/all_pcf_{ds}.zip"
-    out_path = os.path.join(BASE_DIR, 'ice', f"ice_{ds}.zip")
-    flag = try_download(url, out_path, check_zip=True)
-    print(f"Downloading ICE PCF for {ds}: {'Success' if flag else 'Failed'}")
-    log_df.at[d, 'flag_load_ice'] = flag
-    log_df.at[d, 'flag_unzip_ice'] = 0
-    log_df.to_csv(LOG_CSV, index_label='date')
-
-
-# IHS: 過去4ヶ月分
-# start = today - relativedelta(months=4)
-start = today - relativedelta(days=10)
-for d in pd.date_range(start, today):
-    dt = d.date()
-    ds = dt.strftime('%Y%m%d')
-    if d not in log_df.index:
-        log_df.loc[d] = 0
-    if log_df.at[d, 'flag_load_ihs'] == 1:
-        continue
-    url = f"https://api.ebs.ihsmarkit.com/inav/getfile?filename=all_pcf_{ds}.zip"
-    out_path = os.path.join(BASE_DIR, 'ihs', f"ihs_{ds}.zip")
-    flag = try_download(url, out_path)
-    print(f"Downloading IHS PCF for {ds}: {'Success' if flag else 'Failed'}")
-    log_df.at[d, 'flag_load_ihs'] = flag
-    log_df.at[d, 'flag_unzip_ihs'] = 0
-    log_df.to_csv(LOG_CSV, index_label='date')
-
-# Solactive: 過去4年2ヶ月分
-# start = today - relativedelta(years=4, months=2)
-start = today - relativedelta(days=10)
-
-for d in pd.date_range(start, today):
-    dt = d.date()
-    ds = dt.strftime('%Y-%m-%d')
-    if d not in log_df.index:
-        log_df.loc[d] = 0
-    if log_df.at[d, 'flag_load_solactive'] == 1:
-        continue
-    url = f"https://www.solactive.com/downloads/etfservices/tse-pcf/bulk/{ds}.zip"
-    out_path = os.path.join(BASE_DIR, 'solactive', f"solactive_{ds}.zip")
-    flag = try_download(url, out_path)
-    print(f"Downloading Solactive PCF for {ds}: {'Success' if flag else 'Failed'}")
-    log_df.at[d, 'flag_load_solactive'] = flag
-    log_df.at[d, 'flag_unzip_solactive'] = 0
-    log_df.to_csv(LOG_CSV, index_label='date')
-
-
-
-print('Done.')
+        # 異常時は一時ファイルのみ削除し、既存のアーカイブには触れない
+        part.remove()
+        return 0, None
+    except BaseException:
+        part.remove()
+        raise
+
+
+def negative_cache_hit(dt, last_miss_at, today, now):
+    """
+    未公開だった日付を今回の実行で再確認せずにスキップするか判定する。
+    直近の日付は毎回確認し、古い日付ほど間隔を空け、一定以上古い日付は二度と確認しない。
+    """
+    if not last_miss_at:
+        return False
+    age = (today - dt).days
+    for max_age, ttl in NEGATIVE_CACHE_TTL:
+        if age <= max_age:
+            return now - datetime.fromisoformat(last_miss_at) < ttl
+    return True
+
+
+def download_all(store, start_dates, today, workers_per_host=DEFAULT_WORKERS_PER_HOST,
+                 revalidate_days=DEFAULT_REVALIDATE_DAYS, retry_budgets=None,
+                 timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), negative_cache=True):
+    """
+    全ベンダーのダウンロードを並行して実行する。
+    ベンダー(ホスト)ごとにセッションとスレッドプールを持ち、同時リクエスト数を制限する。
+    ベンダーの公開日でない日付 (土日・祝日) は要求せず、未公開だった日付は negative_cache_hit に従ってスキップする。
+    取得済みでも直近 revalidate_days 日以内の日付は条件付きGETで再検証し、
+    内容が変わった場合のみ保存して後続の解析・ロードの状態をリセットする。
+    retry_budgets を省略した場合はベンダー設定の retry_budget を使う。
+    結果は1件ごとに状態ストアへ記録する。
+    """
+    if retry_budgets is None:
+        retry_budgets = {v: VENDORS[v]['retry_budget'] for v in start_dates}
+    revalidate_from = today - timedelta(days=revalidate_days)
+    started_at = datetime.now()
+    skipped = 0
+    sessions = {}
+    executors = {}
+    futures = {}
+    try:
+        for vendor, start in start_dates.items():
+            sessions[vendor] = create_session(workers_per_host)
+            executors[vendor] = ThreadPoolExecutor(max_workers=workers_per_host, thread_name_prefix=vendor)
+            budget = RetryBudget(retry_budgets[vendor])
+            records = store.records(vendor, start, today)
+            for dt in publishing_days(vendor, start, today):
+                record = records.get(dt.isoformat())
+                previous = None
+                if record and record['download_status'] == 1:
+                    if revalidate_days <= 0 or dt < revalidate_from:
+                        continue
+                    previous = record
+                elif record and negative_cache and negative_cache_hit(dt, record['last_miss_at'], today, started_at):
+                    skipped += 1
+                    continue
+                url = archive_url(vendor, dt)
+                out_path = archive_path(vendor, dt)
+                future = executors[vendor].submit(try_download, sessions[vendor], url, out_path, previous, budget, timeout)
+                futures[future] = (vendor, dt, previous is not None)
+
+        if skipped:
+            print(f"Skipped {skipped} date(s) recently confirmed as not published.")
+
+        for future in as_completed(futures):
+            vendor, dt, revalidating = futures[future]
+            flag, info = future.result()
+            now = datetime.now().isoformat(timespec='seconds')
+            label = format_date(vendor, dt)
+            if not flag:
+                missing = info is not None and info['result'] == 'missing'
+                print(f"Downloading {vendor} PCF for {label}: {'Not published' if missing else 'Failed'}")
+                if revalidating:
+                    # 再検証に失敗しても取得済みのアーカイブはそのまま残す
+                    store.update(vendor, dt, checked_at=now)
+                elif missing:
+                    store.record_miss(vendor, dt, info['reason'])
+                else:
+                    store.update(vendor, dt, download_status=0, checked_at=now)
+            elif info['result'] == 'saved':
+                print(f"Downloading {vendor} PCF for {label}: {'Updated' if revalidating else 'Success'} ({info['size']:,} bytes)")
+                store.update(vendor, dt, download_status=1, unzip_status=0, parse_status=0, load_status=0,
+                             size=info['size'], sha256=info['sha256'],
+                             etag=info['etag'], last_modified=info['last_modified'],
+                             checked_at=now, changed_at=now)
+            else:
+                print(f"Downloading {vendor} PCF for {label}: Unchanged")
+                fields = {'checked_at': now}
+                if info['result'] == 'unchanged':
+                    fields.update(size=info['size'], sha256=info['sha256'],
+                                  etag=info['etag'], last_modified=info['last_modified'])
+                store.update(vendor, dt, **fields)
+    finally:
+        for executor in executors.values():
+            executor.shutdown(wait=True, cancel_futures=True)
+        for session in sessions.values():
+            session.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Download ETF PCF archives from all vendors.")
+    parser.add_argument(
+        "--workers-per-host",
+        type=int,
+        default=DEFAULT_WORKERS_PER_HOST,
+        help=f"Maximum number of in-flight requests per vendor host (default: {DEFAULT_WORKERS_PER_HOST})."
+    )
+    parser.add_argument(
+        "--revalidate-days",
+        type=int,
+        default=DEFAULT_REVALIDATE_DAYS,
+        help=f"Re-check already downloaded archives of the last N days with conditional GETs (default: {DEFAULT_REVALIDATE_DAYS}, 0 disables)."
+    )
+    parser.add_argument(
+        "--connect-timeout",
+        type=float,
+        default=CONNECT_TIMEOUT,
+        help=f"Connect timeout in seconds (default: {CONNECT_TIMEOUT})."
+    )
+    parser.add_argument(
+        "--read-timeout",
+        type=float,
+        default=READ_TIMEOUT,
+        help=f"Read timeout in seconds between received bytes (default: {READ_TIMEOUT})."
+    )
+    parser.add_argument(
+        "--retry-budget",
+        type=int,
+        default=None,
+        help="Total number of retries allowed per vendor in one run (default: per-vendor setting)."
+    )
+    parser.add_argument(
+        "--no-negative-cache",
+        action='store_true',
+        help="Re-request dates that were recently confirmed as not published."
+    )
+    parser.add_argument(
+        "--backfill",
+        action='store_true',
+        help="Use the full history window of each vendor instead of the daily lookback."
+    )
+    parser.add_argument(
+        "--vendors",
+        nargs='+',
+        choices=list(VENDORS),
+        default=list(VENDORS),
+        help="Vendors to download (default: all)."
+    )
+    args = parser.parse_args()
+
+    for src in VENDORS:
+        os.makedirs(os.path.join(BASE_DIR, src), exist_ok=True)
+
+    today = datetime.today().date()
+    window = 'backfill' if args.backfill else 'lookback'
+    start_dates = {v: today - VENDORS[v][window] for v in args.vendors}
+
+    retry_budgets = {v: VENDORS[v]['retry_budget'] if args.retry_budget is None else args.retry_budget
+                     for v in args.vendors}
+
+    with open_store() as store:
+        download_all(store, start_dates, today, workers_per_host=args.workers_per_host,
+                     revalidate_days=args.revalidate_days, retry_budgets=retry_budgets,
+                     timeout=(args.connect_timeout, args.read_timeout),
+                     negative_cache=not args.no_negative_cache)
+        # 互換性のため、旧形式のログも実行終了時に1回だけ書き出す
+        store.export_legacy_log()
+
+    print('Done.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,476 @@
+import os
+import sys
+import time
+import logging
+import sqlite3
+import argparse
+from datetime import datetime
+
+import pandas as pd
+
+from pcf_schema import normalize_base, normalize_holdings, restore_types, BASE_COLUMNS, HOLDING_COLUMNS
+from pcf_state import open_store
+from pcf_dedup import resolve_duplicates, parse_priority, DEFAULT_PRIORITY
+
+# ロギング設定
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# 解析結果を create_table.sql のテーブルに一括で登録する。
+# 1. 解析結果を正規化し、ステージングテーブルに大きなバッチで一括挿入する
+# 2. 外部キーの順 (MASTER_FUND -> MASTER_STOCK -> HISTORY_FUND_DAILY -> HOLDING_DETAIL) に、
+#    ステージングテーブルから集合演算 (MSSQL: MERGE, SQLite: INSERT ... ON CONFLICT) で反映する
+# 同じ (Fund_Date, source) を何度登録しても結果は変わらない。
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(script_dir)
+
+SQLITE_DB = os.path.join(project_root, 'data', 'pcf.db')
+
+# ステージングテーブルへの1回の挿入で送る行数
+DEFAULT_BATCH_SIZE = 10000
+
+STAGING_COLUMNS = {
+    'STG_FUND_DAILY': BASE_COLUMNS,
+    'STG_HOLDING': HOLDING_COLUMNS,
+}
+
+# create_table.sql と同じテーブル (SQLite版)
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS MASTER_FUND (
+    ETF_Code TEXT NOT NULL PRIMARY KEY,
+    ETF_Name TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS MASTER_STOCK (
+    ISIN       TEXT NOT NULL PRIMARY KEY,
+    Local_Code TEXT NULL,
+    Stock_Name TEXT NOT NULL,
+    Exchange   TEXT NULL,
+    Currency   TEXT NULL
+);
+CREATE TABLE IF NOT EXISTS HISTORY_FUND_DAILY (
+    Fund_Date          TEXT NOT NULL,
+    ETF_Code           TEXT NOT NULL REFERENCES MASTER_FUND (ETF_Code),
+    Cash_Component     NUMERIC NULL,
+    Shares_Outstanding NUMERIC NULL,
+    PRIMARY KEY (Fund_Date, ETF_Code)
+);
+CREATE TABLE IF NOT EXISTS HOLDING_DETAIL (
+    Fund_Date     TEXT NOT NULL,
+    ETF_Code      TEXT NOT NULL,
+    ISIN          TEXT NOT NULL REFERENCES MASTER_STOCK (ISIN),
+    Shares_Amount NUMERIC NULL,
+    Stock_Price   NUMERIC NULL,
+    PRIMARY KEY (Fund_Date, ETF_Code, ISIN),
+    FOREIGN KEY (Fund_Date, ETF_Code) REFERENCES HISTORY_FUND_DAILY (Fund_Date, ETF_Code)
+);
+"""
+
+SQLITE_STAGING = """
+CREATE TEMP TABLE IF NOT EXISTS STG_FUND_DAILY (
+    Fund_Date TEXT, ETF_Code TEXT, ETF_Name TEXT, Cash_Component REAL, Shares_Outstanding REAL, source TEXT
+);
+CREATE TEMP TABLE IF NOT EXISTS STG_HOLDING (
+    Fund_Date TEXT, ETF_Code TEXT, ISIN TEXT, Local_Code TEXT, Stock_Name TEXT, Exchange TEXT, Currency TEXT,
+    Shares_Amount REAL, Stock_Price REAL, source TEXT
+);
+CREATE UNIQUE INDEX IF NOT EXISTS temp.IX_STG_FUND_DAILY ON STG_FUND_DAILY (Fund_Date, ETF_Code);
+CREATE UNIQUE INDEX IF NOT EXISTS temp.IX_STG_HOLDING ON STG_HOLDING (Fund_Date, ETF_Code, ISIN);
+DELETE FROM STG_FUND_DAILY;
+DELETE FROM STG_HOLDING;
+"""
+
+# ステージングテーブルから本テーブルへ反映するSQL (外部キーの順に実行する)
+SQLITE_MERGE = [
+    ('MASTER_FUND', """
+        INSERT INTO MASTER_FUND (ETF_Code, ETF_Name)
+        SELECT ETF_Code, MAX(ETF_Name) FROM STG_FUND_DAILY WHERE ETF_Name IS NOT NULL GROUP BY ETF_Code
+        ON CONFLICT (ETF_Code) DO UPDATE SET ETF_Name = excluded.ETF_Name
+        WHERE ETF_Name <> excluded.ETF_Name
+    """),
+    ('MASTER_STOCK', """
+        INSERT INTO MASTER_STOCK (ISIN, Local_Code, Stock_Name, Exchange, Currency)
+        SELECT ISIN, MAX(Local_Code), COALESCE(MAX(Stock_Name), ISIN), MAX(Exchange), MAX(Currency)
+        FROM STG_HOLDING GROUP BY ISIN
+        ON CONFLICT (ISIN) DO UPDATE SET
+            Local_Code = COALESCE(excluded.Local_Code, Local_Code),
+            Stock_Name = excluded.Stock_Name,
+            Exchange = COALESCE(excluded.Exchange, Exchange),
+            Currency = COALESCE(excluded.Currency, Currency)
+    """),
+    ('HISTORY_FUND_DAILY', """
+        INSERT INTO HISTORY_FUND_DAILY (Fund_Date, ETF_Code, Cash_Component, Shares_Outstanding)
+        SELECT s.Fund_Date, s.ETF_Code, s.Cash_Component, s.Shares_Outstanding
+        FROM STG_FUND_DAILY s JOIN MASTER_FUND m ON m.ETF_Code = s.ETF_Code
+        WHERE true
+        ON CONFLICT (Fund_Date, ETF_Code) DO UPDATE SET
+            Cash_Component = excluded.Cash_Component,
+            Shares_Outstanding = excluded.Shares_Outstanding
+    """),
+    # 再登録時、ファイルからなくなった銘柄を削除する
+    ('HOLDING_DETAIL', """
+        DELETE FROM HOLDING_DETAIL
+        WHERE EXISTS (
+            SELECT 1 FROM STG_FUND_DAILY f
+            WHERE f.Fund_Date = HOLDING_DETAIL.Fund_Date AND f.ETF_Code = HOLDING_DETAIL.ETF_Code
+        ) AND NOT EXISTS (
+            SELECT 1 FROM STG_HOLDING s
+            WHERE s.Fund_Date = HOLDING_DETAIL.Fund_Date AND s.ETF_Code = HOLDING_DETAIL.ETF_Code AND s.ISIN = HOLDING_DETAIL.ISIN
+        )
+    """),
+    ('HOLDING_DETAIL', """
+        INSERT INTO HOLDING_DETAIL (Fund_Date, ETF_Code, ISIN, Shares_Amount, Stock_Price)
+        SELECT s.Fund_Date, s.ETF_Code, s.ISIN, s.Shares_Amount, s.Stock_Price
+        FROM STG_HOLDING s JOIN HISTORY_FUND_DAILY d ON d.Fund_Date = s.Fund_Date AND d.ETF_Code = s.ETF_Code
+        WHERE true
+        ON CONFLICT (Fund_Date, ETF_Code, ISIN) DO UPDATE SET
+            Shares_Amount = excluded.Shares_Amount,
+            Stock_Price = excluded.Stock_Price
+    """),
+]
+
+MSSQL_STAGING = """
+IF OBJECT_ID('tempdb..#STG_FUND_DAILY') IS NOT NULL DROP TABLE #STG_FUND_DAILY;
+IF OBJECT_ID('tempdb..#STG_HOLDING') IS NOT NULL DROP TABLE #STG_HOLDING;
+CREATE TABLE #STG_FUND_DAILY (
+    Fund_Date DATE NOT NULL, ETF_Code VARCHAR(20) NOT NULL, ETF_Name NVARCHAR(200) NULL,
+    Cash_Component DECIMAL(18,2) NULL, Shares_Outstanding DECIMAL(18,2) NULL, source VARCHAR(20) NOT NULL,
+    PRIMARY KEY (Fund_Date, ETF_Code) WITH (IGNORE_DUP_KEY = ON)
+);
+CREATE TABLE #STG_HOLDING (
+    Fund_Date DATE NOT NULL, ETF_Code VARCHAR(20) NOT NULL, ISIN VARCHAR(12) NOT NULL, Local_Code VARCHAR(20) NULL,
+    Stock_Name NVARCHAR(200) NULL, Exchange VARCHAR(50) NULL, Currency VARCHAR(10) NULL,
+    Shares_Amount DECIMAL(18,4) NULL, Stock_Price DECIMAL(18,4) NULL, source VARCHAR(20) NOT NULL,
+    PRIMARY KEY (Fund_Date, ETF_Code, ISIN) WITH (IGNORE_DUP_KEY = ON)
+);
+"""
+
+MSSQL_MERGE = [
+    ('MASTER_FUND', """
+        MERGE MASTER_FUND AS t
+        USING (SELECT ETF_Code, MAX(ETF_Name) AS ETF_Name FROM #STG_FUND_DAILY WHERE ETF_Name IS NOT NULL GROUP BY ETF_Code) AS s
+        ON t.ETF_Code = s.ETF_Code
+        WHEN MATCHED AND t.ETF_Name <> s.ETF_Name THEN UPDATE SET ETF_Name = s.ETF_Name
+        WHEN NOT MATCHED THEN INSERT (ETF_Code, ETF_Name) VALUES (s.ETF_Code, s.ETF_Name);
+    """),
+    ('MASTER_STOCK', """
+        MERGE MASTER_STOCK AS t
+        USING (
+            SELECT ISIN, MAX(Local_Code) AS Local_Code, COALESCE(MAX(Stock_Name), ISIN) AS Stock_Name,
+                   MAX(Exchange) AS Exchange, MAX(Currency) AS Currency
+            FROM #STG_HOLDING GROUP BY ISIN
+        ) AS s
+        ON t.ISIN = s.ISIN
+        WHEN MATCHED THEN UPDATE SET
+            Local_Code = COALESCE(s.Local_Code, t.Local_Code),
+            Stock_Name = s.Stock_Name,
+            Exchange = COALESCE(s.Exchange, t.Exchange),
+            Currency = COALESCE(s.Currency, t.Currency)
+        WHEN NOT MATCHED THEN INSERT (ISIN, Local_Code, Stock_Name, Exchange, Currency)
+            VALUES (s.ISIN, s.Local_Code, s.Stock_Name, s.Exchange, s.Currency);
+    """),
+    ('HISTORY_FUND_DAILY', """
+        MERGE HISTORY_FUND_DAILY AS t
+        USING (
+            SELECT s.Fund_Date, s.ETF_Code, s.Cash_Component, s.Shares_Outstanding
+            FROM #STG_FUND_DAILY s JOIN MASTER_FUND m ON m.ETF_Code = s.ETF_Code
+        ) AS s
+        ON t.Fund_Date = s.Fund_Date AND t.ETF_Code = s.ETF_Code
+        WHEN MATCHED THEN UPDATE SET Cash_Component = s.Cash_Component, Shares_Outstanding = s.Shares_Outstanding
+        WHEN NOT MATCHED THEN INSERT (Fund_Date, ETF_Code, Cash_Component, Shares_Outstanding)
+            VALUES (s.Fund_Date, s.ETF_Code, s.Cash_Component, s.Shares_Outstanding);
+    """),
+    # 登録対象の (Fund_Date, ETF_Code) に限定して、ファイルからなくなった銘柄を削除する
+    ('HOLDING_DETAIL', """
+        WITH t AS (
+            SELECT h.* FROM HOLDING_DETAIL h
+            WHERE EXISTS (SELECT 1 FROM #STG_FUND_DAILY f WHERE f.Fund_Date = h.Fund_Date AND f.ETF_Code = h.ETF_Code)
+        )
+        MERGE t
+        USING (
+            SELECT s.Fund_Date, s.ETF_Code, s.ISIN, s.Shares_Amount, s.Stock_Price
+            FROM #STG_HOLDING s JOIN HISTORY_FUND_DAILY d ON d.Fund_Date = s.Fund_Date AND d.ETF_Code = s.ETF_Code
+        ) AS s
+        ON t.Fund_Date = s.Fund_Date AND t.ETF_Code = s.ETF_Code AND t.ISIN = s.ISIN
+        WHEN MATCHED THEN UPDATE SET Shares_Amount = s.Shares_Amount, Stock_Price = s.Stock_Price
+        WHEN NOT MATCHED BY TARGET THEN INSERT (Fund_Date, ETF_Code, ISIN, Shares_Amount, Stock_Price)
+            VALUES (s.Fund_Date, s.ETF_Code, s.ISIN, s.Shares_Amount, s.Stock_Price)
+        WHEN NOT MATCHED BY SOURCE THEN DELETE;
+    """),
+]
+
+
+def prepare_frames(base, holdings, priority=None):
+    """
+    正規化済みの解析結果を主キーで重複のない形にする。
+    複数ベンダーが同じETFを公開した場合は pcf_dedup.resolve_duplicates で優先順位 priority の
+    ベンダーのものだけを残す (基本情報と保有銘柄でベンダーを混ぜない)。
+    それ以外に同じ主キーの行が複数ある場合は先に出現した行を使う。
+    ISINのない保有銘柄 (先物・現金など) は HOLDING_DETAIL の主キーを満たさないため登録しない。
+    """
+    if base is None:
+        base = pd.DataFrame(columns=BASE_COLUMNS)
+    base, holdings, _ = resolve_duplicates(base, holdings, priority)
+    base = base.drop_duplicates(['Fund_Date', 'ETF_Code'])
+    if holdings is None or holdings.empty:
+        return base, pd.DataFrame(columns=HOLDING_COLUMNS)
+    skipped = holdings['ISIN'].isna()
+    if skipped.any():
+        logging.info(f"Skipping {int(skipped.sum())} holdings rows without an ISIN")
+    holdings = holdings[~skipped].drop_duplicates(['Fund_Date', 'ETF_Code', 'ISIN'])
+    return base, holdings
+
+
+def _rows(df, columns, date_as_text):
+    """DataFrameをDBに渡すタプルのリストにする (欠損値はNone)"""
+    df = df[columns].copy()
+    df['Fund_Date'] = df['Fund_Date'].dt.strftime('%Y-%m-%d') if date_as_text else df['Fund_Date'].dt.date
+    return list(df.astype(object).where(df.notna(), None).itertuples(index=False, name=None))
+
+
+class SQLiteLoader:
+    """SQLiteに登録する (ローカルでの検証・ベンチマーク用)"""
+
+    date_as_text = True
+
+    def __init__(self, path=SQLITE_DB):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.path = path
+        self._conn = sqlite3.connect(path, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA foreign_keys=ON')
+        self._conn.executescript(SQLITE_SCHEMA)
+
+    def close(self):
+        self._conn.close()
+
+    def begin(self):
+        # executescript は実行前にトランザクションを確定させるため、BEGIN より先に実行する
+        self._conn.executescript(SQLITE_STAGING)
+        self._conn.execute('BEGIN IMMEDIATE')
+
+    def commit(self):
+        self._conn.execute('COMMIT')
+
+    def rollback(self):
+        self._conn.execute('ROLLBACK')
+
+    def bulk_insert(self, table, columns, rows):
+        placeholders = ', '.join('?' for _ in columns)
+        # 主キーが重複する行は先に挿入した行を残す
+        self._conn.executemany(f"INSERT OR IGNORE INTO {table} ({', '.join(columns)}) VALUES ({placeholders})", rows)
+
+    def merge(self):
+        """ステージングテーブルの内容を本テーブルに反映し、テーブルごとの変更行数を返す"""
+        counts = {}
+        for table, sql in SQLITE_MERGE:
+            counts[table] = counts.get(table, 0) + self._conn.execute(sql).rowcount
+        return counts
+
+
+class MSSQLLoader:
+    """SQL Server に登録する (pyodbc の fast_executemany でステージングテーブルに一括挿入する)"""
+
+    date_as_text = False
+
+    def __init__(self, connection_string=None):
+        from sqlalchemy import create_engine
+        if connection_string is None:
+            sys.path.append(project_root)
+            from config import CONNECTION_STRING
+            connection_string = CONNECTION_STRING
+        self._engine = create_engine(connection_string, fast_executemany=True)
+        # 一時テーブル (#STG_*) を使うため、同じ接続を使い続ける
+        self._conn = self._engine.raw_connection()
+
+    def close(self):
+        self._conn.close()
+        self._engine.dispose()
+
+    def begin(self):
+        self._cursor = self._conn.cursor()
+        self._cursor.fast_executemany = True
+        self._cursor.execute(MSSQL_STAGING)
+
+    def commit(self):
+        self._conn.commit()
+        self._cursor.close()
+
+    def rollback(self):
+        self._conn.rollback()
+        self._cursor.close()
+
+    def bulk_insert(self, table, columns, rows):
+        # 主キーが重複する行は IGNORE_DUP_KEY により先に挿入した行を残す
+        placeholders = ', '.join('?' for _ in columns)
+        self._cursor.executemany(f"INSERT INTO #{table} ({', '.join(columns)}) VALUES ({placeholders})", rows)
+
+    def merge(self):
+        counts = {}
+        for table, sql in MSSQL_MERGE:
+            self._cursor.execute(sql)
+            counts[table] = counts.get(table, 0) + self._cursor.rowcount
+        return counts
+
+
+def stage_frames(loader, base, holdings, batch_size=DEFAULT_BATCH_SIZE, priority=None):
+    """
+    正規化済みの解析結果をステージングテーブルに追加する (loader.begin() の後に何回でも呼べる)。
+    主キーが重複する行は先に追加した行が残る。戻り値: (基本情報の行数, 保有銘柄の行数)
+    """
+    base, holdings = prepare_frames(base, holdings, priority)
+    for table, df in [('STG_FUND_DAILY', base), ('STG_HOLDING', holdings)]:
+        columns = STAGING_COLUMNS[table]
+        for i in range(0, len(df), batch_size):
+            loader.bulk_insert(table, columns, _rows(df.iloc[i:i + batch_size], columns, loader.date_as_text))
+    return len(base), len(holdings)
+
+
+def load_frames(loader, base, holdings, batch_size=DEFAULT_BATCH_SIZE, priority=None):
+    """
+    正規化済みの解析結果を1トランザクションで登録する。
+    戻り値: 件数と所要時間の辞書
+    """
+    started = time.perf_counter()
+    loader.begin()
+    try:
+        base_rows, holdings_rows = stage_frames(loader, base, holdings, batch_size, priority)
+        stats = {'base_rows': base_rows, 'holdings_rows': holdings_rows}
+        stats['staging_seconds'] = time.perf_counter() - started
+        stats['merged'] = loader.merge()
+        loader.commit()
+    except BaseException:
+        loader.rollback()
+        raise
+    stats['seconds'] = time.perf_counter() - started
+    return stats
+
+
+def read_parsed_csv(target_date_str, data_dir='data', valuation=False):
+    """
+    parse_pcfs_by_date.py が出力したCSVを読み、正規化した (base, holdings) を返す
+    valuation: True の場合は基本情報に pcf_schema.BASE_VALUATION_COLUMNS、保有銘柄に VALUATION_COLUMNS も付ける
+    parse_pcfs_by_date.py の出力がなく、pcf_stream.py の CSV (正規化済みの列) がある場合はそちらを読む
+    """
+    base_path = os.path.join(data_dir, f"base_info_{target_date_str}.csv")
+    holdings_path = os.path.join(data_dir, f"holdings_{target_date_str}.csv")
+    if not os.path.exists(base_path):
+        return read_streamed_csv(target_date_str, data_dir, valuation)
+    base = normalize_base(pd.read_csv(base_path, dtype=str, encoding='utf-8-sig'), default_date=target_date_str,
+                          valuation=valuation)
+    holdings = None
+    if os.path.exists(holdings_path):
+        holdings = normalize_holdings(pd.read_csv(holdings_path, dtype=str, encoding='utf-8-sig'), base, valuation)
+    return base, holdings
+
+
+def read_streamed_csv(target_date_str, data_dir='data', valuation=False):
+    """pcf_stream.py の CsvSink が出力したCSV (fund_daily_<日付>.csv, holding_detail_<日付>.csv) を読む"""
+    from pcf_stream import CsvSink
+    paths = {table: os.path.join(data_dir, f"{name}_{target_date_str}.csv") for table, name in CsvSink.FILE_NAMES.items()}
+    if not os.path.exists(paths['base_info']):
+        return None, None
+    frames = {}
+    for table, path in paths.items():
+        if os.path.exists(path):
+            frames[table] = restore_types(pd.read_csv(path, dtype=str, encoding='utf-8-sig'), table, valuation)
+    return frames['base_info'], frames.get('holdings')
+
+
+def read_parsed_columnar(fund_date_str, fmt, data_dir='data'):
+    """列指向ストア (data/columnar) から Fund_Date が指定日の解析結果を読む"""
+    from pcf_columnar import read_base_info, read_holdings
+    columnar_dir = os.path.join(data_dir, 'columnar')
+    base = read_base_info(fund_date_str, fund_date_str, fmt=fmt, base_dir=columnar_dir)
+    if base.empty:
+        return None, None
+    holdings = read_holdings(fund_date_str, fund_date_str, fmt=fmt, base_dir=columnar_dir)
+    return base, holdings
+
+
+def load_date(loader, target_date_str, input_format='csv', data_dir='data', batch_size=DEFAULT_BATCH_SIZE, store=None,
+              priority=None, skip_quarantined=False, resolve=False):
+    """
+    1日分の解析結果を登録する。
+    input_format: 'csv' (解析日のCSV) または 'parquet' / 'arrow' (Fund_Date が指定日の列指向ストア)
+    store: 状態ストア。CSVから登録した場合、登録したベンダーの load_status を 1 にする
+    priority: 複数ベンダーが同じETFを公開した場合のベンダーの優先順位
+    skip_quarantined: pcf_validate で検証し、隔離した行 (ISINの誤り・評価額の不一致・AUM と一致しないETF) を登録しない
+    resolve: pcf_securities で銘柄名を名寄せし、ISINごとに1つの銘柄名で MASTER_STOCK に登録する
+             (銘柄名のみ置き換える。ISINのない行は銘柄名から ISIN が推定できても登録しない)
+    """
+    if input_format == 'csv':
+        base, holdings = read_parsed_csv(target_date_str, data_dir, valuation=skip_quarantined)
+    else:
+        base, holdings = read_parsed_columnar(target_date_str, input_format, data_dir)
+    if base is None:
+        logging.warning(f"No parsed data found for {target_date_str}")
+        return None
+    if skip_quarantined:
+        from pcf_validate import validate, summarize, exclude_quarantined
+        report, quarantine = validate(base, holdings, label=target_date_str)
+        summarize(report, quarantine, target_date_str)
+        base, holdings = exclude_quarantined(base, holdings, report, quarantine)
+    if resolve and holdings is not None:
+        from pcf_securities import resolve_securities
+        holdings = resolve_securities(holdings, target_date_str, priority=priority)
+
+    stats = load_frames(loader, base, holdings, batch_size, priority)
+    rate = stats['holdings_rows'] / stats['seconds'] if stats['seconds'] > 0 else float('inf')
+    logging.info(
+        f"Loaded {target_date_str}: {stats['base_rows']} funds, {stats['holdings_rows']} holdings "
+        f"in {stats['seconds']:.2f}s (staging {stats['staging_seconds']:.2f}s, {rate:,.0f} holdings rows/sec)"
+    )
+    logging.info(f"  Rows affected: {stats['merged']}")
+
+    if store is not None and input_format == 'csv':
+        with store.transaction():
+            for vendor in sorted(base['source'].dropna().unique()):
+                store.update(vendor, target_date_str, load_status=1)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-load parsed PCF data into the create_table.sql schema.")
+    parser.add_argument("dates", nargs='+', help="Dates to load (YYYY-MM-DD).")
+    parser.add_argument("--backend", choices=['mssql', 'sqlite'], default='mssql',
+                        help="Target database: SQL Server via config.py, or a local SQLite file (default: mssql).")
+    parser.add_argument("--sqlite-path", default=SQLITE_DB, help=f"SQLite database file (default: {SQLITE_DB}).")
+    parser.add_argument("--input", choices=['csv', 'parquet', 'arrow'], default='csv',
+                        help="Read the CSV output of parse_pcfs_by_date.py for each parse date, or the columnar store "
+                             "for each Fund_Date (default: csv).")
+    parser.add_argument("--data-dir", default='data', help="Directory containing the parsed output (default: data).")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                        help=f"Rows per bulk insert into the staging tables (default: {DEFAULT_BATCH_SIZE}).")
+    parser.add_argument("--vendor-priority",
+                        help=f"Comma-separated vendor priority for ETFs published by more than one vendor "
+                             f"(default: {','.join(DEFAULT_PRIORITY)}).")
+    parser.add_argument("--skip-quarantined", action='store_true',
+                        help="Validate each date first and do not load rows that fail validation (see pcf_validate.py).")
+    parser.add_argument("--resolve", action='store_true',
+                        help="Load one resolved security name per ISIN into MASTER_STOCK instead of the names as published "
+                             "(see pcf_securities.py).")
+    args = parser.parse_args()
+
+    for d in args.dates:
+        datetime.strptime(d, '%Y-%m-%d')
+
+    loader = SQLiteLoader(args.sqlite_path) if args.backend == 'sqlite' else MSSQLLoader()
+    store = open_store()
+    try:
+        total_rows = 0
+        total_seconds = 0.0
+        for d in args.dates:
+            stats = load_date(loader, d, args.input, args.data_dir, args.batch_size, store,
+                              parse_priority(args.vendor_priority), args.skip_quarantined, args.resolve)
+            if stats:
+                total_rows += stats['holdings_rows']
+                total_seconds += stats['seconds']
+        if len(args.dates) > 1 and total_seconds > 0:
+            logging.info(f"Total: {total_rows} holdings rows in {total_seconds:.2f}s ({total_rows / total_seconds:,.0f} rows/sec)")
+    finally:
+        loader.close()
+        store.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -2,6 +2,8 @@ import pandas as pd
 import os
 import logging
 
+from pcf_encoding import resolve_file_encoding
+
 # ロギング設定
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -128,10 +130,9 @@ def test_parsing():
             for row in dummy_data:
                 f.write(','.join(map(str, row)) + '\n')
                 
-    # 複数のエンコーディングを試す
-    encodings_to_try = ['cp932', 'utf-8', 'sjis']
+    # 先頭のバイト列から判定したエンコーディングを最初に試す
     parsed_data = None
-    for enc in encodings_to_try:
+    for enc in resolve_file_encoding(test_file):
         try:
             parsed_data = parse_pcf_file(test_file, encoding=enc)
             if parsed_data and not parsed_data['base_info'].empty:
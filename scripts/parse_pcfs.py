@@ -8,6 +8,8 @@ import re
 from datetime import datetime
 import csv
 
+from pcf_encoding import resolve_file_encoding
+
 path = r"C:\Users\yota-\Desktop\study\data\JPX\ETF保有銘柄\data\1306tsepcf_Dec042025.csv"
 
 
@@ -112,10 +114,9 @@ def main():
                         if file.lower().endswith('.csv'):
                             csv_path = os.path.join(root, file)
                             
-                            # 複数のエンコーディングを試す
-                            encodings_to_try = ['cp932', 'utf-8', 'sjis']
+                            # 先頭のバイト列から判定したエンコーディングを最初に試す
                             df_parsed = None
-                            for enc in encodings_to_try:
+                            for enc in resolve_file_encoding(csv_path):
                                 # parse_csvはDataFrameを返す（またはNone）
                                 df_parsed = parse_csv(csv_path, encoding=enc)
                                 if df_parsed is not None and not df_parsed.empty:
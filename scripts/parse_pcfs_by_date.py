@@ -3,78 +3,125 @@ import pandas as pd
 import os
 import logging
 import argparse
-import glob
-from zipfile import ZipFile
 from datetime import datetime
 import io
+import glob
+from concurrent.futures import ProcessPoolExecutor
+
+from pcf_blobstore import open_archive, archive_exists, archive_mtime
+from pcf_encoding import EncodingResolver
+from pcf_layout import default_registry, content_bounds
+from pcf_manifest import ParseCache, read_manifest, diff_manifest
+from pcf_vendors import archive_path
 
 # ロギング設定
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-def find_header_row_and_data(file_content_lines, key_column):
+# 解析処理のバージョン。解析結果が変わる修正をしたら上げる (解析結果のキャッシュが使われなくなる)
+PARSER_VERSION = 1
+
+
+def _line_fields(line):
+    """1行 (bytes) をカンマで分割し、各要素の空白を除去したリストを返す"""
+    return [col.strip() for col in line.strip().split(b',')]
+
+
+def split_pcf_sections(raw, encoding):
     """
-    ファイル内容（行のリスト）から、指定されたキーカラムを含むヘッダー行の
-    行番号と、それ以降のデータ行を特定する。
+    PCF CSVファイルの生のバイト列を1回だけ走査し、ETF基本情報ブロックと保有銘柄ブロックの位置を特定する。
+    'ETF Code' を含む最初の行とその次の1行を基本情報、'Code' を含む最初の行以降を保有銘柄とみなす。
+    両方のヘッダーが見つかった時点で走査を打ち切るため、保有銘柄の行は一切分割しない。
+    戻り値: (基本情報の(開始, 終了)またはNone, 保有銘柄の(開始, 終了)またはNone)
     """
-    header_row_index = -1
-    for i, line in enumerate(file_content_lines):
-        # BOMや空白文字を除去してから比較
-        cleaned_line = line.strip()
-        # カンマ区切りで列を評価
-        columns = [col.strip() for col in cleaned_line.split(',')]
-        if key_column in columns:
-            header_row_index = i
+    # 前後の空白を除いた範囲 (BOMはUTF-8として読む場合のみ除去)
+    start, end = content_bounds(raw, encoding)
+
+    base_span = None
+    base_header_start = -1
+    holdings_span = None
+    pos = start
+    while pos < end:
+        newline = raw.find(b'\n', pos, end)
+        line_end = end if newline == -1 else newline
+        if base_header_start != -1 and base_span is None:
+            # 基本情報はヘッダーの次の1行のみと仮定
+            base_span = (base_header_start, line_end)
+        fields = _line_fields(raw[pos:line_end])
+        if base_header_start == -1 and b'ETF Code' in fields:
+            base_header_start = pos
+        if holdings_span is None and b'Code' in fields:
+            holdings_span = (pos, end)
+        if (base_span is not None and holdings_span is not None) or newline == -1:
             break
-    
-    if header_row_index != -1:
-        # ヘッダー行以降のデータを取得
-        data_lines = file_content_lines[header_row_index:]
-        return header_row_index, data_lines
-    
-    return -1, []
+        pos = line_end + 1
+    if base_header_start != -1 and base_span is None:
+        # ヘッダーが最終行の場合
+        base_span = (base_header_start, end)
+    return base_span, holdings_span
 
 
-def parse_pcf_file(csv_content, file_name_for_log=""):
+def _check_decodable_outside(raw, spans, encoding):
     """
-    1つのPCF CSVファイルの中身（文字列）を解析し、ETF基本情報と保有銘柄情報を抽出する。
+    各ブロックに含まれないバイト (ヘッダーより前の行など) がデコードできるか確認する。
+    ブロック自体は読み込み時にデコードされるため、ファイル全体がちょうど1回ずつデコードされる。
+    """
+    pos = 0
+    for span_start, span_end in sorted(spans):
+        if span_start > pos:
+            raw[pos:span_start].decode(encoding)
+        pos = max(pos, span_end)
+    raw[pos:].decode(encoding)
+
+
+def _read_section(raw, span, encoding):
+    """バイト列の一部をCエンジンで読み込む"""
+    return pd.read_csv(
+        io.BytesIO(raw[span[0]:span[1]]),
+        sep=',',
+        encoding=encoding,
+        engine='c',
+    )
+
+
+def _drop_empty(df, rows=False):
+    """
+    すべての値がNaNの列 (rows=Trueの場合は行も) を削除する。
+    isna を1回だけ計算して列・行の両方に使うため、dropna を2回呼ぶより軽い。
+    """
+    mask = df.isna().to_numpy()
+    keep_cols = ~mask.all(axis=0)
+    if not keep_cols.all():
+        df = df.iloc[:, keep_cols]
+        mask = mask[:, keep_cols]
+    if rows:
+        empty_rows = mask.all(axis=1)
+        if empty_rows.any():
+            df = df[~empty_rows]
+    return df
+
+
+def parse_pcf_file(file_bytes, encoding, file_name_for_log=""):
+    """
+    1つのPCF CSVファイルの中身（バイト列）を指定のエンコーディングで解析し、ETF基本情報と保有銘柄情報を抽出する。
     ファイルは2つのデータフレームを持つ可能性がある。
+    デコードできない場合は UnicodeDecodeError を送出する。
     """
     try:
-        # --- 全エンコーディング共通の前処理 ---
-        # 改行で分割して行のリストにする (splitlines()が最も堅牢)
-        lines = csv_content.strip().splitlines()
-        
-        # BOM(Byte Order Mark)の除去
-        if lines:
-            lines[0] = lines[0].lstrip('\ufeff')
+        # 既知のレイアウトは登録済みの行位置を使い、未知のものだけ走査する
+        spans = default_registry().sections(file_bytes, encoding, file_name_for_log)
+        base_span, holdings_span = spans if spans is not None else split_pcf_sections(file_bytes, encoding)
+        _check_decodable_outside(file_bytes, [span for span in (base_span, holdings_span) if span], encoding)
 
-        # 1. ETF基本情報の検索と解析
-        base_header_index, base_data_lines = find_header_row_and_data(lines, 'ETF Code')
+        # 1. ETF基本情報の解析
         df_base_info = pd.DataFrame()
-        
-        if base_header_index != -1:
-            # 基本情報はヘッダーの次の1行のみと仮定
-            # pandasで読み込むために、ヘッダーとデータ1行を文字列に再結合
-            base_info_str = "\n".join(base_data_lines[:2])
-            df_base_info = pd.read_csv(
-                io.StringIO(base_info_str),
-                sep=',',
-                engine='python'
-            ).dropna(how='all', axis=1)
-
-        # 2. 保有銘柄情報の検索と解析
-        holdings_header_index, holdings_data_lines = find_header_row_and_data(lines, 'Code')
-        df_holdings = pd.DataFrame()
+        if base_span is not None:
+            df_base_info = _drop_empty(_read_section(file_bytes, base_span, encoding))
 
-        if holdings_header_index != -1:
-            holdings_info_str = "\n".join(holdings_data_lines)
-            df_holdings = pd.read_csv(
-                io.StringIO(holdings_info_str),
-                sep=',',
-                engine='python',
-            ).dropna(how='all', axis=1)
-            # すべての列がNaNである行を削除
-            df_holdings = df_holdings.dropna(how='all')
+        # 2. 保有銘柄情報の解析
+        df_holdings = pd.DataFrame()
+        if holdings_span is not None:
+            # すべての値がNaNである列と行を削除
+            df_holdings = _drop_empty(_read_section(file_bytes, holdings_span, encoding), rows=True)
 
 
         if df_base_info.empty and df_holdings.empty:
@@ -83,6 +130,8 @@ def parse_pcf_file(csv_content, file_name_for_log=""):
 
         return {'base_info': df_base_info, 'holdings': df_holdings}
 
+    except UnicodeDecodeError:
+        raise
     except Exception as e:
         logging.error(f"Failed to parse file content for {file_name_for_log}: {e}")
         return None
@@ -98,15 +147,13 @@ def test_single_file_parsing():
         logging.error(f"Test file not found: {test_file_path}")
         return
 
-    encodings_to_try = ['cp932', 'utf-8', 'sjis']
+    with open(test_file_path, 'rb') as f:
+        file_bytes = f.read()
+
     parsed_data = None
-    
-    for enc in encodings_to_try:
+    for enc in EncodingResolver().candidates(None, file_bytes):
         try:
-            with open(test_file_path, 'r', encoding=enc) as f:
-                content = f.read()
-            
-            parsed_data = parse_pcf_file(content, os.path.basename(test_file_path))
+            parsed_data = parse_pcf_file(file_bytes, enc, os.path.basename(test_file_path))
             if parsed_data and (not parsed_data.get('base_info', pd.DataFrame()).empty or not parsed_data.get('holdings', pd.DataFrame()).empty):
                 logging.info(f"Successfully parsed with encoding: {enc}")
                 break
@@ -126,126 +173,423 @@ def test_single_file_parsing():
     logging.info("--- Test Parsing Finished ---")
 
 
-def parse_by_date(target_date_str):
-    """
-    指定された日付のPCFファイルをすべて解析し、結果を連結して2つのCSVファイルとして保存する
-    """
-    logging.info(f"--- Running Parsing for Date: {target_date_str} ---")
-    
-    try:
-        target_date = datetime.strptime(target_date_str, '%Y-%m-%d')
-    except ValueError:
-        logging.error("Invalid date format. Please use YYYY-MM-DD.")
-        return
+# アーカイブ単位でエンコーディングの判定結果を保持する (ワーカープロセスごとに1つ)
+_resolver = EncodingResolver()
 
-    # 各プロバイダーのファイル名のパターンを作成
-    date_formats = {
-        'solactive': target_date.strftime('%Y-%m-%d'),
-        'ice': target_date.strftime('%Y%m%d'),
-        'ihs': target_date.strftime('%Y%m%d')
-    }
 
-    # ダウンロードディレクトリのパス
-    base_download_path = os.path.join('data', 'downloads')
-    
-    # 検索するzipファイルのパターンリスト
-    zip_patterns = [
-        os.path.join(base_download_path, 'solactive', f'solactive_{date_formats["solactive"]}.zip'),
-        os.path.join(base_download_path, 'ice', f'ice_{date_formats["ice"]}.zip'),
-        os.path.join(base_download_path, 'ihs', f'ihs_{date_formats["ihs"]}.zip')
-    ]
+def decode_and_parse(file_bytes, file_name_for_log="", archive_key=None):
+    """
+    CSVファイルのバイト列を、最適なエンコーディングを探しながら解析する。
+    エンコーディングは archive_key (ベンダー, アーカイブ) ごとに1回だけ判定し、
+    判定したエンコーディングで解析できなかった場合のみ他の候補を試す。
+    解析できなかった場合はNoneを返す。
+    """
+    for enc in _resolver.candidates(archive_key, file_bytes):
+        try:
+            parsed_data = parse_pcf_file(file_bytes, enc, file_name_for_log)
+            if parsed_data and (not parsed_data.get('base_info', pd.DataFrame()).empty or not parsed_data.get('holdings', pd.DataFrame()).empty):
+                logging.info(f"    Successfully parsed with encoding: {enc}")
+                _resolver.confirm(archive_key, enc, file_bytes)
+                return parsed_data
+        except UnicodeDecodeError:
+            logging.debug(f"    Failed to decode with {enc}")
+            continue
+        except Exception as e:
+            logging.debug(f"    Error during parsing with {enc}: {e}")
+            continue
+    return None
 
-    found_files = []
-    for pattern in zip_patterns:
-        found_files.extend(glob.glob(pattern))
 
-    if not found_files:
-        logging.warning(f"No zip files found for date {target_date_str}")
-        return
+def attach_source(parsed_data, source):
+    """
+    解析結果に source 列を追加し、保有銘柄にはETFコードを付与する。
+    戻り値: (df_base, df_holdings)。それぞれ空の場合はNone。
+    """
+    df_base = parsed_data.get('base_info')
+    df_holdings = parsed_data.get('holdings')
 
-    logging.info(f"Found {len(found_files)} zip file(s) to process.")
+    if df_base is not None and not df_base.empty:
+        df_base['source'] = source
+    else:
+        df_base = None
 
-    # エンコーディングの試行リスト
-    encodings_to_try = ['cp932', 'utf-8', 'sjis']
+    if df_holdings is not None and not df_holdings.empty:
+        # 保有銘柄にもETFコードとsourceを追加して関連付け
+        if df_base is not None and 'ETF Code' in df_base.columns:
+            df_holdings['ETF Code'] = df_base['ETF Code'].iloc[0]
+        df_holdings['source'] = source
+    else:
+        df_holdings = None
 
-    # パース結果を保存するディレクトリ
-    output_dir = 'data'
-    os.makedirs(output_dir, exist_ok=True)
+    return df_base, df_holdings
 
-    all_base_infos = []
-    all_holdings_infos = []
 
-    # 各zipファイルを処理
+def list_work_items(found_files, failed=None):
+    """
+    zipファイルのリストから、解析対象の (zipファイルのパス, メンバー名, source) を決まった順序で列挙する。
+    failed にリストを渡すと、開けなかったzipファイルのパスを追加する。
+    """
+    work_items = []
     for zip_path in found_files:
-        logging.info(f"Processing zip file: {zip_path}")
         # zipファイルのパスからsourceを取得 (例: .../data/downloads/ice/...) -> 'ice'
         source = os.path.basename(os.path.dirname(zip_path))
-
         try:
-            with ZipFile(zip_path, 'r') as zf:
+            with open_archive(zip_path) as zf:
                 csv_files = [f for f in zf.namelist() if f.lower().endswith('.csv')]
-                for csv_file_name in csv_files:
-                    logging.info(f"  Parsing CSV: {csv_file_name}")
-                    
-                    parsed_data = None
-                    content = None
-                    
-                    # zip内のファイルを読み込み、最適なエンコーディングを見つける
-                    with zf.open(csv_file_name) as csv_file:
-                        file_bytes = csv_file.read()
-                        
-                    for enc in encodings_to_try:
-                        try:
-                            content = file_bytes.decode(enc)
-                            parsed_data = parse_pcf_file(content, csv_file_name)
-                            if parsed_data and (not parsed_data.get('base_info', pd.DataFrame()).empty or not parsed_data.get('holdings', pd.DataFrame()).empty):
-                                logging.info(f"    Successfully parsed with encoding: {enc}")
-                                break
-                            else:
-                                parsed_data = None
-                        except UnicodeDecodeError:
-                            logging.debug(f"    Failed to decode with {enc}")
-                            continue
-                        except Exception as e:
-                            logging.debug(f"    Error during parsing with {enc}: {e}")
-                            continue
-                    
-                    # パース成功後の処理
-                    if parsed_data:
-                        df_base = parsed_data.get('base_info')
-                        df_holdings = parsed_data.get('holdings')
-
-                        if df_base is not None and not df_base.empty:
-                            df_base['source'] = source
-                            all_base_infos.append(df_base)
-                        
-                        if df_holdings is not None and not df_holdings.empty:
-                            # 保有銘柄にもETFコードとsourceを追加して関連付け
-                            if df_base is not None and not df_base.empty and 'ETF Code' in df_base.columns:
-                                df_holdings['ETF Code'] = df_base['ETF Code'].iloc[0]
-                            df_holdings['source'] = source
-                            all_holdings_infos.append(df_holdings)
-                    else:
-                        logging.warning(f"  Could not parse {csv_file_name} with any of the attempted encodings.")
+        except Exception as e:
+            logging.error(f"Failed to process zip file {zip_path}: {e}")
+            if failed is not None:
+                failed.append(zip_path)
+            continue
+        logging.info(f"Processing zip file: {zip_path} ({len(csv_files)} CSV files)")
+        work_items.extend((zip_path, csv_file_name, source) for csv_file_name in csv_files)
+    return work_items
+
+
+# ワーカープロセスごとに開いたzipファイルを使い回す
+# (複数日付を処理する長時間のプロセスでファイルを開いたままにしないよう、最近使ったものだけ残す)
+_open_zips = {}
+MAX_OPEN_ZIPS = 8
+
+
+def _get_zip(zip_path):
+    zf = _open_zips.get(zip_path)
+    if zf is None:
+        if len(_open_zips) >= MAX_OPEN_ZIPS:
+            _open_zips.pop(next(iter(_open_zips))).close()
+        zf = open_archive(zip_path)
+        _open_zips[zip_path] = zf
+    return zf
+
+
+def parse_member(work_item):
+    """
+    zipファイル内の1つのCSVを解析する (プロセスプールのワーカーからも呼ばれる)。
+    戻り値: (df_base, df_holdings)。解析できなかった場合は (None, None)。
+    """
+    zip_path, csv_file_name, source = work_item
+    logging.info(f"  Parsing CSV: {csv_file_name}")
+    try:
+        file_bytes = _get_zip(zip_path).read(csv_file_name)
+    except Exception as e:
+        logging.error(f"Failed to read {csv_file_name} from {zip_path}: {e}")
+        return None, None
+
+    parsed_data = decode_and_parse(file_bytes, csv_file_name, archive_key=(source, zip_path))
+    if not parsed_data:
+        logging.warning(f"  Could not parse {csv_file_name} with any of the attempted encodings.")
+        return None, None
+    return attach_source(parsed_data, source)
+
+
+def parse_work_items(work_items, workers=1, executor=None):
+    """
+    work_items を解析し、結果を入力と同じ順序で返す。
+    workers が2以上の場合はプロセスプールで並列に解析する。
+    executor: 複数日付を処理する場合に使い回すプロセスプール (指定した場合は workers の数で分割して渡す)
+    """
+    if executor is not None:
+        chunksize = max(1, len(work_items) // (workers * 4))
+        return list(executor.map(parse_member, work_items, chunksize=chunksize))
+    if workers <= 1:
+        try:
+            return [parse_member(item) for item in work_items]
+        finally:
+            for zf in _open_zips.values():
+                zf.close()
+            _open_zips.clear()
+
+    # 1タスクあたりのオーバーヘッドを抑えるため、ある程度まとめてワーカーに渡す
+    chunksize = max(1, len(work_items) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # map は入力順に結果を返すため、結合順序は逐次処理と同じになる
+        return list(executor.map(parse_member, work_items, chunksize=chunksize))
+
+
+def open_cache():
+    """解析結果のキャッシュを開く (read_csv の型推論は pandas のバージョンで変わり得るため、キーにはそのバージョンも含める)"""
+    return ParseCache(parser_version=f"{PARSER_VERSION}/pandas-{pd.__version__}")
+
+
+def parse_archives(found_files, workers=1, executor=None, cache=None, failed=None):
+    """
+    zipファイルのリストを解析し、(結果のリスト, 更新が必要なマニフェスト) を返す。
+    cache を指定した場合は中央ディレクトリのマニフェストを読み、CRC32とサイズが一致する解析結果が
+    キャッシュにあるメンバーは解析しない。更新が必要なマニフェスト ({zipファイルのパス: メンバー}) は、
+    結果を保存した後で commit_manifests() に渡す (保存前に失敗した場合は次回も変更ありと判定される)。
+    """
+    if cache is None:
+        return parse_work_items(list_work_items(found_files, failed), workers=workers, executor=executor), {}
 
+    results, to_parse, slots = [], [], []
+    manifests = {}
+    for zip_path in found_files:
+        source = os.path.basename(os.path.dirname(zip_path))
+        try:
+            members = read_manifest(zip_path)
         except Exception as e:
             logging.error(f"Failed to process zip file {zip_path}: {e}")
+            if failed is not None:
+                failed.append(zip_path)
+            continue
+        added, changed, removed = diff_manifest(cache.manifest(zip_path), members)
+        if added or changed or removed:
+            manifests[zip_path] = members
+        misses = 0
+        for member in members:
+            cached = cache.get(source, member)
+            if cached is None:
+                slots.append((len(results), source, member))
+                to_parse.append((zip_path, member.name, source))
+                misses += 1
+            results.append(cached)
+        logging.info(f"Processing zip file: {zip_path} ({len(members)} CSV files, {len(added)} added, "
+                     f"{len(changed)} changed, {len(removed)} removed, {misses} to parse)")
+
+    if to_parse:
+        parsed = parse_work_items(to_parse, workers=workers, executor=executor)
+        for (i, _, _), result in zip(slots, parsed):
+            results[i] = result
+        cache.put_many((source, member, result) for (_, source, member), result in zip(slots, parsed))
+    return results, manifests
+
+
+def commit_manifests(cache, manifests):
+    """parse_archives() が返したマニフェストを保存する"""
+    for zip_path, members in manifests.items():
+        cache.save_manifest(zip_path, members)
+
+
+def save_columnar(final_base_df, final_holdings_df, target_date_str, fmt, output_dir, sources=None, read_back=True):
+    """
+    解析結果を create_table.sql の列名・型 (と評価額の列) に揃え、Fund_Date・source で分割した Parquet / Arrow IPC として保存する
+    sources: 解析したベンダー (以前に書き込んだファイルのうち、このベンダーのものを置き換える。None の場合はすべて)
+    戻り値: 保存した正規化済みの (基本情報, 保有銘柄)。sources を指定した場合は、同じ解析日に保存済みの
+            他のベンダーの分を読み戻して加えたもの (update_derived() に1日分として渡すため。read_back=False の場合は加えない)
+    """
+    # pyarrow はこの出力形式でのみ必要
+    from pcf_schema import normalize_base, normalize_holdings
+    from pcf_columnar import write_partitions, clear_run, read_run
+
+    columnar_dir = os.path.join(output_dir, 'columnar')
+    for table in ['base_info', 'holdings']:
+        clear_run(table, target_date_str, fmt, base_dir=columnar_dir, sources=sources)
+    base = normalize_base(final_base_df, default_date=target_date_str, valuation=True)
+    rows = write_partitions(base, 'base_info', target_date_str, fmt, base_dir=columnar_dir)
+    logging.info(f"Saved {rows} base info rows to {columnar_dir} ({fmt})")
+    holdings = None
+    if final_holdings_df is not None:
+        holdings = normalize_holdings(final_holdings_df, base, valuation=True)
+        rows = write_partitions(holdings, 'holdings', target_date_str, fmt, base_dir=columnar_dir)
+        logging.info(f"Saved {rows} holdings rows to {columnar_dir} ({fmt})")
+    if sources is not None and read_back:
+        # _write_csv と同じく、他のベンダーの分を加えてベンダーの順序をまとめて解析した場合と同じにする
+        base = _merge_saved(base, read_run('base_info', target_date_str, fmt, columnar_dir, exclude_sources=sources))
+        holdings = _merge_saved(holdings, read_run('holdings', target_date_str, fmt, columnar_dir,
+                                                   exclude_sources=sources))
+    return base, holdings
+
+
+def _merge_saved(df, existing):
+    """今回保存した正規化済みの表に、保存済みの他のベンダーの分 (pcf_columnar.read_run の結果) を加える"""
+    if existing is None or existing.empty:
+        return df
+    if df is None:
+        return existing
+    existing = existing.astype(df.dtypes[existing.columns].to_dict())
+    merged = pd.concat([existing, df], ignore_index=True)
+    order = merged['source'].map({vendor: i for i, vendor in enumerate(ARCHIVE_ORDER)})
+    return merged.iloc[order.argsort(kind='stable')].reset_index(drop=True)
+
+
+# ダウンロードディレクトリ・出力ディレクトリ (実行ディレクトリからの相対パス)
+DOWNLOAD_DIR = os.path.join('data', 'downloads')
+OUTPUT_DIR = 'data'
+
+# 出力ファイル内のベンダーの順序
+ARCHIVE_ORDER = ['solactive', 'ice', 'ihs']
+
+
+def find_archives(target_date, vendors=None, download_dir=DOWNLOAD_DIR):
+    """
+    指定日のダウンロード済みzipファイルを (ベンダー, パス) のリストで返す
+    """
+    archives = []
+    for vendor in ARCHIVE_ORDER:
+        if vendors is not None and vendor not in vendors:
+            continue
+        path = archive_path(vendor, target_date, base_dir=download_dir)
+        # ZIPを削除してブロブストアにのみ保存したものも含める
+        if archive_exists(path):
+            archives.append((vendor, path))
+    return archives
+
+
+def collect_results(results):
+    """parse_work_items の結果を連結し、(基本情報, 保有銘柄) を返す。該当がない場合はNone"""
+    all_base_infos = [df_base for df_base, _ in results if df_base is not None]
+    all_holdings_infos = [df_holdings for _, df_holdings in results if df_holdings is not None]
+
+    final_base_df = pd.concat(all_base_infos, ignore_index=True) if all_base_infos else None
+    final_holdings_df = pd.concat(all_holdings_infos, ignore_index=True) if all_holdings_infos else None
+    return final_base_df, final_holdings_df
+
+
+def _write_csv(df, path, replace_sources=None):
+    """
+    CSVファイルを書き出す。
+    replace_sources を指定した場合は、既存ファイルのうちそれ以外のベンダーの行を残して置き換える。
+    戻り値: 書き出した表 (他のベンダーの行を含む)。書き出すものがない場合はNone
+    """
+    if replace_sources is not None and os.path.exists(path):
+        existing = pd.read_csv(path, dtype=str, encoding='utf-8-sig')
+        existing = existing[~existing['source'].isin(replace_sources)]
+        if not existing.empty:
+            df = pd.concat([existing, df], ignore_index=True) if df is not None else existing
+            # ベンダーの順序をまとめて解析した場合と同じにする
+            order = df['source'].map({vendor: i for i, vendor in enumerate(ARCHIVE_ORDER)})
+            df = df.iloc[order.argsort(kind='stable')]
+    if df is None:
+        return None
+    tmp_path = path + '.tmp'
+    df.to_csv(tmp_path, index=False, encoding='utf-8-sig')
+    os.replace(tmp_path, path)
+    return df
+
+
+def save_results(final_base_df, final_holdings_df, target_date_str, fmt='csv', output_dir=OUTPUT_DIR, replace_sources=None,
+                 index=True, latest=True, validate=True):
+    """
+    1日分の解析結果を保存する。
+    replace_sources: 一部のベンダーのみ解析した場合に指定する。それ以外のベンダーの既存の出力は残す
+    index: 保存した後で銘柄 -> 保有ETF の逆引き索引 (pcf_index) も作る
+    latest: 保存した後でETFごとの最新のPCFのストア (pcf_latest) も更新する
+    validate: 保存した後で解析結果を検証し、品質の一覧と隔離した行 (pcf_validate) も保存する
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    if fmt != 'csv':
+        if final_base_df is not None:
+            # 一部のベンダーのみ解析した場合も、保存済みの他のベンダーの分を含む1日分を受け取る
+            base, holdings = save_columnar(final_base_df, final_holdings_df, target_date_str, fmt, output_dir,
+                                           sources=replace_sources, read_back=index or latest or validate)
+            update_derived(base, holdings, target_date_str, output_dir, index=index, latest=latest, validate=validate)
+        return
 
     # すべてのパース結果を連結して保存
-    if all_base_infos:
-        final_base_df = pd.concat(all_base_infos, ignore_index=True)
-        base_output_path = os.path.join(output_dir, f"base_info_{target_date_str}.csv")
-        final_base_df.to_csv(base_output_path, index=False, encoding='utf-8-sig')
+    base_output_path = os.path.join(output_dir, f"base_info_{target_date_str}.csv")
+    saved_base_df = _write_csv(final_base_df, base_output_path, replace_sources)
+    if saved_base_df is not None:
         logging.info(f"Aggregated base info saved to {base_output_path}")
 
-    if all_holdings_infos:
-        final_holdings_df = pd.concat(all_holdings_infos, ignore_index=True)
-        holdings_output_path = os.path.join(output_dir, f"holdings_{target_date_str}.csv")
-        final_holdings_df.to_csv(holdings_output_path, index=False, encoding='utf-8-sig')
+    holdings_output_path = os.path.join(output_dir, f"holdings_{target_date_str}.csv")
+    saved_holdings_df = _write_csv(final_holdings_df, holdings_output_path, replace_sources)
+    if saved_holdings_df is not None:
         logging.info(f"Aggregated holdings info saved to {holdings_output_path}")
+    if final_base_df is None or not (index or latest or validate):
+        return
+    # 一部のベンダーのみ解析した場合も、書き出した表 (他のベンダーの行を含む) を使うため読み直さない
+    from pcf_schema import normalize_base, normalize_holdings
+    try:
+        base = normalize_base(saved_base_df, default_date=target_date_str, valuation=True)
+        holdings = normalize_holdings(saved_holdings_df, base, valuation=True) if saved_holdings_df is not None else None
+    except Exception as e:
+        logging.warning(f"Could not normalize the results for {target_date_str}: {e}")
+        return
+    update_derived(base, holdings, target_date_str, output_dir, index=index, latest=latest, validate=validate)
 
-    logging.info(f"--- Parsing for Date: {target_date_str} Finished ---")
 
+def update_derived(base, holdings, target_date_str, output_dir=OUTPUT_DIR, index=True, latest=True, validate=True):
+    """
+    正規化済み (valuation=True) の1日分を検証して品質の一覧 (<output_dir>/quality/) を保存し、
+    逆引き索引 (<output_dir>/index/holdings_<日付>.idx) を作り、最新のPCFのストアを更新する。3つとも同じ表から作る。
+    一部のベンダーのみ解析した場合も、他のベンダーの分を含む保存後の1日分を渡す
+    (品質の一覧・索引は日付ごとに作り直すため、今回解析したベンダーの分だけでは他のベンダーの分が失われる)。
+    検証・索引・ストアの更新に失敗しても解析結果の保存は失敗させない。
+    """
+    if base is None or not (index or latest or validate):
+        return
+
+    if validate:
+        from pcf_validate import validate_date
+        try:
+            validate_date(base, holdings, target_date_str, os.path.join(output_dir, 'quality'))
+        except Exception as e:
+            logging.warning(f"Could not validate the results for {target_date_str}: {e}")
+    if index and holdings is not None:
+        from pcf_index import build_index
+        try:
+            build_index(base, holdings, target_date_str, os.path.join(output_dir, 'index'))
+        except Exception as e:
+            logging.warning(f"Could not build the holdings index for {target_date_str}: {e}")
+    if latest:
+        from pcf_latest import update_latest
+        try:
+            update_latest(base, holdings, target_date_str)
+        except Exception as e:
+            logging.warning(f"Could not update the latest holdings store for {target_date_str}: {e}")
+
+
+def output_mtime(target_date_str, fmt='csv', output_dir=OUTPUT_DIR):
+    """指定日の解析結果を保存した時刻 (複数ファイルの場合は最も古いもの)。保存されていない場合はNone"""
+    if fmt == 'csv':
+        paths = [os.path.join(output_dir, f"{name}_{target_date_str}.csv") for name in ['base_info', 'holdings']]
+        paths = [path for path in paths if os.path.exists(path)]
+    else:
+        pattern = os.path.join(output_dir, 'columnar', fmt, '*', 'Fund_Date=*', 'source=*', f"part-{target_date_str}-*")
+        paths = glob.glob(pattern)
+    return min(os.path.getmtime(path) for path in paths) if paths else None
+
+
+def is_up_to_date(cache, found_files, target_date_str, fmt='csv'):
+    """
+    前回の解析から変更がないかどうか。中央ディレクトリだけを読んで前回のマニフェストと比べ、
+    出力がアーカイブより新しい場合のみ True (他の形式で解析した後に古い出力が残っている場合を除くため)
+    """
+    saved_at = output_mtime(target_date_str, fmt)
+    if saved_at is None or any(archive_mtime(path) > saved_at for path in found_files):
+        return False
+    return all(not any(diff_manifest(cache.manifest(path), read_manifest(path))) for path in found_files)
+
+
+def parse_by_date(target_date_str, workers=1, fmt='csv', use_cache=True, index=True, latest=True, validate=True):
+    """
+    指定された日付のPCFファイルをすべて解析し、結果を連結して保存する。
+    fmt: 'csv' (data/ に2つのCSVファイル)、'parquet' / 'arrow' (data/columnar/ に Fund_Date・source で分割して保存)
+    use_cache: 前回から変更のないメンバーは解析結果のキャッシュを使う。
+               どのアーカイブにも変更がなく、出力も保存済みの場合は何もしない。
+    index / latest / validate: save_results() を参照
+    """
+    logging.info(f"--- Running Parsing for Date: {target_date_str} ---")
+    
+    try:
+        target_date = datetime.strptime(target_date_str, '%Y-%m-%d')
+    except ValueError:
+        logging.error("Invalid date format. Please use YYYY-MM-DD.")
+        return
+
+    found_files = [path for _, path in find_archives(target_date)]
+    if not found_files:
+        logging.warning(f"No zip files found for date {target_date_str}")
+        return
+
+    logging.info(f"Found {len(found_files)} zip file(s) to process.")
+
+    cache = open_cache() if use_cache else None
+    try:
+        if cache is not None and is_up_to_date(cache, found_files, target_date_str, fmt):
+            logging.info(f"--- No archive changed since the last run. Skipping {target_date_str} ---")
+            return
+        results, manifests = parse_archives(found_files, workers=workers, cache=cache)
+        final_base_df, final_holdings_df = collect_results(results)
+        save_results(final_base_df, final_holdings_df, target_date_str, fmt,
+                     index=index, latest=latest, validate=validate)
+        if cache is not None:
+            commit_manifests(cache, manifests)
+    finally:
+        if cache is not None:
+            cache.close()
+
+    logging.info(f"--- Parsing for Date: {target_date_str} Finished ---")
 
 
 if __name__ == '__main__':
@@ -258,10 +602,43 @@ if __name__ == '__main__':
         type=str,
         help="The date to process files for, in YYYY-MM-DD format. If not provided, a single file test will run."
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of worker processes used to parse CSV files in parallel (default: 1)."
+    )
+    parser.add_argument(
+        "--format",
+        choices=['csv', 'parquet', 'arrow'],
+        default='csv',
+        help="Output format: CSV files in data/, or typed Parquet / Arrow IPC partitioned by Fund_Date and source in data/columnar/ (default: csv)."
+    )
+    parser.add_argument(
+        "--no-cache",
+        action='store_true',
+        help="Re-parse every CSV file instead of reusing cached results for unchanged archive members."
+    )
+    parser.add_argument(
+        "--no-validate",
+        action='store_true',
+        help="Do not validate the results or write the quality report to data/quality/."
+    )
+    parser.add_argument(
+        "--no-index",
+        action='store_true',
+        help="Do not build the holdings reverse index in data/index/."
+    )
+    parser.add_argument(
+        "--no-latest",
+        action='store_true',
+        help="Do not update the latest-holdings store (data/pcf_latest.db)."
+    )
     args = parser.parse_args()
 
     # 日付が指定されている場合は日付ごとの処理、そうでなければ単一ファイルテストを実行
     if args.date:
-        parse_by_date(args.date)
+        parse_by_date(args.date, workers=args.workers, fmt=args.format, use_cache=not args.no_cache,
+                      index=not args.no_index, latest=not args.no_latest, validate=not args.no_validate)
     else:
         test_single_file_parsing()
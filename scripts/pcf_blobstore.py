@@ -0,0 +1,601 @@
+import os
+import io
+import sys
+import zlib
+import hashlib
+import sqlite3
+import logging
+import argparse
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from zipfile import ZipFile, ZipInfo, ZIP_DEFLATED
+
+from pcf_vendors import VENDORS, BASE_DIR, archive_date
+
+try:
+    import zstandard
+except ImportError:  # zstandard がない環境では zlib で圧縮する
+    zstandard = None
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# 日次のZIPをメンバー (ETFごとのCSV) 単位に分け、内容のハッシュ (SHA-256) をキーにした
+# ブロブとして保存する (同じ内容のファイルは日付・ベンダーをまたいで1つだけ保存される)。
+#   data/blobs/index.db                 : (ベンダー, 日付) ごとのメンバー一覧と、ブロブの格納位置
+#   data/blobs/packs/ice/2025-12.pack   : 圧縮したブロブを追記していくファイル (ベンダー・月ごと)
+# 小さなCSVを1ファイルずつ保存するとファイルシステムのブロック単位の無駄が大きいため、パックファイルにまとめる。
+# 1つのメンバーは索引の主キー検索1回と、パックファイルの該当位置の読み込み・展開だけで読める。
+# open_archive() は元のZIPがあればそれを、なければ保存したブロブを ZipFile と同じように読む。
+# パックファイルへの追記 (compact) と詰め直し (prune) は、索引の書き込みトランザクション (BEGIN IMMEDIATE) を
+# 取ってから、パックファイルごとのロックファイル (<パック>.lock) を取って行う (他のプロセスとも排他する)。
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(script_dir)
+
+BLOB_DIR = os.path.join(project_root, 'data', 'blobs')
+
+DEFAULT_CODEC = 'zstd' if zstandard is not None else 'zlib'
+ZSTD_LEVEL = 10
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS archives (
+    vendor          TEXT    NOT NULL,
+    date            TEXT    NOT NULL,
+    archive         TEXT    NOT NULL,
+    size            INTEGER,
+    mtime           REAL,
+    members         INTEGER,
+    compacted_at    TEXT,
+    PRIMARY KEY (vendor, date)
+) WITHOUT ROWID;
+
+CREATE UNIQUE INDEX IF NOT EXISTS IX_archives_name ON archives (vendor, archive);
+
+CREATE TABLE IF NOT EXISTS members (
+    vendor          TEXT    NOT NULL,
+    date            TEXT    NOT NULL,
+    name            TEXT    NOT NULL,
+    position        INTEGER NOT NULL,
+    digest          TEXT    NOT NULL,
+    crc32           INTEGER NOT NULL,
+    compress_size   INTEGER NOT NULL,
+    file_size       INTEGER NOT NULL,
+    header_offset   INTEGER NOT NULL,
+    date_time       TEXT,
+    PRIMARY KEY (vendor, date, name)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS blobs (
+    digest          TEXT    NOT NULL PRIMARY KEY,
+    codec           TEXT    NOT NULL,
+    size            INTEGER NOT NULL,
+    pack            TEXT    NOT NULL,
+    offset          INTEGER NOT NULL,
+    stored_size     INTEGER NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+def _compress(data, codec):
+    if codec == 'zstd':
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    if codec == 'zlib':
+        return zlib.compress(data, 9)
+    raise ValueError(f"Unknown codec: {codec}")
+
+
+@contextmanager
+def _lock_file(path):
+    """ロックファイルを排他ロックする (プロセス間でも有効)"""
+    with open(path, 'a+b') as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:  # LK_LOCK は約10秒で諦めるため取れるまで繰り返す
+                    continue
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _decompress(data, codec):
+    if codec == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to read blobs compressed with zstd")
+        return zstandard.ZstdDecompressor().decompress(data)
+    if codec == 'zlib':
+        return zlib.decompress(data)
+    raise ValueError(f"Unknown codec: {codec}")
+
+
+class BlobStore:
+    """
+    内容のハッシュをキーにしたブロブと、(ベンダー, 日付) ごとのメンバーの索引 (SQLite)。
+    """
+
+    def __init__(self, base_dir=BLOB_DIR, codec=DEFAULT_CODEC):
+        os.makedirs(os.path.join(base_dir, 'packs'), exist_ok=True)
+        self.base_dir = base_dir
+        self.codec = codec
+        self._lock = threading.RLock()
+        # このインスタンスがロックしているパックファイル -> ネストの深さ
+        self._pack_locks = {}
+        self._conn = sqlite3.connect(os.path.join(base_dir, 'index.db'), timeout=30,
+                                     isolation_level=None, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @contextmanager
+    def transaction(self):
+        """複数の更新を1トランザクションにまとめる (トランザクション中に呼んだ場合は外側のトランザクションに含める)"""
+        with self._lock:
+            if self._conn.in_transaction:
+                yield self
+                return
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield self
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+            self._conn.execute('COMMIT')
+
+    def _pack_path(self, pack):
+        return os.path.join(self.base_dir, 'packs', *pack.split('/'))
+
+    @contextmanager
+    def _pack_lock(self, pack):
+        """
+        パックファイルのロック (同じインスタンスからは入れ子にできる)。
+        デッドロックを避けるため、必ず transaction() の内側で取る。
+        """
+        with self._lock:
+            if pack in self._pack_locks:
+                self._pack_locks[pack] += 1
+                try:
+                    yield
+                finally:
+                    self._pack_locks[pack] -= 1
+                return
+            path = self._pack_path(pack)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with _lock_file(path + '.lock'):
+                self._pack_locks[pack] = 1
+                try:
+                    yield
+                finally:
+                    del self._pack_locks[pack]
+
+    def _packs_on_disk(self):
+        """packs/ の下にあるパックファイルの名前 (例: 'ice/2025-12.pack') の一覧"""
+        root = os.path.join(self.base_dir, 'packs')
+        packs = []
+        for dir_path, _, file_names in os.walk(root):
+            rel = os.path.relpath(dir_path, root)
+            for file_name in file_names:
+                if file_name.endswith('.pack'):
+                    packs.append(file_name if rel == '.' else '/'.join(rel.split(os.sep) + [file_name]))
+        return sorted(packs)
+
+    # --- ブロブ ---
+
+    def put_blob(self, data, pack):
+        """
+        内容をブロブとしてパックファイル pack (例: 'ice/2025-12.pack') の末尾に追記し、
+        (ダイジェスト, 新たに保存したバイト数) を返す。
+        同じ内容のブロブが既にある場合は保存しない (新たに保存したバイト数は 0)。
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        with self.transaction(), self._pack_lock(pack):
+            if self._conn.execute('SELECT 1 FROM blobs WHERE digest = ?', (digest,)).fetchone():
+                return digest, 0
+            stored = _compress(data, self.codec)
+            path = self._pack_path(pack)
+            with open(path, 'ab') as f:
+                offset = f.tell()
+                f.write(stored)
+            self._conn.execute(
+                'INSERT INTO blobs (digest, codec, size, pack, offset, stored_size) VALUES (?, ?, ?, ?, ?, ?)',
+                (digest, self.codec, len(data), pack, offset, len(stored))
+            )
+        return digest, len(stored)
+
+    def read_blob(self, codec, pack, offset, stored_size):
+        """パックファイルの指定位置からブロブを読み、展開した内容を返す"""
+        with open(self._pack_path(pack), 'rb') as f:
+            f.seek(offset)
+            return _decompress(f.read(stored_size), codec)
+
+    # --- 索引 ---
+
+    def find(self, vendor, archive):
+        """アーカイブのファイル名から保存済みの (ベンダー, 日付) の情報を返す。なければNone"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT vendor, date, archive, size, mtime, members FROM archives WHERE vendor = ? AND archive = ?',
+                (vendor, archive)
+            ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(['vendor', 'date', 'archive', 'size', 'mtime', 'members'], row))
+
+    def archives(self, vendor=None):
+        """保存済みのアーカイブを (ベンダー, ファイル名) のリストで返す (日付順)"""
+        sql = 'SELECT vendor, archive FROM archives'
+        params = []
+        if vendor is not None:
+            sql += ' WHERE vendor = ?'
+            params.append(vendor)
+        with self._lock:
+            return [tuple(row) for row in self._conn.execute(sql + ' ORDER BY vendor, date', params)]
+
+    def members(self, vendor, date_key):
+        """
+        (ベンダー, 日付) のメンバーを元のZIP内の順序で返す: [(ZipInfo, ブロブの格納位置), ...]
+        格納位置は read_blob() の引数 (圧縮形式, パックファイル, 位置, サイズ)
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT m.name, m.crc32, m.compress_size, m.file_size, m.header_offset, m.date_time, '
+                'b.codec, b.pack, b.offset, b.stored_size '
+                'FROM members m JOIN blobs b ON b.digest = m.digest '
+                'WHERE m.vendor = ? AND m.date = ? ORDER BY m.position',
+                (vendor, date_key)
+            ).fetchall()
+        result = []
+        for name, crc, compress_size, file_size, header_offset, date_time, *location in rows:
+            info = ZipInfo(name, tuple(int(v) for v in date_time.split(',')) if date_time else (1980, 1, 1, 0, 0, 0))
+            info.CRC, info.compress_size, info.file_size, info.header_offset = crc, compress_size, file_size, header_offset
+            result.append((info, tuple(location)))
+        return result
+
+    def read_member(self, vendor, date_key, name):
+        """1つのメンバーの内容を返す (索引の主キー検索とブロブ1つの読み込み・展開のみ)"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT b.codec, b.pack, b.offset, b.stored_size FROM members m JOIN blobs b ON b.digest = m.digest '
+                'WHERE m.vendor = ? AND m.date = ? AND m.name = ?',
+                (vendor, date_key, name)
+            ).fetchone()
+        if row is None:
+            raise KeyError(f"There is no item named {name!r} in {vendor} {date_key}")
+        return self.read_blob(*row)
+
+    def compact(self, vendor, date_key, zip_path):
+        """
+        ZIPのすべてのメンバーをブロブとして保存し、索引を置き換える (1トランザクション。その間パックファイルをロックする)。
+        途中で失敗した場合、パックファイルに追記済みのバイト列はどこからも参照されずに残る (prune() で回収する)。
+        戻り値: {'members': メンバー数, 'size': ZIPのサイズ, 'stored': 新たに保存したバイト数}
+        """
+        rows = []
+        stored = 0
+        pack = f"{vendor}/{date_key[:7]}.pack"
+        size = os.path.getsize(zip_path)
+        now = datetime.now().isoformat(timespec='seconds')
+        with ZipFile(zip_path, 'r') as zf, self.transaction(), self._pack_lock(pack):
+            for position, info in enumerate(zf.infolist()):
+                if info.is_dir():
+                    continue
+                digest, written = self.put_blob(zf.read(info), pack)
+                stored += written
+                rows.append((vendor, date_key, info.filename, position, digest, info.CRC, info.compress_size,
+                             info.file_size, info.header_offset, ','.join(str(v) for v in info.date_time)))
+            self._conn.execute('DELETE FROM members WHERE vendor = ? AND date = ?', (vendor, date_key))
+            self._conn.executemany(
+                'INSERT INTO members (vendor, date, name, position, digest, crc32, compress_size, file_size, '
+                'header_offset, date_time) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                rows
+            )
+            self._conn.execute(
+                'INSERT OR REPLACE INTO archives (vendor, date, archive, size, mtime, members, compacted_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (vendor, date_key, os.path.basename(zip_path), size, os.path.getmtime(zip_path), len(rows), now)
+            )
+        return {'members': len(rows), 'size': size, 'stored': stored}
+
+    def verify(self, vendor, date_key):
+        """保存したメンバーを読み戻し、元のZIPに記録されていたCRC32と一致するか確認する"""
+        for info, location in self.members(vendor, date_key):
+            if zlib.crc32(self.read_blob(*location)) != info.CRC:
+                return False
+        return True
+
+    def prune(self):
+        """
+        どの (ベンダー, 日付) からも参照されていないブロブを削除し、該当するパックファイルを詰めて書き直す。
+        compact() が失敗して残った、どのブロブからも参照されていないバイト列もあわせて回収する。
+        パックファイルごとに、書き込みトランザクションとパックファイルのロックを取ったまま書き直す。
+        戻り値: {'blobs': 削除したブロブの数, 'bytes': 減ったパックファイルのバイト数}
+        """
+        totals = {'blobs': 0, 'bytes': 0}
+        with self._lock:
+            referenced = dict(self._conn.execute('SELECT pack, SUM(stored_size) FROM blobs GROUP BY pack').fetchall())
+            unused = {pack for (pack,) in self._conn.execute(
+                'SELECT DISTINCT pack FROM blobs WHERE digest NOT IN (SELECT digest FROM members)'
+            )}
+        packs = set(unused)
+        for pack in self._packs_on_disk():
+            if os.path.getsize(self._pack_path(pack)) > referenced.get(pack, 0):
+                packs.add(pack)
+        for pack in sorted(packs):
+            removed, reclaimed = self._rewrite_pack(pack)
+            totals['blobs'] += removed
+            totals['bytes'] += reclaimed
+        return totals
+
+    def _rewrite_pack(self, pack):
+        """
+        パックファイルを参照されているブロブだけで書き直す。戻り値: (削除したブロブの数, 減ったバイト数)
+        パックファイルの置き換えは、索引の更新と同じトランザクションの中で COMMIT の直前に行う。
+        """
+        path = self._pack_path(pack)
+        with self.transaction(), self._pack_lock(pack):
+            # ロックを取った後で読み直す (一覧を作った後に他のプロセスが追記・削除した場合も正しく扱う)
+            removed = self._conn.execute(
+                'DELETE FROM blobs WHERE pack = ? AND digest NOT IN (SELECT digest FROM members)', (pack,)
+            ).rowcount
+            kept = self._conn.execute(
+                'SELECT digest, offset, stored_size FROM blobs WHERE pack = ? ORDER BY offset', (pack,)
+            ).fetchall()
+            if not os.path.exists(path):
+                return removed, 0
+            before = os.path.getsize(path)
+            if not kept:
+                os.remove(path)
+                return removed, before
+            moved = []
+            with open(path, 'rb') as src, open(path + '.tmp', 'wb') as dst:
+                for digest, offset, stored_size in kept:
+                    src.seek(offset)
+                    moved.append((dst.tell(), digest))
+                    dst.write(src.read(stored_size))
+                after = dst.tell()
+            if after == before:
+                os.remove(path + '.tmp')
+                return removed, 0
+            self._conn.executemany('UPDATE blobs SET offset = ? WHERE digest = ?', moved)
+            os.replace(path + '.tmp', path)
+        return removed, before - after
+
+    def stats(self):
+        """保存前のZIPの合計サイズ・メンバーの合計サイズ・ブロブの合計サイズなど"""
+        with self._lock:
+            archives, zip_bytes = self._conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM archives').fetchone()
+            members, member_bytes = self._conn.execute('SELECT COUNT(*), COALESCE(SUM(file_size), 0) FROM members').fetchone()
+            blobs, stored_bytes = self._conn.execute('SELECT COUNT(*), COALESCE(SUM(stored_size), 0) FROM blobs').fetchone()
+        return {'archives': archives, 'zip_bytes': zip_bytes, 'members': members, 'member_bytes': member_bytes,
+                'blobs': blobs, 'stored_bytes': stored_bytes}
+
+
+class StoredArchive:
+    """
+    ブロブストアに保存した1日分のアーカイブを、ZipFile と同じ読み取り用のメソッドで扱う
+    (namelist / infolist / read / open)
+    """
+
+    def __init__(self, store, vendor, date_key, archive):
+        self.store = store
+        self.vendor = vendor
+        self.date = date_key
+        self.filename = archive
+        self._members = store.members(vendor, date_key)
+        self._by_name = {info.filename: location for info, location in self._members}
+
+    def namelist(self):
+        return [info.filename for info, _ in self._members]
+
+    def infolist(self):
+        return [info for info, _ in self._members]
+
+    def read(self, name):
+        if isinstance(name, ZipInfo):
+            name = name.filename
+        if name not in self._by_name:
+            raise KeyError(f"There is no item named {name!r} in the archive")
+        return self.store.read_blob(*self._by_name[name])
+
+    def open(self, name):
+        # ブロブは1つずつ圧縮しているため、メンバー全体を展開したバッファを返す
+        return io.BytesIO(self.read(name))
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# プロセスごとに開く既定のブロブストア (フォークしたワーカーでは開き直す)
+_default_store = None
+_default_pid = None
+
+
+def default_store():
+    """既定のブロブストアを返す。まだ作成されていない場合はNone"""
+    global _default_store, _default_pid
+    if _default_store is None or _default_pid != os.getpid():
+        if not os.path.exists(os.path.join(BLOB_DIR, 'index.db')):
+            return None
+        _default_store = BlobStore(BLOB_DIR)
+        _default_pid = os.getpid()
+    return _default_store
+
+
+def _find_stored(zip_path):
+    store = default_store()
+    if store is None:
+        return None, None
+    vendor = os.path.basename(os.path.dirname(zip_path))
+    return store, store.find(vendor, os.path.basename(zip_path))
+
+
+def open_archive(zip_path):
+    """
+    アーカイブを読み取り用に開く。ZIPがあればZipFile、ブロブストアに保存されていれば StoredArchive を返す。
+    (ブロブストアはZIPのパスのベンダーのディレクトリ名とファイル名で検索する)
+    """
+    if os.path.exists(zip_path):
+        return ZipFile(zip_path, 'r')
+    store, record = _find_stored(zip_path)
+    if record is None:
+        raise FileNotFoundError(f"No such archive: {zip_path}")
+    return StoredArchive(store, record['vendor'], record['date'], record['archive'])
+
+
+def archive_exists(zip_path):
+    """ZIPまたはブロブストアにアーカイブがあるか"""
+    return os.path.exists(zip_path) or _find_stored(zip_path)[1] is not None
+
+
+def archive_mtime(zip_path):
+    """アーカイブの更新時刻 (ブロブストアの場合は保存した時点のZIPの更新時刻)"""
+    if os.path.exists(zip_path):
+        return os.path.getmtime(zip_path)
+    _, record = _find_stored(zip_path)
+    if record is None:
+        raise FileNotFoundError(f"No such archive: {zip_path}")
+    return record['mtime']
+
+
+def compact_archives(store, vendors=None, start=None, end=None, remove=False, keep_days=0, download_dir=BASE_DIR,
+                     force=False):
+    """
+    ダウンロード済みのZIPをブロブストアに保存する。
+    保存済みのアーカイブとファイル名・サイズ・更新時刻が同じZIPは読まない (force=True の場合はすべて保存し直す)。
+    remove=True の場合、読み戻して確認した後で keep_days 日より前の日付のZIPを削除する
+    (直近の日付は download_pcfs.py の再検証でZIPを使うため残す)。
+    """
+    remove_before = (datetime.now() - timedelta(days=keep_days)).strftime('%Y-%m-%d')
+    totals = {'archives': 0, 'members': 0, 'size': 0, 'stored': 0, 'removed': 0, 'unchanged': 0}
+    for vendor in VENDORS:
+        if vendors is not None and vendor not in vendors:
+            continue
+        vendor_dir = os.path.join(download_dir, vendor)
+        if not os.path.isdir(vendor_dir):
+            continue
+        for file_name in sorted(os.listdir(vendor_dir)):
+            if not file_name.endswith('.zip'):
+                continue
+            d = archive_date(vendor, file_name)
+            if d is None:
+                continue
+            date_key = d.strftime('%Y-%m-%d')
+            if (start and date_key < start) or (end and date_key > end):
+                continue
+            zip_path = os.path.join(vendor_dir, file_name)
+            record = store.find(vendor, file_name)
+            if (not force and record is not None and record['date'] == date_key
+                    and record['size'] == os.path.getsize(zip_path) and record['mtime'] == os.path.getmtime(zip_path)):
+                totals['unchanged'] += 1
+            else:
+                try:
+                    result = store.compact(vendor, date_key, zip_path)
+                except Exception as e:
+                    logging.error(f"Failed to compact {zip_path}: {e}")
+                    continue
+                totals['archives'] += 1
+                for key in ['members', 'size', 'stored']:
+                    totals[key] += result[key]
+                logging.info(f"Compacted {zip_path}: {result['members']} members, {result['stored']:,} new bytes stored")
+            if remove and date_key < remove_before:
+                if store.verify(vendor, date_key):
+                    os.remove(zip_path)
+                    totals['removed'] += 1
+                else:
+                    logging.error(f"Stored members of {zip_path} do not match the archive. Keeping the ZIP.")
+    return totals
+
+
+def restore_archive(store, vendor, date_key, out_path):
+    """保存したメンバーからZIPを作り直す (メンバーの順序と内容は元のZIPと同じ)"""
+    tmp_path = out_path + '.tmp'
+    with ZipFile(tmp_path, 'w', ZIP_DEFLATED) as zf:
+        for info, location in store.members(vendor, date_key):
+            zf.writestr(ZipInfo(info.filename, info.date_time), store.read_blob(*location), ZIP_DEFLATED)
+    os.replace(tmp_path, out_path)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Store downloaded PCF archives as deduplicated, compressed per-file blobs.")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('compact', help="Split downloaded ZIP archives into the blob store.")
+    p.add_argument("--vendors", nargs='+', choices=sorted(VENDORS), default=None, help="Vendors to compact (default: all).")
+    p.add_argument("--from", dest="start", default=None, help="First date to compact (YYYY-MM-DD).")
+    p.add_argument("--to", dest="end", default=None, help="Last date to compact (YYYY-MM-DD).")
+    p.add_argument("--remove-archives", action='store_true',
+                   help="Delete each ZIP after its members have been stored and verified.")
+    p.add_argument("--keep-days", type=int, default=7,
+                   help="With --remove-archives, keep the ZIPs of the last N days (default: 7).")
+    p.add_argument("--codec", choices=['zstd', 'zlib'], default=DEFAULT_CODEC,
+                   help=f"Compression for new blobs (default: {DEFAULT_CODEC}).")
+    p.add_argument("--force", action='store_true',
+                   help="Re-read every ZIP, including those already stored with the same size and modification time.")
+
+    p = sub.add_parser('cat', help="Write one stored CSV file to standard output.")
+    p.add_argument("vendor", choices=sorted(VENDORS))
+    p.add_argument("date", help="Archive date (YYYY-MM-DD).")
+    p.add_argument("name", help="Member file name, e.g. 1306tsepcf_Dec042025.csv.")
+
+    p = sub.add_parser('restore', help="Rebuild a ZIP archive from the blob store.")
+    p.add_argument("vendor", choices=sorted(VENDORS))
+    p.add_argument("date", help="Archive date (YYYY-MM-DD).")
+    p.add_argument("output", help="Path of the ZIP file to write.")
+
+    sub.add_parser('prune', help="Delete blobs that no archive refers to and reclaim unreferenced pack bytes.")
+    sub.add_parser('stats', help="Show how much space the blob store uses.")
+    args = parser.parse_args()
+
+    with BlobStore(BLOB_DIR, getattr(args, 'codec', DEFAULT_CODEC)) as store:
+        if args.command == 'compact':
+            totals = compact_archives(store, args.vendors, args.start, args.end, args.remove_archives, args.keep_days,
+                                      force=args.force)
+            logging.info(f"{totals['archives']} archive(s), {totals['members']} member(s): "
+                         f"{totals['size']:,} ZIP bytes, {totals['stored']:,} new blob bytes, "
+                         f"{totals['unchanged']} unchanged archive(s) skipped, {totals['removed']} ZIP(s) removed")
+        elif args.command == 'cat':
+            sys.stdout.buffer.write(store.read_member(args.vendor, args.date, args.name))
+        elif args.command == 'restore':
+            restore_archive(store, args.vendor, args.date, args.output)
+        elif args.command == 'prune':
+            totals = store.prune()
+            logging.info(f"Removed {totals['blobs']} unreferenced blob(s), reclaimed {totals['bytes']:,} pack bytes.")
+        else:
+            s = store.stats()
+            print(f"{s['archives']:,} archives, {s['members']:,} members -> {s['blobs']:,} unique blobs")
+            print(f"ZIP archives: {s['zip_bytes']:,} bytes, uncompressed members: {s['member_bytes']:,} bytes, "
+                  f"blob store: {s['stored_bytes']:,} bytes")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,256 @@
+import os
+import glob
+import time
+import logging
+import argparse
+from datetime import date
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+
+from pcf_schema import (
+    BASE_COLUMNS, HOLDING_COLUMNS, BASE_VALUATION_COLUMNS, VALUATION_COLUMNS, ISIN_LENGTH, CATEGORY_COLUMNS,
+    INTEGER_COLUMNS, exact_integers,
+)
+
+# 解析結果を型付きの列指向ファイル (Parquet または Arrow IPC) に保存・読み込みする。
+# 保存先は Fund_Date と source で分割する:
+#   data/columnar/parquet/holdings/Fund_Date=2025-12-05/source=ice/part-2025-12-05-0.parquet
+# ファイル名には解析対象の日付 (ダウンロード日) を含め、同じ日付を再解析する際は clear_run() で以前のファイルを削除する。
+# 評価額の列 (pcf_schema の BASE_VALUATION_COLUMNS・VALUATION_COLUMNS) も保存し、read_run() で1回の解析分を
+# 検証・逆引き索引に使える形で読み戻せるようにする (これらの列のない以前のファイルは欠損として読む)。
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(script_dir)
+
+COLUMNAR_DIR = os.path.join(project_root, 'data', 'columnar')
+
+# 形式 -> (pyarrow.dataset の形式名, 拡張子)
+FORMATS = {
+    'parquet': ('parquet', 'parquet'),
+    'arrow': ('ipc', 'arrow'),
+}
+
+PARTITIONING = ds.partitioning(
+    pa.schema([('Fund_Date', pa.date32()), ('source', pa.string())]), flavor='hive'
+)
+
+# 1行グループあたりの最大行数 (ETF_Code順に並べるため、ETFコードでの絞り込み時に行グループ単位で読み飛ばせる)
+ROW_GROUP_SIZE = 64 * 1024
+
+# create_table.sql の型に対応するArrowの型 (分割に使う列はファイルには含めない)
+TABLE_SCHEMAS = {
+    'base_info': pa.schema([
+        ('ETF_Code', pa.string()),
+        ('ETF_Name', pa.string()),
+        ('Cash_Component', pa.float64()),
+        ('Shares_Outstanding', pa.float64()),
+        *[(col, pa.float64()) for col in BASE_VALUATION_COLUMNS],
+    ]),
+    'holdings': pa.schema([
+        ('ETF_Code', pa.string()),
+        ('ISIN', pa.binary(ISIN_LENGTH)),
+        ('Local_Code', pa.string()),
+        ('Stock_Name', pa.string()),
+        ('Exchange', pa.string()),
+        ('Currency', pa.string()),
+        ('Shares_Amount', pa.float64()),
+        ('Stock_Price', pa.float64()),
+        *[(col, pa.float64()) for col in VALUATION_COLUMNS],
+    ]),
+}
+TABLE_COLUMNS = {'base_info': BASE_COLUMNS, 'holdings': HOLDING_COLUMNS}
+VALUATION_TABLE_COLUMNS = {'base_info': BASE_VALUATION_COLUMNS, 'holdings': VALUATION_COLUMNS}
+
+
+def _to_arrow(df, table):
+    """正規化済みのDataFrameをArrowのテーブルに変換する (分割に使う列を含む)"""
+    schema = TABLE_SCHEMAS[table]
+    arrays = {}
+    for field in schema:
+        if field.name not in df.columns:
+            # valuation=False で正規化した表には評価額の列がない
+            arrays[field.name] = pa.nulls(len(df), type=field.type)
+            continue
+        col = df[field.name]
+        if pa.types.is_fixed_size_binary(field.type):
+            values = [None if pd.isna(v) else v.encode('ascii', 'replace') for v in col]
+            arrays[field.name] = pa.array(values, type=field.type)
+        else:
+            arrays[field.name] = pa.array(col, type=field.type, from_pandas=True)
+    arrays['Fund_Date'] = pa.array(df['Fund_Date'].dt.date, type=pa.date32())
+    arrays['source'] = pa.array(df['source'], type=pa.string(), from_pandas=True)
+    return pa.table(arrays)
+
+
+def table_dir(table, fmt='parquet', base_dir=COLUMNAR_DIR):
+    """形式・テーブルごとの保存先ディレクトリ"""
+    return os.path.join(base_dir, fmt, table)
+
+
+def clear_run(table, run_date, fmt='parquet', base_dir=COLUMNAR_DIR, sources=None):
+    """
+    解析日 run_date に書き込んだファイルを削除する (再解析の前に呼ぶ)。
+    sources を指定した場合はそのベンダーの分割ディレクトリのみ対象にする。
+    """
+    removed = 0
+    pattern = os.path.join(table_dir(table, fmt, base_dir), 'Fund_Date=*', 'source=*', f"part-{run_date}-*")
+    for path in glob.glob(pattern):
+        source = os.path.basename(os.path.dirname(path)).split('=', 1)[1]
+        if sources is None or source in sources:
+            os.remove(path)
+            removed += 1
+    return removed
+
+
+def write_partitions(df, table, run_date, fmt='parquet', base_dir=COLUMNAR_DIR, part=None):
+    """
+    正規化済みのDataFrame (pcf_schema.normalize_base / normalize_holdings の結果) を
+    Fund_Date・source ごとに分割して保存する。書き込んだ行数を返す。
+    part: 同じ解析日に複数回に分けて書き込む場合の通し番号 (ファイル名に含める)
+    """
+    if df is None or df.empty:
+        return 0
+    ds_format, ext = FORMATS[fmt]
+    data = _to_arrow(df.sort_values(['Fund_Date', 'source', 'ETF_Code'], kind='stable'), table)
+    file_options = None
+    if ds_format == 'parquet':
+        file_options = ds.ParquetFileFormat().make_write_options(compression='zstd')
+    ds.write_dataset(
+        data,
+        table_dir(table, fmt, base_dir),
+        format=ds_format,
+        partitioning=PARTITIONING,
+        basename_template=f"part-{run_date}-{{i}}.{ext}" if part is None else f"part-{run_date}-{part}-{{i}}.{ext}",
+        existing_data_behavior='overwrite_or_ignore',
+        file_options=file_options,
+        max_rows_per_group=ROW_GROUP_SIZE,
+        min_rows_per_group=0,
+        # 並べ替えた順序のまま書き込む (行グループごとのETF_Codeの範囲を狭く保つため)
+        use_threads=False,
+    )
+    return data.num_rows
+
+
+def _to_date(d):
+    return d if isinstance(d, date) else pd.Timestamp(d).date()
+
+
+def _dataset(table, fmt, base_dir, paths=None):
+    """
+    保存先 (paths を指定した場合はそのファイルのみ) のデータセット。
+    スキーマを指定するため、評価額の列のない以前のファイルもその列を欠損として読める
+    """
+    schema = pa.schema(list(TABLE_SCHEMAS[table]) + list(PARTITIONING.schema))
+    root = table_dir(table, fmt, base_dir)
+    if paths is None:
+        return ds.dataset(root, schema=schema, format=FORMATS[fmt][0], partitioning=PARTITIONING)
+    return ds.dataset(paths, schema=schema, format=FORMATS[fmt][0], partitioning=PARTITIONING,
+                      partition_base_dir=root)
+
+
+def _to_frame(data):
+    """読み込んだArrowのテーブルをDataFrameにする (ISINは文字列、Fund_Dateは日時に戻す)"""
+    if 'ISIN' in data.column_names:
+        # 固定長のバイト列を文字列に戻す
+        i = data.column_names.index('ISIN')
+        data = data.set_column(i, 'ISIN', pc.cast(pc.cast(data['ISIN'], pa.binary()), pa.string()))
+    df = data.to_pandas()
+    if 'Fund_Date' in df.columns:
+        df['Fund_Date'] = pd.to_datetime(df['Fund_Date'])
+    return df
+
+
+def read_table(table, start=None, end=None, columns=None, sources=None, etf_codes=None,
+               fmt='parquet', base_dir=COLUMNAR_DIR, compact=False):
+    """
+    保存した解析結果を期間 (両端を含む) を指定して読み込み、DataFrameで返す。
+    - columns: 読み込む列 (None の場合は TABLE_COLUMNS。評価額の列は指定した場合のみ読む)。指定しない列はファイルから読まない
+    - sources / etf_codes: 指定した値の行のみ読む
+    - compact: pcf_schema.compact と同じ省メモリな型で返す (長期間の履歴をメモリ上に読み込む場合)
+    期間とsourceは分割ディレクトリ単位で、ETFコードは (Parquetの場合) 行グループの統計値で読み飛ばす。
+    """
+    path = table_dir(table, fmt, base_dir)
+    if not os.path.isdir(path):
+        return pd.DataFrame(columns=columns or TABLE_COLUMNS[table])
+    dataset = _dataset(table, fmt, base_dir)
+
+    conditions = []
+    if start is not None:
+        conditions.append(ds.field('Fund_Date') >= pa.scalar(_to_date(start), pa.date32()))
+    if end is not None:
+        conditions.append(ds.field('Fund_Date') <= pa.scalar(_to_date(end), pa.date32()))
+    if sources:
+        conditions.append(ds.field('source').isin(list(sources)))
+    if etf_codes:
+        conditions.append(ds.field('ETF_Code').isin([str(c) for c in etf_codes]))
+    condition = None
+    for c in conditions:
+        condition = c if condition is None else condition & c
+
+    columns = list(columns) if columns else TABLE_COLUMNS[table]
+    data = dataset.to_table(columns=columns, filter=condition)
+    if compact:
+        return _to_compact(data, table)
+    return _to_frame(data)
+
+
+def read_run(table, run_date, fmt='parquet', base_dir=COLUMNAR_DIR, exclude_sources=None):
+    """
+    解析日 run_date に書き込んだファイル (clear_run() の対象と同じ) を評価額の列も含めて読む。
+    exclude_sources: 読まないベンダー (一部のベンダーのみ解析し直した場合に、それ以外のベンダーの分を読むため)
+    ファイルがない場合は None を返す
+    """
+    pattern = os.path.join(table_dir(table, fmt, base_dir), 'Fund_Date=*', 'source=*', f"part-{run_date}-*")
+    paths = [path for path in sorted(glob.glob(pattern))
+             if os.path.basename(os.path.dirname(path)).split('=', 1)[1] not in (exclude_sources or [])]
+    if not paths:
+        return None
+    columns = TABLE_COLUMNS[table] + VALUATION_TABLE_COLUMNS[table]
+    return _to_frame(_dataset(table, fmt, base_dir, paths).to_table(columns=columns))
+
+
+def _to_compact(data, table):
+    """Arrowのテーブルを pcf_schema.compact と同じ型のDataFrameにする (文字列の列を展開せずにカテゴリ型にする)"""
+    if 'Fund_Date' in data.column_names:
+        i = data.column_names.index('Fund_Date')
+        data = data.set_column(i, 'Fund_Date', pc.cast(data['Fund_Date'], pa.int32()))
+    categories = [col for col in CATEGORY_COLUMNS[table] if col in data.column_names]
+    df = data.to_pandas(categories=categories, types_mapper={pa.binary(ISIN_LENGTH): pd.ArrowDtype(pa.binary(ISIN_LENGTH))}.get)
+    for col in categories:
+        df[col] = df[col].cat.set_categories(df[col].cat.categories.astype('string'))
+    for col in INTEGER_COLUMNS[table]:
+        if col in df.columns:
+            df[col] = exact_integers(df[col])
+    return df
+
+
+def read_base_info(start=None, end=None, **kwargs):
+    return read_table('base_info', start, end, **kwargs)
+
+
+def read_holdings(start=None, end=None, **kwargs):
+    return read_table('holdings', start, end, **kwargs)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Load parsed PCF data from the columnar store for a date range.")
+    parser.add_argument("table", choices=sorted(TABLE_SCHEMAS), help="Table to read.")
+    parser.add_argument("start", help="First Fund_Date to read (YYYY-MM-DD).")
+    parser.add_argument("end", help="Last Fund_Date to read (YYYY-MM-DD).")
+    parser.add_argument("--columns", nargs='+', default=None, help="Columns to read (default: all).")
+    parser.add_argument("--sources", nargs='+', default=None, help="Vendors to read (default: all).")
+    parser.add_argument("--etf-codes", nargs='+', default=None, help="ETF codes to read (default: all).")
+    parser.add_argument("--format", choices=sorted(FORMATS), default='parquet', help="Storage format (default: parquet).")
+    parser.add_argument("--dir", default=COLUMNAR_DIR, help=f"Columnar store directory (default: {COLUMNAR_DIR}).")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    df = read_table(args.table, args.start, args.end, columns=args.columns, sources=args.sources,
+                    etf_codes=args.etf_codes, fmt=args.format, base_dir=args.dir)
+    elapsed = time.perf_counter() - started
+    print(df.head().to_string())
+    print(f"{len(df):,} rows x {len(df.columns)} columns loaded in {elapsed:.2f}s")
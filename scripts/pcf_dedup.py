@@ -0,0 +1,212 @@
+import logging
+import argparse
+
+import numpy as np
+import pandas as pd
+
+# 複数のベンダーが同じ日の同じETFを公開した場合の重複の解消。
+# (Fund_Date, ETF_Code) ごとにベンダーの優先順位で1つのベンダーを選び、基本情報と保有銘柄をそのベンダーのものだけにする
+# (ベンダーをまたいで保有銘柄の行を混ぜない)。
+# ETFごとの内容のハッシュ (基本情報と保有銘柄の行のハッシュの和) を比べ、同じ内容の重複はそのまま捨て、
+# 内容の異なる重複は保有銘柄を (Fund_Date, ETF_Code, ISIN) で突き合わせた差分の要約を出力する。
+# すべて1日分の表全体に対する結合・集約で処理し、ETFごとのループは行わない。
+
+# 既定の優先順位 (parse_pcfs_by_date の出力でのベンダーの順序。従来の「先に出現した行を使う」と同じ結果になる)
+DEFAULT_PRIORITY = ['solactive', 'ice', 'ihs']
+
+FUND_KEY = ['Fund_Date', 'ETF_Code']
+
+# 内容の比較に使う列 (銘柄名や価格の表記はベンダーごとに異なるため、構成を表す列のみ)
+BASE_CONTENT_COLUMNS = ['Cash_Component', 'Shares_Outstanding']
+HOLDING_CONTENT_COLUMNS = ['ISIN', 'Shares_Amount']
+
+# 差分の要約の列
+REPORT_COLUMNS = [
+    'Fund_Date', 'ETF_Code', 'kept', 'dropped', 'identical', 'base_diff',
+    'kept_rows', 'dropped_rows', 'only_kept', 'only_dropped', 'shares_diff',
+]
+
+# ログに詳細を出力する内容の異なる重複の件数
+MAX_LOGGED = 20
+
+
+def parse_priority(value):
+    """'ice,ihs,solactive' のような文字列を優先順位のリストにする"""
+    if not value:
+        return list(DEFAULT_PRIORITY)
+    return [v.strip() for v in value.split(',') if v.strip()]
+
+
+def _rank(sources, priority):
+    """source ごとの優先順位 (小さいほど優先)。priority にないベンダーは最後 (ベンダー名の順)"""
+    order = {vendor: i for i, vendor in enumerate(priority)}
+    others = sorted(set(sources.dropna().unique()) - set(order))
+    order.update({vendor: len(priority) + i for i, vendor in enumerate(others)})
+    return sources.map(order).fillna(len(order)).astype('int64')
+
+
+def fund_hashes(base, holdings):
+    """
+    (Fund_Date, ETF_Code, source) ごとの内容のハッシュを返す。
+    戻り値の列: Fund_Date, ETF_Code, source, content_hash (uint64), holdings_rows
+    保有銘柄の行の順序によらず、同じ行の集合なら同じ値になる。
+    """
+    key = FUND_KEY + ['source']
+    funds = base[key].copy()
+    funds['content_hash'] = pd.util.hash_pandas_object(base[BASE_CONTENT_COLUMNS], index=False).to_numpy()
+    funds['holdings_rows'] = 0
+    if holdings is not None and not holdings.empty:
+        rows = holdings[key].copy()
+        rows['content_hash'] = pd.util.hash_pandas_object(holdings[HOLDING_CONTENT_COLUMNS], index=False).to_numpy()
+        rows['holdings_rows'] = 1
+        # uint64 の和 (桁あふれは2**64を法として扱われる) なので行の順序によらない
+        per_fund = rows.groupby(key, sort=False, dropna=False).sum()
+        # 保有銘柄のないETFを merge で欠損にすると float64 を経由して64ビットの和が丸められるため、uint64 のまま 0 で埋める
+        per_fund = per_fund.reindex(pd.MultiIndex.from_frame(funds[key]), fill_value=0)
+        funds['content_hash'] = funds['content_hash'].to_numpy() + per_fund['content_hash'].to_numpy(dtype='uint64')
+        funds['holdings_rows'] = per_fund['holdings_rows'].to_numpy(dtype='int64')
+    return funds.drop_duplicates(key)
+
+
+def _diff_summary(pairs, base, holdings):
+    """
+    内容の異なる重複 (残すベンダー kept と捨てるベンダー dropped の組) の差分を集計する。
+    保有銘柄は (Fund_Date, ETF_Code, ISIN) で外部結合し、片方にしかない銘柄と株数の異なる銘柄を数える。
+    """
+    report = pairs.copy()
+
+    # 基本情報の差分 (値の異なる列名)
+    values = base[FUND_KEY + ['source'] + BASE_CONTENT_COLUMNS]
+    joined = report[FUND_KEY + ['kept', 'dropped']].merge(
+        values.rename(columns={'source': 'kept'}), on=FUND_KEY + ['kept'], how='left'
+    ).merge(
+        values.rename(columns={'source': 'dropped'}), on=FUND_KEY + ['dropped'], how='left', suffixes=('', '_dropped')
+    )
+    base_diff = pd.Series('', index=joined.index, dtype=object)
+    for col in BASE_CONTENT_COLUMNS:
+        left, right = joined[col], joined[f'{col}_dropped']
+        differs = ~((left == right) | (left.isna() & right.isna()))
+        base_diff = base_diff + np.where(differs, f'{col},', '')
+    report['base_diff'] = base_diff.str.rstrip(',').to_numpy()
+
+    for col in ['only_kept', 'only_dropped', 'shares_diff']:
+        report[col] = 0
+    if holdings is None or holdings.empty:
+        return report[REPORT_COLUMNS]
+
+    rows = holdings[FUND_KEY + ['source', 'ISIN', 'Shares_Amount']]
+    rows = rows[rows['ISIN'].notna()].drop_duplicates(FUND_KEY + ['source', 'ISIN'])
+    kept = report[FUND_KEY + ['kept']].merge(rows.rename(columns={'source': 'kept'}), on=FUND_KEY + ['kept'])
+    dropped = report[FUND_KEY + ['dropped']].merge(rows.rename(columns={'source': 'dropped'}), on=FUND_KEY + ['dropped'])
+    both = kept.merge(dropped, on=FUND_KEY + ['ISIN'], how='outer', suffixes=('_kept', '_dropped'), indicator=True)
+    both['only_kept'] = both['_merge'] == 'left_only'
+    both['only_dropped'] = both['_merge'] == 'right_only'
+    both['shares_diff'] = (both['_merge'] == 'both') & ~(
+        (both['Shares_Amount_kept'] == both['Shares_Amount_dropped'])
+        | (both['Shares_Amount_kept'].isna() & both['Shares_Amount_dropped'].isna())
+    )
+    counts = both.groupby(FUND_KEY)[['only_kept', 'only_dropped', 'shares_diff']].sum()
+    report = report.drop(columns=['only_kept', 'only_dropped', 'shares_diff']).merge(
+        counts, left_on=FUND_KEY, right_index=True, how='left'
+    )
+    for col in ['only_kept', 'only_dropped', 'shares_diff']:
+        report[col] = report[col].fillna(0).astype('int64')
+    return report[REPORT_COLUMNS]
+
+
+def resolve_duplicates(base, holdings, priority=None):
+    """
+    正規化済みの1日分 (またはそれ以上) の解析結果から、ベンダーをまたいだ重複を除く。
+    priority: ベンダーの優先順位 (None の場合は DEFAULT_PRIORITY)
+    戻り値: (基本情報, 保有銘柄, 重複の一覧 (REPORT_COLUMNS)。重複がない場合は空の表)
+    """
+    empty_report = pd.DataFrame(columns=REPORT_COLUMNS)
+    if base is None or base.empty:
+        return base, holdings, empty_report
+    funds = base[FUND_KEY + ['source']].drop_duplicates()
+    duplicated = funds.duplicated(FUND_KEY, keep=False)
+    if not duplicated.any():
+        return base, holdings, empty_report
+
+    # 重複のあるETFについてのみハッシュを計算する
+    dup_keys = funds.loc[duplicated, FUND_KEY].drop_duplicates()
+    dup_base = base.merge(dup_keys, on=FUND_KEY)
+    dup_holdings = holdings.merge(dup_keys, on=FUND_KEY) if holdings is not None and not holdings.empty else None
+    hashes = fund_hashes(dup_base, dup_holdings)
+    hashes['rank'] = _rank(hashes['source'], priority or DEFAULT_PRIORITY)
+    hashes = hashes.sort_values(FUND_KEY + ['rank'], kind='stable')
+
+    first = ~hashes.duplicated(FUND_KEY, keep='first')
+    winners = hashes[first].drop(columns='rank')
+    losers = hashes[~first].drop(columns='rank')
+    pairs = losers.merge(winners, on=FUND_KEY, suffixes=('_dropped', '_kept')).rename(
+        columns={'source_kept': 'kept', 'source_dropped': 'dropped',
+                 'holdings_rows_kept': 'kept_rows', 'holdings_rows_dropped': 'dropped_rows'}
+    )
+    pairs['identical'] = pairs['content_hash_kept'] == pairs['content_hash_dropped']
+
+    # 捨てるベンダーの行を除く (Fund_Date, ETF_Code, source での反結合)
+    dropped_keys = pairs[FUND_KEY + ['dropped']].rename(columns={'dropped': 'source'})
+    base = _anti_join(base, dropped_keys)
+    if holdings is not None and not holdings.empty:
+        holdings = _anti_join(holdings, dropped_keys)
+
+    divergent = pairs[~pairs['identical']]
+    report = pd.concat([
+        pairs[pairs['identical']].assign(base_diff='', only_kept=0, only_dropped=0, shares_diff=0)[REPORT_COLUMNS],
+        _diff_summary(divergent, dup_base, dup_holdings) if not divergent.empty else empty_report,
+    ], ignore_index=True).sort_values(FUND_KEY, kind='stable').reset_index(drop=True)
+    _log_report(report)
+    return base, holdings, report
+
+
+def _anti_join(df, keys):
+    marked = df.merge(keys.assign(_drop=True), on=list(keys.columns), how='left')
+    return df[marked['_drop'].isna().to_numpy()].reset_index(drop=True)
+
+
+def _log_report(report):
+    identical = int(report['identical'].sum())
+    divergent = report[~report['identical'].astype(bool)]
+    logging.info(f"Resolved {len(report)} duplicate ETF copies across vendors "
+                 f"({identical} identical, {len(divergent)} divergent)")
+    for row in divergent.head(MAX_LOGGED).itertuples(index=False):
+        logging.warning(
+            f"Divergent copies of {row.ETF_Code} on {pd.Timestamp(row.Fund_Date).date()}: kept {row.kept} "
+            f"({row.kept_rows} rows), dropped {row.dropped} ({row.dropped_rows} rows); "
+            f"base differs in [{row.base_diff}], {row.only_kept} ISINs only in {row.kept}, "
+            f"{row.only_dropped} only in {row.dropped}, {row.shares_diff} share amounts differ"
+        )
+    if len(divergent) > MAX_LOGGED:
+        logging.warning(f"... and {len(divergent) - MAX_LOGGED} more divergent copies")
+
+
+def main():
+    from load_pcfs import read_parsed_csv
+
+    parser = argparse.ArgumentParser(description="Report ETFs published by more than one vendor in the parsed output.")
+    parser.add_argument("dates", nargs='+', help="Parse dates whose CSV output to check (YYYY-MM-DD).")
+    parser.add_argument("--vendor-priority", help=f"Comma-separated vendor priority (default: {','.join(DEFAULT_PRIORITY)}).")
+    parser.add_argument("--data-dir", default='data', help="Directory containing the parsed output (default: data).")
+    parser.add_argument("--output", help="Write the duplicate report to this CSV file.")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    priority = parse_priority(args.vendor_priority)
+    reports = []
+    for d in args.dates:
+        base, holdings = read_parsed_csv(d, args.data_dir)
+        if base is None:
+            logging.warning(f"No parsed data found for {d}")
+            continue
+        _, _, report = resolve_duplicates(base, holdings, priority)
+        if report.empty:
+            logging.info(f"{d}: no ETF is published by more than one vendor")
+        reports.append(report)
+    if args.output and reports:
+        pd.concat(reports, ignore_index=True).to_csv(args.output, index=False, encoding='utf-8-sig')
+        logging.info(f"Duplicate report saved to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
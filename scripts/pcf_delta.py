@@ -0,0 +1,336 @@
+import os
+import glob
+import time
+import logging
+import argparse
+
+import pandas as pd
+
+from pcf_dedup import resolve_duplicates, parse_priority, DEFAULT_PRIORITY
+
+# ETFごとのバスケット (保有銘柄と株数) と基本情報 (現金部分・発行済口数) の日次の差分。
+# 1日分の解析結果を「状態」(ETFごとの最新の Fund_Date の基本情報と保有銘柄) と比べ、
+# 追加・削除された銘柄と株数の変わった銘柄だけを差分ファイルに書く。
+# ある日の状態は、それ以前の最新のスナップショット (全体) に差分を順に適用して復元する。
+#   data/deltas/snapshot_<日付>_funds.parquet / snapshot_<日付>_positions.parquet
+#   data/deltas/delta_<日付>_funds.parquet    / delta_<日付>_positions.parquet
+# 日付は入力の日付 (CSVの場合は解析日、列指向ストアの場合は Fund_Date)。
+# ETFごとに前回の Fund_Date より新しいものだけを比べるため、その日に公開されなかったETFは前回の状態が続く。
+# 比較はすべて1日分の表全体の結合 (ETF_Code, Position_Key) で行い、ETFごとのループは行わない。
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(script_dir)
+
+DELTA_DIR = os.path.join(project_root, 'data', 'deltas')
+
+# 状態の列
+FUND_COLUMNS = ['ETF_Code', 'Fund_Date', 'Cash_Component', 'Shares_Outstanding', 'source']
+POSITION_COLUMNS = ['ETF_Code', 'Position_Key', 'ISIN', 'Shares_Amount']
+
+# 差分の列 (Prev_ は前回の Fund_Date の値。新しいETF・追加された銘柄では欠損)
+FUND_DELTA_COLUMNS = [
+    'ETF_Code', 'Fund_Date', 'Prev_Date', 'Cash_Component', 'Shares_Outstanding', 'source',
+    'Prev_Cash_Component', 'Prev_Shares_Outstanding', 'Added', 'Removed', 'Changed',
+]
+POSITION_DELTA_COLUMNS = ['ETF_Code', 'Fund_Date', 'Position_Key', 'ISIN', 'Change', 'Shares_Amount', 'Prev_Shares_Amount']
+
+CHANGES = ['added', 'removed', 'changed']
+
+PARQUET_OPTIONS = {'engine': 'pyarrow', 'compression': 'zstd', 'index': False}
+
+
+def _differs(left, right):
+    """欠損どうしは等しいとみなした比較"""
+    return ~((left == right) | (left.isna() & right.isna()))
+
+
+def position_keys(holdings):
+    """
+    保有銘柄を識別するキー。ISINがあればISIN、なければ銘柄コード ('L:'付き)、それもなければ銘柄名 ('N:'付き)
+    (先物・現金などISINのない行のため)
+    """
+    key = holdings['ISIN'].astype('string')
+    key = key.fillna('L:' + holdings['Local_Code'].astype('string'))
+    key = key.fillna('N:' + holdings['Stock_Name'].astype('string'))
+    return key.fillna('')
+
+
+def day_state(base, holdings, priority=None):
+    """
+    正規化済みの1日分の解析結果を状態の形 (FUND_COLUMNS, POSITION_COLUMNS) にする。
+    複数ベンダーの重複は pcf_dedup で解消し、1つのETFに複数の Fund_Date がある場合は新しいものを使う。
+    同じキーの保有銘柄が複数ある場合は HOLDING_DETAIL と同じく先の行を使う。
+    """
+    base, holdings, _ = resolve_duplicates(base, holdings, priority)
+    funds = base.sort_values('Fund_Date', ascending=False, kind='stable').drop_duplicates('ETF_Code')
+    funds = funds[FUND_COLUMNS].sort_values('ETF_Code').reset_index(drop=True)
+    if holdings is None or holdings.empty:
+        return funds, _empty_positions()
+    holdings = holdings.merge(funds[['ETF_Code', 'Fund_Date', 'source']], on=['ETF_Code', 'Fund_Date', 'source'])
+    positions = holdings.assign(Position_Key=position_keys(holdings))
+    positions = positions.drop_duplicates(['ETF_Code', 'Position_Key'])[POSITION_COLUMNS]
+    return funds, _sort_positions(positions)
+
+
+def _empty_positions():
+    return pd.DataFrame({
+        'ETF_Code': pd.Series(dtype='string'), 'Position_Key': pd.Series(dtype='string'),
+        'ISIN': pd.Series(dtype='string'), 'Shares_Amount': pd.Series(dtype='float64'),
+    })
+
+
+def _sort_positions(positions):
+    return positions.sort_values(['ETF_Code', 'Position_Key'], kind='stable').reset_index(drop=True)
+
+
+def compute_delta(state, day):
+    """
+    状態 state と1日分の状態 day (いずれも (funds, positions)) の差分を求める。
+    前回より新しい Fund_Date のETFだけを比べ、戻り値は (ETFごとの差分, 銘柄ごとの差分)。
+    """
+    state_funds, state_positions = state
+    day_funds, day_positions = day
+
+    funds = day_funds.merge(state_funds, on='ETF_Code', how='left', suffixes=('', '_prev'))
+    updated = funds['Fund_Date_prev'].isna() | (funds['Fund_Date'] > funds['Fund_Date_prev'])
+    stale = int((~updated).sum() - (funds['Fund_Date'] == funds['Fund_Date_prev']).sum())
+    if stale:
+        logging.warning(f"Ignored {stale} ETFs whose Fund_Date is older than the current state")
+    funds = funds[updated]
+    codes = funds['ETF_Code']
+
+    old = state_positions[state_positions['ETF_Code'].isin(codes)]
+    new = day_positions[day_positions['ETF_Code'].isin(codes)]
+    both = old.merge(new, on=['ETF_Code', 'Position_Key'], how='outer', suffixes=('_prev', ''), indicator=True)
+    change = pd.Series(pd.NA, index=both.index, dtype='string')
+    change[both['_merge'] == 'right_only'] = 'added'
+    change[both['_merge'] == 'left_only'] = 'removed'
+    change[(both['_merge'] == 'both') & (
+        _differs(both['Shares_Amount'], both['Shares_Amount_prev']) | _differs(both['ISIN'], both['ISIN_prev'])
+    )] = 'changed'
+    both['Change'] = change
+    positions = both[change.notna()].rename(columns={'Shares_Amount_prev': 'Prev_Shares_Amount'})
+    positions['ISIN'] = positions['ISIN'].fillna(positions['ISIN_prev'])
+    positions = positions.merge(funds[['ETF_Code', 'Fund_Date']], on='ETF_Code')
+
+    counts = pd.crosstab(positions['ETF_Code'], positions['Change']).reindex(columns=CHANGES, fill_value=0)
+    counts.columns = ['Added', 'Removed', 'Changed']
+    funds = funds.rename(columns={
+        'Fund_Date_prev': 'Prev_Date', 'Cash_Component_prev': 'Prev_Cash_Component',
+        'Shares_Outstanding_prev': 'Prev_Shares_Outstanding',
+    }).merge(counts, left_on='ETF_Code', right_index=True, how='left')
+    for col in ['Added', 'Removed', 'Changed']:
+        funds[col] = funds[col].fillna(0).astype('int64')
+    return (funds[FUND_DELTA_COLUMNS].reset_index(drop=True),
+            _sort_positions(positions[POSITION_DELTA_COLUMNS]))
+
+
+def apply_delta(state, delta):
+    """状態に差分を適用した新しい状態を返す"""
+    state_funds, state_positions = state
+    fund_delta, position_delta = delta
+    funds = pd.concat([
+        state_funds[~state_funds['ETF_Code'].isin(fund_delta['ETF_Code'])],
+        fund_delta[FUND_COLUMNS],
+    ], ignore_index=True).sort_values('ETF_Code').reset_index(drop=True)
+
+    touched = position_delta[['ETF_Code', 'Position_Key']].assign(_touched=True)
+    marked = state_positions.merge(touched, on=['ETF_Code', 'Position_Key'], how='left')
+    kept = state_positions[marked['_touched'].isna().to_numpy()]
+    upserts = position_delta.loc[position_delta['Change'] != 'removed', POSITION_COLUMNS]
+    return funds, _sort_positions(pd.concat([kept, upserts], ignore_index=True))
+
+
+def _path(kind, date_str, part, delta_dir=DELTA_DIR):
+    return os.path.join(delta_dir, f"{kind}_{date_str}_{part}.parquet")
+
+
+def _write(df, path):
+    tmp_path = path + '.tmp'
+    df.to_parquet(tmp_path, **PARQUET_OPTIONS)
+    os.replace(tmp_path, path)
+
+
+def _read(path, columns=None):
+    df = pd.read_parquet(path, columns=columns)
+    for col in ('Fund_Date', 'Prev_Date'):
+        if col in df.columns:
+            df[col] = df[col].astype('datetime64[ns]')
+    return df
+
+
+def save_snapshot(state, date_str, delta_dir=DELTA_DIR):
+    os.makedirs(delta_dir, exist_ok=True)
+    _write(state[0], _path('snapshot', date_str, 'funds', delta_dir))
+    _write(state[1], _path('snapshot', date_str, 'positions', delta_dir))
+
+
+def save_delta(delta, date_str, delta_dir=DELTA_DIR):
+    os.makedirs(delta_dir, exist_ok=True)
+    _write(delta[0], _path('delta', date_str, 'funds', delta_dir))
+    _write(delta[1], _path('delta', date_str, 'positions', delta_dir))
+
+
+def list_dates(kind, delta_dir=DELTA_DIR, start=None, end=None):
+    """保存済みのスナップショット ('snapshot') または差分 ('delta') の日付 (昇順)"""
+    dates = sorted(
+        os.path.basename(path)[len(kind) + 1:-len('_funds.parquet')]
+        for path in glob.glob(os.path.join(delta_dir, f"{kind}_*_funds.parquet"))
+    )
+    return [d for d in dates if (start is None or d >= start) and (end is None or d <= end)]
+
+
+def rebuild(as_of, delta_dir=DELTA_DIR):
+    """
+    as_of 以前の最新のスナップショットに as_of までの差分を適用した状態を返す。
+    戻り値: (funds, positions, 状態の日付)。as_of 以前のスナップショットがない場合は None
+    """
+    snapshots = list_dates('snapshot', delta_dir, end=as_of)
+    if not snapshots:
+        return None
+    snapshot = snapshots[-1]
+    state = (_read(_path('snapshot', snapshot, 'funds', delta_dir)),
+             _read(_path('snapshot', snapshot, 'positions', delta_dir)))
+    applied = snapshot
+    for d in list_dates('delta', delta_dir, end=as_of):
+        if d <= snapshot:
+            continue
+        state = apply_delta(state, (_read(_path('delta', d, 'funds', delta_dir)),
+                                    _read(_path('delta', d, 'positions', delta_dir))))
+        applied = d
+    return state[0], state[1], applied
+
+
+def _same_state(a, b):
+    return all(x.reset_index(drop=True).equals(y.reset_index(drop=True)) for x, y in zip(a, b))
+
+
+def build(dates, input_format='csv', data_dir='data', delta_dir=DELTA_DIR, priority=None, snapshot_every=0, verify=False):
+    """
+    日付の昇順に1日分ずつ差分を計算して保存する。
+    最初の日付より前の状態が保存されていればそこから続け、なければ最初の日付をスナップショットにする。
+    snapshot_every: N日ごとに差分に加えてスナップショットも保存する (0 の場合は最初のみ)
+    verify: 差分を適用した状態がその日の状態と一致するか確認する
+    """
+    from load_pcfs import read_parsed_csv, read_parsed_columnar
+
+    dates = sorted(dates)
+    previous = [d for d in list_dates('snapshot', delta_dir) + list_dates('delta', delta_dir) if d < dates[0]]
+    restored = rebuild(max(previous), delta_dir) if previous else None
+    state = restored[:2] if restored else None
+    since_snapshot = 0
+    for d in dates:
+        started = time.perf_counter()
+        if input_format == 'csv':
+            base, holdings = read_parsed_csv(d, data_dir)
+        else:
+            base, holdings = read_parsed_columnar(d, input_format, data_dir)
+        if base is None:
+            logging.warning(f"No parsed data found for {d}")
+            continue
+        day = day_state(base, holdings, priority)
+        if state is None:
+            state = day
+            save_snapshot(state, d, delta_dir)
+            logging.info(f"{d}: snapshot of {len(state[0])} ETFs, {len(state[1])} positions")
+            continue
+        delta = compute_delta(state, day)
+        state = apply_delta(state, delta)
+        save_delta(delta, d, delta_dir)
+        since_snapshot += 1
+        if snapshot_every and since_snapshot >= snapshot_every:
+            save_snapshot(state, d, delta_dir)
+            since_snapshot = 0
+        if verify:
+            codes = day[0]['ETF_Code']
+            current = (state[0][state[0]['ETF_Code'].isin(codes)], state[1][state[1]['ETF_Code'].isin(codes)])
+            if not _same_state(current, day):
+                logging.error(f"{d}: the state rebuilt from the delta does not match the parsed data")
+        fund_delta, position_delta = delta
+        counts = position_delta['Change'].value_counts()
+        logging.info(
+            f"{d}: {len(fund_delta)} ETFs updated, {int(counts.get('added', 0))} added / "
+            f"{int(counts.get('removed', 0))} removed / {int(counts.get('changed', 0))} changed positions "
+            f"in {time.perf_counter() - started:.2f}s"
+        )
+
+
+def read_changes(start=None, end=None, delta_dir=DELTA_DIR, etf_codes=None):
+    """期間内のETFごとの差分 (FUND_DELTA_COLUMNS と差分の日付 Delta_Date) を読む (保有銘柄の差分は読まない)"""
+    frames = []
+    for d in list_dates('delta', delta_dir, start, end):
+        df = _read(_path('delta', d, 'funds', delta_dir))
+        if etf_codes:
+            df = df[df['ETF_Code'].isin(etf_codes)]
+        frames.append(df.assign(Delta_Date=d))
+    if not frames:
+        return pd.DataFrame(columns=FUND_DELTA_COLUMNS + ['Delta_Date'])
+    return pd.concat(frames, ignore_index=True)
+
+
+def rebalances(changes, min_positions=1):
+    """保有銘柄の追加・削除・株数の変更が min_positions 件以上あった (ETF, Fund_Date) を返す"""
+    moved = changes['Added'] + changes['Removed'] + changes['Changed']
+    out = changes[moved >= min_positions].assign(Positions=moved)
+    return out.sort_values(['Fund_Date', 'ETF_Code']).reset_index(drop=True)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Keep day-over-day deltas of each ETF's basket and rebuild snapshots from them.")
+    parser.add_argument("--delta-dir", default=DELTA_DIR, help=f"Directory of the snapshot and delta files (default: {DELTA_DIR}).")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('build', help="Compute and save the delta of each date against the previous state.")
+    p.add_argument("dates", nargs='+', help="Dates to process in order (YYYY-MM-DD).")
+    p.add_argument("--input", choices=['csv', 'parquet', 'arrow'], default='csv',
+                   help="Read the CSV output of parse_pcfs_by_date.py for each parse date, or the columnar store "
+                        "for each Fund_Date (default: csv).")
+    p.add_argument("--data-dir", default='data', help="Directory containing the parsed output (default: data).")
+    p.add_argument("--vendor-priority",
+                   help=f"Comma-separated vendor priority for ETFs published by more than one vendor "
+                        f"(default: {','.join(DEFAULT_PRIORITY)}).")
+    p.add_argument("--snapshot-every", type=int, default=0,
+                   help="Also save a full snapshot every N dates (default: only the first date).")
+    p.add_argument("--verify", action='store_true', help="Check that applying each delta reproduces the parsed data.")
+
+    p = sub.add_parser('snapshot', help="Rebuild the holdings of every ETF as of a date.")
+    p.add_argument("date", help="Date to rebuild (YYYY-MM-DD).")
+    p.add_argument("--output", help="Write the positions to this CSV file (default: print a summary).")
+
+    p = sub.add_parser('changes', help="List basket changes (rebalances) from the per-ETF deltas.")
+    p.add_argument("start", help="First delta date (YYYY-MM-DD).")
+    p.add_argument("end", help="Last delta date (YYYY-MM-DD).")
+    p.add_argument("--etf", nargs='+', default=None, help="ETF codes to show (default: all).")
+    p.add_argument("--min-positions", type=int, default=1,
+                   help="Show dates with at least this many added, removed or changed positions (default: 1).")
+    p.add_argument("--output", help="Write the list to this CSV file.")
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        build(args.dates, args.input, args.data_dir, args.delta_dir, parse_priority(args.vendor_priority),
+              args.snapshot_every, args.verify)
+    elif args.command == 'snapshot':
+        rebuilt = rebuild(args.date, args.delta_dir)
+        if rebuilt is None:
+            logging.error(f"No snapshot on or before {args.date} in {args.delta_dir}")
+            return
+        funds, positions, applied = rebuilt
+        logging.info(f"Rebuilt {len(funds)} ETFs and {len(positions)} positions as of {applied}")
+        if args.output:
+            positions.merge(funds[['ETF_Code', 'Fund_Date']], on='ETF_Code').to_csv(
+                args.output, index=False, encoding='utf-8-sig')
+            logging.info(f"Positions saved to {args.output}")
+    else:
+        events = rebalances(read_changes(args.start, args.end, args.delta_dir, args.etf), args.min_positions)
+        if args.output:
+            events.to_csv(args.output, index=False, encoding='utf-8-sig')
+            logging.info(f"{len(events)} changes saved to {args.output}")
+        else:
+            for row in events.itertuples(index=False):
+                print(f"{pd.Timestamp(row.Fund_Date).date()} {row.ETF_Code:>6}: +{row.Added} -{row.Removed} "
+                      f"~{row.Changed} positions (previous {pd.Timestamp(row.Prev_Date).date() if pd.notna(row.Prev_Date) else '-'})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+import threading
+
+# PCF CSVファイルのエンコーディング判定
+# BOMと先頭のバイト列から1回だけ判定し、結果をアーカイブ単位でキャッシュする。
+# 判定が外れた場合のみ、従来どおり候補のエンコーディングを順に試す。
+
+# エンコーディングの試行リスト (判定できない場合はこの順に試す)
+ENCODINGS_TO_TRY = ['cp932', 'utf-8', 'sjis']
+
+UTF8_BOM = b'\xef\xbb\xbf'
+
+# 判定に使う先頭のバイト数
+SAMPLE_SIZE = 64 * 1024
+
+
+def sniff_encoding(data, sample_size=SAMPLE_SIZE):
+    """
+    BOMと先頭のバイト列からエンコーディングを推定する。
+    ASCII以外を含み、UTF-8として正しくデコードできる場合は 'utf-8'、それ以外は 'cp932'。
+    """
+    if data.startswith(UTF8_BOM):
+        return 'utf-8'
+    sample = data[:sample_size]
+    if sample.isascii():
+        return ENCODINGS_TO_TRY[0]
+    try:
+        sample.decode('utf-8')
+    except UnicodeDecodeError as e:
+        # サンプルの末尾で多バイト文字が途切れただけの場合はUTF-8とみなす
+        truncated = len(data) > len(sample) and e.start >= len(sample) - 3 and e.reason == 'unexpected end of data'
+        if not truncated:
+            return 'cp932'
+    return 'utf-8'
+
+
+class EncodingResolver:
+    """
+    キー (例: (ベンダー, アーカイブ)) ごとにエンコーディングの判定結果を保持する。
+    同じアーカイブ内のファイルは同じエンコーディングであることが多いため、
+    1つ目のファイルで判定した結果を以降のファイルにもそのまま使う。
+    """
+
+    def __init__(self):
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def candidates(self, key, data):
+        """
+        デコードを試す順にエンコーディングを返す。
+        先頭が判定結果 (キャッシュまたは推定)、残りはフォールバック用の候補。
+        """
+        with self._lock:
+            first = self._cache.get(key)
+        if first is None:
+            # ASCIIのみのファイルはどのエンコーディングでも同じ結果になるため、推定は最初の候補を返す
+            first = sniff_encoding(data)
+        return [first] + [enc for enc in ENCODINGS_TO_TRY if enc != first]
+
+    def confirm(self, key, encoding, data):
+        """デコードに成功したエンコーディングを記録する (ASCIIのみのファイルは判定材料にしない)"""
+        if data.isascii():
+            return
+        with self._lock:
+            self._cache[key] = encoding
+
+    def forget(self, key):
+        """アーカイブの処理が終わったらキャッシュを破棄する"""
+        with self._lock:
+            self._cache.pop(key, None)
+
+
+def encoding_candidates(data, sample_size=SAMPLE_SIZE):
+    """バイト列の先頭から判定したエンコーディングを先頭に、デコードを試す順にエンコーディングを返す"""
+    first = sniff_encoding(data, sample_size)
+    return [first] + [enc for enc in ENCODINGS_TO_TRY if enc != first]
+
+
+def resolve_file_encoding(path, sample_size=SAMPLE_SIZE):
+    """ファイルの先頭を読み、デコードを試す順にエンコーディングを返す"""
+    with open(path, 'rb') as f:
+        sample = f.read(sample_size + 1)
+    return encoding_candidates(sample, sample_size)
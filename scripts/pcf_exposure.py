@@ -0,0 +1,388 @@
+import os
+import glob
+import time
+import logging
+import argparse
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from pcf_dedup import resolve_duplicates, parse_priority, DEFAULT_PRIORITY
+from pcf_delta import position_keys
+from pcf_schema import market_values
+
+# ETF x 銘柄の疎行列による保有銘柄の合算 (ルックスルー)。
+# 1日分の保有銘柄から、行がETF・列が銘柄 (pcf_delta.position_keys のキー) の疎行列 (CSR) を3種類作る:
+#   shares    株数 (先物は枚数)
+#   value     評価額 (現地通貨)。'Market Value' があればその値、なければ 株数 x 価格 x 'Future multiplier'
+#   value_jpy 円換算の評価額。円建て以外は 'FX Rate' を掛ける (ない行は0として扱う)
+# 銘柄ごと・ETFごとの合計は行列の行・列の和、上位の保有ETFは列の取り出し (CSC) で求め、groupby は使わない。
+# 1日分の行列は data/exposure/exposure_<日付>.npz に保存し、複数日分は列 (銘柄) を揃えて縦に積んで扱う。
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(script_dir)
+
+EXPOSURE_DIR = os.path.join(project_root, 'data', 'exposure')
+
+MEASURES = ['shares', 'value', 'value_jpy']
+
+# 銘柄の属性 (行列の列ごと) と ETF の属性 (行ごと)
+SECURITY_COLUMNS = ['Security', 'ISIN', 'Local_Code', 'Stock_Name', 'Currency']
+ETF_COLUMNS = ['ETF_Code', 'Fund_Date', 'source']
+
+
+def load_holdings(target_date_str, input_format='csv', data_dir='data', priority=None):
+    """
+    1日分の正規化済みの保有銘柄 (評価額の列を含む) を読み、ベンダーの重複を解消して返す。
+    列指向ストアには評価額の列がないため、input_format が 'parquet' / 'arrow' の場合は価格と株数から求める。
+    """
+    from load_pcfs import read_parsed_csv, read_parsed_columnar
+    if input_format == 'csv':
+        base, holdings = read_parsed_csv(target_date_str, data_dir, valuation=True)
+    else:
+        base, holdings = read_parsed_columnar(target_date_str, input_format, data_dir)
+    if base is None or holdings is None:
+        return None
+    _, holdings, _ = resolve_duplicates(base, holdings, priority)
+    return holdings
+
+
+class ExposureMatrix:
+    """
+    1日分の ETF x 銘柄 の疎行列。
+    etfs: ETF_COLUMNS の表 (行列の行の順)、securities: SECURITY_COLUMNS の表 (列の順)
+    matrices: {MEASURES の名前: CSR行列}
+    """
+
+    def __init__(self, label, etfs, securities, matrices):
+        self.label = label
+        self.etfs = etfs.reset_index(drop=True)
+        self.securities = securities.reset_index(drop=True)
+        self.matrices = matrices
+        self._csc = {}
+
+    @classmethod
+    def from_holdings(cls, holdings, label):
+        """
+        保有銘柄の表から行列を作る。1つのETFに複数の Fund_Date がある場合は新しいものを使い、
+        同じ銘柄の行が複数ある場合は HOLDING_DETAIL と同じく先の行を使う。
+        ISIN・銘柄コード・銘柄名のいずれもない行 (ETFをまたいで同じ銘柄か判断できない) は含めない。
+        """
+        h = holdings[holdings['Fund_Date'] == holdings.groupby('ETF_Code')['Fund_Date'].transform('max')]
+        h = h.assign(Security=position_keys(h))
+        h = h[h['Security'] != ''].drop_duplicates(['ETF_Code', 'Security']).reset_index(drop=True)
+
+        shares = h['Shares_Amount'].astype('float64')
+        value, value_jpy = market_values(h, label)
+
+        rows, etf_codes = pd.factorize(h['ETF_Code'], sort=True)
+        cols, security_keys = pd.factorize(h['Security'], sort=True)
+        shape = (len(etf_codes), len(security_keys))
+        matrices = {}
+        for name, values in [('shares', shares), ('value', value), ('value_jpy', value_jpy)]:
+            data = values.fillna(0.0).to_numpy(dtype='float64')
+            m = sparse.csr_matrix((data, (rows, cols)), shape=shape)
+            m.eliminate_zeros()
+            matrices[name] = m
+
+        first = h.drop_duplicates('Security').set_index('Security')
+        securities = first.reindex(security_keys)[SECURITY_COLUMNS[1:]].rename_axis('Security').reset_index()
+        etfs = h.drop_duplicates('ETF_Code').set_index('ETF_Code').reindex(etf_codes)[ETF_COLUMNS[1:]]
+        etfs = etfs.rename_axis('ETF_Code').reset_index()
+        return cls(label, etfs, securities, matrices)
+
+    def _column_matrix(self, measure):
+        if measure not in self._csc:
+            self._csc[measure] = self.matrices[measure].tocsc()
+        return self._csc[measure]
+
+    def find_security(self, code):
+        """銘柄のキー・ISIN・銘柄コードのいずれかに一致する列の番号 (ない場合は None)"""
+        for col in ['Security', 'ISIN', 'Local_Code']:
+            match = np.flatnonzero((self.securities[col] == code).fillna(False).to_numpy())
+            if len(match):
+                return int(match[0])
+        return None
+
+    def by_stock(self, measure='value_jpy', free_float=None):
+        """
+        銘柄ごとのETF全体の保有 (株数・評価額・円換算額の合計と保有ETF数)。
+        free_float: ISIN (または銘柄コード) -> 浮動株数 の Series。指定した場合は Float_Ratio (株数 / 浮動株数) を付ける
+        """
+        out = self.securities.copy()
+        for name in MEASURES:
+            out[name] = np.asarray(self.matrices[name].sum(axis=0)).ravel()
+        out['holders'] = self.matrices['shares'].getnnz(axis=0)
+        if free_float is not None:
+            floats = out['ISIN'].map(free_float).fillna(out['Local_Code'].map(free_float)).astype('float64')
+            out['Float_Ratio'] = out['shares'] / floats
+        return out.sort_values(measure, ascending=False, kind='stable').reset_index(drop=True)
+
+    def by_etf(self, measure='value_jpy'):
+        """ETFごとの合計と銘柄数"""
+        out = self.etfs.copy()
+        for name in MEASURES:
+            out[name] = np.asarray(self.matrices[name].sum(axis=1)).ravel()
+        out['positions'] = self.matrices['shares'].getnnz(axis=1)
+        return out.sort_values(measure, ascending=False, kind='stable').reset_index(drop=True)
+
+    def weights(self, measure='value_jpy'):
+        """各ETFの中での銘柄の比率の行列 (行の和が1。合計が0のETFは0)"""
+        m = self.matrices[measure]
+        totals = np.asarray(m.sum(axis=1)).ravel()
+        scale = np.divide(1.0, totals, out=np.zeros_like(totals), where=totals != 0)
+        return sparse.diags(scale) @ m
+
+    def top_holders(self, code, n=10, measure='value_jpy'):
+        """
+        銘柄を保有するETFの上位 n 件。
+        Share: ETF全体の保有に占める比率、Weight: そのETFの中での比率
+        """
+        col = self.find_security(code)
+        if col is None:
+            return None
+        m = self._column_matrix(measure)
+        start, end = m.indptr[col], m.indptr[col + 1]
+        rows, values = m.indices[start:end], m.data[start:end]
+        order = np.argsort(-values, kind='stable')[:n]
+        rows, values = rows[order], values[order]
+        etf_totals = np.asarray(self.matrices[measure].sum(axis=1)).ravel()[rows]
+        shares = self._column_matrix('shares')
+        out = self.etfs.iloc[rows].reset_index(drop=True)
+        out['shares'] = np.asarray(shares[rows, col].todense()).ravel()
+        out[measure] = values
+        total = m.data[start:end].sum()
+        out['Share'] = values / total if total else np.nan
+        out['Weight'] = np.divide(values, etf_totals, out=np.full_like(values, np.nan), where=etf_totals != 0)
+        return out
+
+    def save(self, path):
+        """行列と行・列の属性を1つの .npz ファイルに保存する (pickle は使わない)"""
+        arrays = {}
+        for name, m in self.matrices.items():
+            arrays[f'{name}_data'] = m.data
+            arrays[f'{name}_indices'] = m.indices
+            arrays[f'{name}_indptr'] = m.indptr
+        for prefix, table in [('security', self.securities), ('etf', self.etfs)]:
+            for col in table.columns:
+                values = table[col]
+                if col == 'Fund_Date':
+                    arrays[f'{prefix}_{col}'] = values.to_numpy(dtype='datetime64[ns]')
+                else:
+                    arrays[f'{prefix}_{col}'] = values.astype('string').fillna('').to_numpy(dtype=str)
+        arrays['shape'] = np.array(self.matrices['shares'].shape)
+        arrays['label'] = np.array(self.label)
+        tmp_path = path + '.tmp.npz'
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as f:
+            shape = tuple(f['shape'])
+            matrices = {
+                name: sparse.csr_matrix((f[f'{name}_data'], f[f'{name}_indices'], f[f'{name}_indptr']), shape=shape)
+                for name in MEASURES
+            }
+            tables = {}
+            for prefix, columns in [('security', SECURITY_COLUMNS), ('etf', ETF_COLUMNS)]:
+                data = {}
+                for col in columns:
+                    values = f[f'{prefix}_{col}']
+                    if col == 'Fund_Date':
+                        data[col] = pd.Series(values, dtype='datetime64[ns]')
+                    else:
+                        text = pd.Series(values, dtype='string')
+                        data[col] = text.mask(text == '')
+                tables[prefix] = pd.DataFrame(data)
+            label = str(f['label'])
+        return cls(label, tables['etf'], tables['security'], matrices)
+
+
+class ExposureStack:
+    """
+    複数日分の ExposureMatrix を、列 (銘柄) を揃えて縦に積んだもの。
+    行は (日付, ETF)。日付ごとの合計は「日付 x 行」の0/1の疎行列との積で求める。
+    """
+
+    def __init__(self, days):
+        days = sorted(days, key=lambda day: day.label)
+        self.labels = [day.label for day in days]
+        securities = pd.concat([day.securities for day in days], ignore_index=True).drop_duplicates('Security')
+        self.securities = securities.sort_values('Security').reset_index(drop=True)
+        keys = pd.Index(self.securities['Security'])
+        self.etfs = pd.concat([day.etfs.assign(Date=day.label) for day in days], ignore_index=True)
+        self.matrices = {}
+        for name in MEASURES:
+            blocks = []
+            for day in days:
+                m = day.matrices[name]
+                remap = keys.get_indexer(day.securities['Security']).astype(m.indices.dtype)
+                blocks.append(sparse.csr_matrix((m.data, remap[m.indices], m.indptr), shape=(m.shape[0], len(keys))))
+            self.matrices[name] = sparse.vstack(blocks, format='csr')
+        day_rows = np.repeat(np.arange(len(days)), [len(day.etfs) for day in days])
+        self._days = sparse.csr_matrix(
+            (np.ones(len(day_rows)), (day_rows, np.arange(len(day_rows)))), shape=(len(days), len(day_rows))
+        )
+
+    def totals(self, measure='value_jpy'):
+        """日付 x 銘柄 の合計の疎行列"""
+        return (self._days @ self.matrices[measure]).tocsc()
+
+    def holders(self):
+        """日付 x 銘柄 の保有ETF数の疎行列"""
+        held = self.matrices['shares'].copy()
+        held.data = np.ones_like(held.data)
+        return (self._days @ held).tocsc()
+
+    def history(self, code):
+        """銘柄の日付ごとのETF全体の保有 (株数・評価額・円換算額・保有ETF数)。銘柄がない場合は None"""
+        keys = self.securities
+        col = None
+        for name in ['Security', 'ISIN', 'Local_Code']:
+            match = np.flatnonzero((keys[name] == code).fillna(False).to_numpy())
+            if len(match):
+                col = int(match[0])
+                break
+        if col is None:
+            return None
+        out = pd.DataFrame({'Date': self.labels})
+        for name in MEASURES:
+            out[name] = self.totals(name)[:, col].toarray().ravel()
+        out['holders'] = self.holders()[:, col].toarray().ravel().astype('int64')
+        return out
+
+
+def exposure_path(label, exposure_dir=EXPOSURE_DIR):
+    return os.path.join(exposure_dir, f"exposure_{label}.npz")
+
+
+def build_day(target_date_str, input_format='csv', data_dir='data', priority=None, exposure_dir=EXPOSURE_DIR):
+    """1日分の行列を作って保存する。解析結果がない場合は None"""
+    holdings = load_holdings(target_date_str, input_format, data_dir, priority)
+    if holdings is None or holdings.empty:
+        logging.warning(f"No parsed holdings found for {target_date_str}")
+        return None
+    exposure = ExposureMatrix.from_holdings(holdings, target_date_str)
+    os.makedirs(exposure_dir, exist_ok=True)
+    exposure.save(exposure_path(target_date_str, exposure_dir))
+    return exposure
+
+
+def load_day(target_date_str, exposure_dir=EXPOSURE_DIR, **build_options):
+    """保存済みの行列を読む。保存されていない場合は解析結果から作る"""
+    path = exposure_path(target_date_str, exposure_dir)
+    if os.path.exists(path):
+        return ExposureMatrix.load(path)
+    return build_day(target_date_str, exposure_dir=exposure_dir, **build_options)
+
+
+def load_stack(start=None, end=None, exposure_dir=EXPOSURE_DIR):
+    """保存済みの行列のうち日付が start から end のものを積む。該当がない場合は None"""
+    days = []
+    for path in sorted(glob.glob(os.path.join(exposure_dir, 'exposure_*.npz'))):
+        label = os.path.basename(path)[len('exposure_'):-len('.npz')]
+        if (start is None or label >= start) and (end is None or label <= end):
+            days.append(ExposureMatrix.load(path))
+    return ExposureStack(days) if days else None
+
+
+def _read_free_float(path):
+    """浮動株数のCSV (列: ISIN または Local_Code と Free_Float_Shares) を コード -> 浮動株数 にする"""
+    df = pd.read_csv(path, dtype=str, encoding='utf-8-sig')
+    code = df['ISIN'] if 'ISIN' in df.columns else df['Local_Code']
+    return pd.Series(pd.to_numeric(df['Free_Float_Shares'].str.replace(',', ''), errors='coerce').to_numpy(),
+                     index=code.str.strip())
+
+
+def _print_table(df, top):
+    with pd.option_context('display.width', 200, 'display.max_columns', 20, 'display.float_format', '{:,.2f}'.format):
+        print(df.head(top).to_string(index=False))
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Look-through exposure of ETF holdings with sparse ETF x security matrices.")
+    parser.add_argument("--exposure-dir", default=EXPOSURE_DIR, help=f"Directory of the saved matrices (default: {EXPOSURE_DIR}).")
+    parser.add_argument("--input", choices=['csv', 'parquet', 'arrow'], default='csv',
+                        help="Parsed output to build missing matrices from (default: csv).")
+    parser.add_argument("--data-dir", default='data', help="Directory containing the parsed output (default: data).")
+    parser.add_argument("--vendor-priority",
+                        help=f"Comma-separated vendor priority for ETFs published by more than one vendor "
+                             f"(default: {','.join(DEFAULT_PRIORITY)}).")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('build', help="Build and save the matrices of one or more dates.")
+    p.add_argument("dates", nargs='+', help="Dates to build (YYYY-MM-DD).")
+
+    p = sub.add_parser('stocks', help="Aggregate holdings by security.")
+    p.add_argument("date", help="Date (YYYY-MM-DD).")
+    p.add_argument("--measure", choices=MEASURES, default='value_jpy', help="Sort key (default: value_jpy).")
+    p.add_argument("--top", type=int, default=20, help="Rows to show (default: 20).")
+    p.add_argument("--free-float", help="CSV with ISIN (or Local_Code) and Free_Float_Shares columns.")
+    p.add_argument("--output", help="Write the full table to this CSV file.")
+
+    p = sub.add_parser('etfs', help="Aggregate holdings by ETF.")
+    p.add_argument("date", help="Date (YYYY-MM-DD).")
+    p.add_argument("--measure", choices=MEASURES, default='value_jpy', help="Sort key (default: value_jpy).")
+    p.add_argument("--top", type=int, default=20, help="Rows to show (default: 20).")
+    p.add_argument("--output", help="Write the full table to this CSV file.")
+
+    p = sub.add_parser('holders', help="Show the ETFs holding the most of one security.")
+    p.add_argument("date", help="Date (YYYY-MM-DD).")
+    p.add_argument("code", help="ISIN or local code, e.g. 7203.")
+    p.add_argument("--measure", choices=MEASURES, default='value_jpy', help="Sort key (default: value_jpy).")
+    p.add_argument("--top", type=int, default=10, help="Rows to show (default: 10).")
+
+    p = sub.add_parser('history', help="Show a security's aggregate ETF holdings for every saved date in a range.")
+    p.add_argument("code", help="ISIN or local code, e.g. 7203.")
+    p.add_argument("--from", dest="start", default=None, help="First date (YYYY-MM-DD).")
+    p.add_argument("--to", dest="end", default=None, help="Last date (YYYY-MM-DD).")
+    args = parser.parse_args()
+
+    options = {'input_format': args.input, 'data_dir': args.data_dir, 'priority': parse_priority(args.vendor_priority)}
+    if args.command == 'build':
+        for d in args.dates:
+            started = time.perf_counter()
+            exposure = build_day(d, exposure_dir=args.exposure_dir, **options)
+            if exposure is not None:
+                m = exposure.matrices['shares']
+                logging.info(f"{d}: {m.shape[0]} ETFs x {m.shape[1]} securities, {m.nnz} holdings "
+                             f"in {time.perf_counter() - started:.2f}s")
+        return
+    if args.command == 'history':
+        started = time.perf_counter()
+        stack = load_stack(args.start, args.end, args.exposure_dir)
+        if stack is None:
+            logging.error(f"No saved matrices in {args.exposure_dir}")
+            return
+        history = stack.history(args.code)
+        if history is None:
+            logging.error(f"{args.code} is not held by any ETF in the range")
+            return
+        _print_table(history, len(history))
+        logging.info(f"{len(stack.labels)} dates in {time.perf_counter() - started:.2f}s")
+        return
+
+    exposure = load_day(args.date, exposure_dir=args.exposure_dir, **options)
+    if exposure is None:
+        return
+    if args.command == 'stocks':
+        free_float = _read_free_float(args.free_float) if args.free_float else None
+        table = exposure.by_stock(args.measure, free_float)
+    elif args.command == 'etfs':
+        table = exposure.by_etf(args.measure)
+    else:
+        table = exposure.top_holders(args.code, args.top, args.measure)
+        if table is None:
+            logging.error(f"{args.code} is not held by any ETF on {args.date}")
+            return
+    if getattr(args, 'output', None):
+        table.to_csv(args.output, index=False, encoding='utf-8-sig')
+        logging.info(f"Saved {len(table)} rows to {args.output}")
+    _print_table(table, args.top)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,267 @@
+import os
+import mmap
+import time
+import shutil
+import struct
+import logging
+import argparse
+from bisect import bisect_left
+from collections import namedtuple
+from datetime import date, timedelta
+
+# 銘柄 (ISIN または銘柄コード) -> 保有するETF の逆引き索引。
+# 解析日ごとに data/index/holdings_<日付>.idx に保存し、最新の日付のものを data/index/latest.idx にも置く。
+# ファイルはソート済みの固定長の配列だけで構成し、mmap で開いて二分探索するため、
+# 検索にpandasは不要で、1回の検索で読むのはキーの比較に使う数十バイトと該当する保有ETFの行だけになる。
+#
+# ファイルの構成 (リトルエンディアン):
+#   ヘッダー   HEADER (マジック, ETF数, キー数, 保有の行数, 日付)
+#   ETF        ETF数 x ETF_RECORD (ETFコード 8バイト, Fund_Date の1970-01-01からの日数)
+#   キー       キー数 x KEY_SIZE バイト (ISIN または銘柄コードを NUL で埋めたもの。昇順)
+#   オフセット (キー数 + 1) x uint32 (キーごとの保有の行の開始位置)
+#   保有       保有の行数 x POSTING_RECORD (ETFの番号, 株数, ETF内の比率)。キーごとに比率の降順
+
+# 解析結果の出力先 (parse_pcfs_by_date.OUTPUT_DIR) の下に保存する
+INDEX_DIR = os.path.join('data', 'index')
+LATEST_NAME = 'latest.idx'
+
+MAGIC = b'PCFIDX01'
+HEADER = struct.Struct('<8sIII10s2x')
+ETF_RECORD = struct.Struct('<8si')
+POSTING_RECORD = struct.Struct('<Idd')
+OFFSET = struct.Struct('<I')
+KEY_SIZE = 12
+
+_EPOCH = date(1970, 1, 1)
+
+# 検索結果の1件 (weight はETFの円換算の評価額に占める比率。評価額が求められない場合は nan)
+Posting = namedtuple('Posting', ['etf_code', 'fund_date', 'shares', 'weight'])
+
+
+def index_path(target_date_str, index_dir=INDEX_DIR):
+    return os.path.join(index_dir, f"holdings_{target_date_str}.idx")
+
+
+def encode_key(code):
+    """検索キー (前後の空白を除いて大文字にしたもの) を KEY_SIZE バイトにする。使えない値は None"""
+    try:
+        key = str(code).strip().upper().encode('ascii')
+    except UnicodeEncodeError:
+        return None
+    if not key or len(key) > KEY_SIZE:
+        return None
+    return key.ljust(KEY_SIZE, b'\0')
+
+
+class HoldingsIndex:
+    """mmap で開いた逆引き索引"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ValueError(f"{path} is empty")
+        magic, self.n_etfs, self.n_keys, self.n_postings, date_bytes = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a holdings index")
+        self.date = date_bytes.decode('ascii')
+        self._etf_offset = HEADER.size
+        self._key_offset = self._etf_offset + self.n_etfs * ETF_RECORD.size
+        self._ptr_offset = self._key_offset + self.n_keys * KEY_SIZE
+        self._posting_offset = self._ptr_offset + (self.n_keys + 1) * OFFSET.size
+
+    def close(self):
+        if getattr(self, '_mm', None) is not None:
+            self._mm.close()
+            self._mm = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.n_keys
+
+    def _key(self, i):
+        start = self._key_offset + i * KEY_SIZE
+        return self._mm[start:start + KEY_SIZE]
+
+    def _find(self, key):
+        """キーの番号 (ない場合は -1)。キーの配列を mmap 上で二分探索する"""
+        keys = _KeyView(self)
+        i = bisect_left(keys, key)
+        return i if i < self.n_keys and self._key(i) == key else -1
+
+    def etf(self, i):
+        """ETFの番号 -> (ETFコード, Fund_Date)"""
+        code, days = ETF_RECORD.unpack_from(self._mm, self._etf_offset + i * ETF_RECORD.size)
+        return code.rstrip(b'\0').decode('ascii'), _EPOCH + timedelta(days=days)
+
+    def postings(self, code):
+        """銘柄を保有するETFを比率の降順に返すジェネレータ (該当がない場合は何も返さない)"""
+        key = encode_key(code)
+        i = self._find(key) if key is not None else -1
+        if i < 0:
+            return
+        start, end = struct.unpack_from('<II', self._mm, self._ptr_offset + i * OFFSET.size)
+        for p in range(start, end):
+            etf, shares, weight = POSTING_RECORD.unpack_from(self._mm, self._posting_offset + p * POSTING_RECORD.size)
+            etf_code, fund_date = self.etf(etf)
+            yield Posting(etf_code, fund_date, shares, weight)
+
+    def lookup(self, code):
+        """銘柄を保有するETFの一覧 (Posting のリスト)"""
+        return list(self.postings(code))
+
+    def __contains__(self, code):
+        key = encode_key(code)
+        return key is not None and self._find(key) >= 0
+
+
+class _KeyView:
+    """bisect から索引のキーの配列として参照するためのビュー (キーを読み出すのは比較する位置だけ)"""
+
+    def __init__(self, index):
+        self._index = index
+
+    def __len__(self):
+        return self._index.n_keys
+
+    def __getitem__(self, i):
+        return self._index._key(i)
+
+
+def open_index(target_date_str=None, index_dir=INDEX_DIR):
+    """日付の索引を開く (None の場合は最新の索引)"""
+    path = index_path(target_date_str, index_dir) if target_date_str else os.path.join(index_dir, LATEST_NAME)
+    return HoldingsIndex(path)
+
+
+def lookup(code, target_date_str=None, index_dir=INDEX_DIR):
+    """銘柄を保有するETFの一覧 (1回だけ検索する場合の簡易版)"""
+    with open_index(target_date_str, index_dir) as index:
+        return index.lookup(code)
+
+
+def build_index(base, holdings, target_date_str, index_dir=INDEX_DIR, priority=None):
+    """
+    正規化済みの1日分の解析結果 (保有銘柄は評価額の列があれば比率に使う) から索引を作って保存する。
+    複数ベンダーの重複は pcf_dedup で解消し、1つのETFに複数の Fund_Date がある場合は新しいものを使う。
+    保存した日付が最新の索引より新しければ latest.idx も置き換える。戻り値: 保存したファイルのパス
+    """
+    import numpy as np
+    import pandas as pd
+    from pcf_dedup import resolve_duplicates
+    from pcf_schema import market_values
+
+    _, holdings, _ = resolve_duplicates(base, holdings, priority)
+    if holdings is None or holdings.empty:
+        return None
+    h = holdings[holdings['Fund_Date'] == holdings.groupby('ETF_Code')['Fund_Date'].transform('max')]
+    h = h.reset_index(drop=True)
+    _, value_jpy = market_values(h)
+    totals = value_jpy.groupby(h['ETF_Code']).transform('sum')
+    h = h.assign(Weight=(value_jpy / totals.where(totals != 0)).astype('float64'))
+
+    etfs = h[['ETF_Code', 'Fund_Date']].drop_duplicates('ETF_Code').sort_values('ETF_Code').reset_index(drop=True)
+    etf_numbers = pd.Series(np.arange(len(etfs), dtype='uint32'), index=etfs['ETF_Code'])
+
+    postings = []
+    for col in ['ISIN', 'Local_Code']:
+        rows = h[h[col].notna()]
+        key = rows[col].astype(str).str.strip().str.upper()
+        usable = key.str.len().between(1, KEY_SIZE) & key.map(str.isascii)
+        rows = rows.assign(Key=key)[usable]
+        postings.append(rows[['Key', 'ETF_Code', 'Shares_Amount', 'Weight']])
+    postings = pd.concat(postings, ignore_index=True).drop_duplicates(['Key', 'ETF_Code'])
+    postings = postings.sort_values(['Key', 'Weight', 'ETF_Code'], ascending=[True, False, True], na_position='last',
+                                    kind='stable').reset_index(drop=True)
+
+    keys, starts = np.unique(postings['Key'].to_numpy(dtype='S12'), return_index=True)
+    offsets = np.append(starts, len(postings)).astype('<u4')
+    etf_table = np.empty(len(etfs), dtype=[('code', 'S8'), ('days', '<i4')])
+    etf_table['code'] = etfs['ETF_Code'].to_numpy(dtype='S8')
+    etf_table['days'] = etfs['Fund_Date'].to_numpy(dtype='datetime64[D]').astype('int64')
+    posting_table = np.empty(len(postings), dtype=[('etf', '<u4'), ('shares', '<f8'), ('weight', '<f8')])
+    posting_table['etf'] = etf_numbers.reindex(postings['ETF_Code']).to_numpy()
+    posting_table['shares'] = postings['Shares_Amount'].to_numpy(dtype='float64', na_value=np.nan)
+    posting_table['weight'] = postings['Weight'].to_numpy(dtype='float64', na_value=np.nan)
+
+    os.makedirs(index_dir, exist_ok=True)
+    path = index_path(target_date_str, index_dir)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(etf_table), len(keys), len(posting_table), target_date_str.encode('ascii')))
+        for array in [etf_table, keys, offsets, posting_table]:
+            f.write(array.tobytes())
+    os.replace(tmp_path, path)
+    logging.info(f"Saved holdings index for {target_date_str}: {len(keys)} keys, {len(posting_table)} postings to {path}")
+    _update_latest(path, target_date_str, index_dir)
+    return path
+
+
+def _update_latest(path, target_date_str, index_dir):
+    latest = os.path.join(index_dir, LATEST_NAME)
+    if os.path.exists(latest):
+        try:
+            with HoldingsIndex(latest) as current:
+                if current.date > target_date_str:
+                    return
+        except ValueError:
+            pass
+    # 開いている索引に影響しないよう、コピーしてから置き換える
+    shutil.copyfile(path, latest + '.tmp')
+    os.replace(latest + '.tmp', latest)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Look up which ETFs hold a security, using the per-date holdings index.")
+    parser.add_argument("--index-dir", default=INDEX_DIR, help=f"Directory of the index files (default: {INDEX_DIR}).")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('lookup', help="List the ETFs holding each ISIN or local code.")
+    p.add_argument("codes", nargs='+', help="ISINs or local codes, e.g. 7203 JP3633400001.")
+    p.add_argument("--date", default=None, help="Parse date of the index (default: latest).")
+
+    p = sub.add_parser('build', help="Build the index from the parsed CSV output (parse_pcfs_by_date.py builds it automatically).")
+    p.add_argument("dates", nargs='+', help="Parse dates (YYYY-MM-DD).")
+    p.add_argument("--data-dir", default='data', help="Directory containing the parsed output (default: data).")
+
+    p = sub.add_parser('info', help="Show the size of an index.")
+    p.add_argument("--date", default=None, help="Parse date of the index (default: latest).")
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+        from load_pcfs import read_parsed_csv
+        for d in args.dates:
+            base, holdings = read_parsed_csv(d, args.data_dir, valuation=True)
+            if base is None:
+                logging.warning(f"No parsed data found for {d}")
+                continue
+            build_index(base, holdings, d, args.index_dir)
+        return
+
+    with open_index(args.date, args.index_dir) as index:
+        if args.command == 'info':
+            print(f"{index.path}: {index.date}, {index.n_etfs} ETFs, {index.n_keys} keys, {index.n_postings} postings")
+            return
+        for code in args.codes:
+            started = time.perf_counter()
+            postings = index.lookup(code)
+            elapsed = (time.perf_counter() - started) * 1e6
+            print(f"{code}: {len(postings)} ETFs ({index.date}, {elapsed:.0f} us)")
+            for p in postings:
+                weight = f"{p.weight:8.4%}" if p.weight == p.weight else '       -'
+                print(f"    {p.etf_code:>6} {p.fund_date} {p.shares:>20,.0f} {weight}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,290 @@
+import os
+import sqlite3
+import logging
+import argparse
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+import pandas as pd
+
+from pcf_dedup import resolve_duplicates, fund_hashes, parse_priority, DEFAULT_PRIORITY
+from pcf_schema import BASE_COLUMNS, HOLDING_COLUMNS
+
+# ETFごとの最新のPCF (最も新しい Fund_Date の基本情報と保有銘柄) を保持するストア (SQLite)。
+# parse_pcfs_by_date.py / backfill_pcfs.py が1日分を保存するたびに update() で更新する。
+# 入力の各ETFを保存済みのものと比べ、次の場合のみそのETFの行を置き換える (それ以外のETFには触れない):
+#   - 保存済みのものより Fund_Date が新しい
+#   - Fund_Date が同じで、ベンダーの優先順位が高い
+#   - Fund_Date・ベンダーが同じで、内容 (pcf_dedup.fund_hashes) が変わった (ベンダーによる訂正)
+# 保有銘柄は ETF_Code を先頭にした主キーで並ぶため、ETFごとの削除・追加はそのETFの行だけに触れ、
+# 全ETFの最新の保有銘柄は1回のクエリで読める。
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(script_dir)
+
+LATEST_DB = os.path.join(project_root, 'data', 'pcf_latest.db')
+
+# content_hash は pcf_dedup.fund_hashes の uint64 を16桁の16進数の文字列で保存する
+# (SQLiteの INTEGER は符号つき64ビットのため、そのままでは2**63以上の値を保存できない)
+FUND_TABLE = """
+CREATE TABLE IF NOT EXISTS {name} (
+    ETF_Code            TEXT    NOT NULL PRIMARY KEY,
+    Fund_Date           TEXT    NOT NULL,
+    ETF_Name            TEXT,
+    Cash_Component      REAL,
+    Shares_Outstanding  REAL,
+    source              TEXT,
+    content_hash        TEXT,
+    parse_date          TEXT,
+    updated_at          TEXT
+) WITHOUT ROWID;
+"""
+
+SCHEMA = FUND_TABLE.format(name='latest_fund') + """
+CREATE TABLE IF NOT EXISTS latest_holding (
+    ETF_Code        TEXT    NOT NULL,
+    seq             INTEGER NOT NULL,
+    ISIN            TEXT,
+    Local_Code      TEXT,
+    Stock_Name      TEXT,
+    Exchange        TEXT,
+    Currency        TEXT,
+    Shares_Amount   REAL,
+    Stock_Price     REAL,
+    PRIMARY KEY (ETF_Code, seq)
+) WITHOUT ROWID;
+"""
+
+FUND_FIELDS = ['ETF_Code', 'Fund_Date', 'ETF_Name', 'Cash_Component', 'Shares_Outstanding', 'source']
+HOLDING_FIELDS = ['ISIN', 'Local_Code', 'Stock_Name', 'Exchange', 'Currency', 'Shares_Amount', 'Stock_Price']
+
+# SQLiteの変数の上限より少ない、IN句1回あたりのETFコードの数
+_IN_CHUNK = 500
+
+
+def _none(values):
+    """欠損 (NaN/NA) を None にした値のリスト (sqlite3 に渡すため)"""
+    return [None if v is None or v is pd.NA or v != v else v for v in values]
+
+
+class LatestStore:
+    """ETFごとの最新のPCFのストア"""
+
+    def __init__(self, path=LATEST_DB):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(SCHEMA)
+        self._migrate()
+
+    def _migrate(self):
+        """content_hash を INTEGER (int64 に折り返した値) で保存していた古いDBを16進数の文字列に変換する"""
+        types = {row[1]: row[2] for row in self._conn.execute('PRAGMA table_info(latest_fund)')}
+        if types.get('content_hash', '').upper() != 'INTEGER':
+            return
+        columns = ', '.join(types)
+        # printf の %x は int64 を符号なしとして書くため、元の uint64 と同じ値になる
+        select = columns.replace('content_hash', "printf('%016x', content_hash)")
+        with self.transaction():
+            self._conn.execute(FUND_TABLE.format(name='latest_fund_new'))
+            self._conn.execute(f'INSERT INTO latest_fund_new ({columns}) SELECT {select} FROM latest_fund')
+            self._conn.execute('DROP TABLE latest_fund')
+            self._conn.execute('ALTER TABLE latest_fund_new RENAME TO latest_fund')
+        logging.info(f"Converted content_hash in {self.path} to hexadecimal text.")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @contextmanager
+    def transaction(self):
+        """複数の更新を1トランザクションにまとめる"""
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield self
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+            self._conn.execute('COMMIT')
+
+    def current(self, etf_codes):
+        """保存済みの (ETF_Code, Fund_Date, source, content_hash) を指定したETFについてのみ返す"""
+        codes = list(etf_codes)
+        rows = []
+        with self._lock:
+            for i in range(0, len(codes), _IN_CHUNK):
+                chunk = codes[i:i + _IN_CHUNK]
+                rows += self._conn.execute(
+                    f"SELECT ETF_Code, Fund_Date, source, content_hash FROM latest_fund "
+                    f"WHERE ETF_Code IN ({', '.join('?' for _ in chunk)})", chunk
+                ).fetchall()
+        return pd.DataFrame(rows, columns=['ETF_Code', 'Fund_Date_stored', 'source_stored', 'content_hash_stored'])
+
+    def update(self, base, holdings, parse_date=None, priority=None):
+        """
+        正規化済みの解析結果 (1日分。一部のベンダーのみでもよい) で、より新しいETFだけを置き換える。
+        priority: ベンダーの優先順位 (None の場合は DEFAULT_PRIORITY)
+        戻り値: 件数の辞書 (added: 新しいETF, replaced: 置き換えたETF, kept: 保存済みのものを残したETF)
+        """
+        counts = {'added': 0, 'replaced': 0, 'kept': 0}
+        if base is None or base.empty:
+            return counts
+        priority = priority or DEFAULT_PRIORITY
+        base, holdings, _ = resolve_duplicates(base, holdings, priority)
+        if holdings is None:
+            holdings = pd.DataFrame(columns=HOLDING_COLUMNS)
+
+        # 入力の中でETFごとに最も新しい Fund_Date のものを候補にする
+        candidates = fund_hashes(base, holdings)
+        candidates = candidates.sort_values('Fund_Date', ascending=False, kind='stable').drop_duplicates('ETF_Code')
+        candidates['Fund_Date_key'] = candidates['Fund_Date'].dt.strftime('%Y-%m-%d')
+        candidates['content_hash'] = [f'{h:016x}' for h in candidates['content_hash'].to_numpy(dtype='uint64').tolist()]
+        merged = candidates.merge(self.current(candidates['ETF_Code'].tolist()), on='ETF_Code', how='left')
+
+        rank = {vendor: i for i, vendor in enumerate(priority)}
+        new_rank = merged['source'].map(rank).fillna(len(rank))
+        stored_rank = merged['source_stored'].map(rank).fillna(len(rank))
+        stored = merged['Fund_Date_stored'].notna()
+        newer = merged['Fund_Date_key'] > merged['Fund_Date_stored']
+        same_date = merged['Fund_Date_key'] == merged['Fund_Date_stored']
+        corrected = same_date & (merged['source'] == merged['source_stored']) & (
+            merged['content_hash'] != merged['content_hash_stored'])
+        replace = ~stored | newer | (same_date & (new_rank < stored_rank)) | corrected
+        changed = merged[replace]
+        counts['added'] = int((~stored).sum())
+        counts['replaced'] = int((replace & stored).sum())
+        counts['kept'] = int((~replace).sum())
+        if changed.empty:
+            return counts
+
+        keys = changed[['ETF_Code', 'Fund_Date', 'source']]
+        funds = base.merge(keys, on=['ETF_Code', 'Fund_Date', 'source']).drop_duplicates('ETF_Code')
+        funds = funds.merge(changed[['ETF_Code', 'content_hash']], on='ETF_Code')
+        rows = holdings.merge(keys, on=['ETF_Code', 'Fund_Date', 'source'])
+        rows = rows.assign(seq=rows.groupby('ETF_Code').cumcount())
+
+        now = datetime.now().isoformat(timespec='seconds')
+        fund_rows = list(zip(
+            funds['ETF_Code'].tolist(),
+            funds['Fund_Date'].dt.strftime('%Y-%m-%d').tolist(),
+            *[_none(funds[col].tolist()) for col in ['ETF_Name', 'Cash_Component', 'Shares_Outstanding', 'source']],
+            funds['content_hash'].tolist(),
+            [parse_date] * len(funds),
+            [now] * len(funds),
+        ))
+        holding_rows = list(zip(*[_none(rows[col].tolist()) for col in ['ETF_Code', 'seq'] + HOLDING_FIELDS]))
+        with self.transaction():
+            self._conn.executemany('DELETE FROM latest_holding WHERE ETF_Code = ?', [(code,) for code in funds['ETF_Code']])
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO latest_fund (ETF_Code, Fund_Date, ETF_Name, Cash_Component, Shares_Outstanding, '
+                'source, content_hash, parse_date, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', fund_rows
+            )
+            self._conn.executemany(
+                f"INSERT INTO latest_holding (ETF_Code, seq, {', '.join(HOLDING_FIELDS)}) "
+                f"VALUES ({', '.join('?' for _ in range(len(HOLDING_FIELDS) + 2))})", holding_rows
+            )
+        return counts
+
+    def load(self, etf_codes=None):
+        """
+        最新のPCFを (基本情報, 保有銘柄) で返す (pcf_schema の BASE_COLUMNS / HOLDING_COLUMNS)。
+        etf_codes: 読み込むETFコード (None の場合はすべて)
+        """
+        where, params = '', []
+        if etf_codes:
+            codes = list(etf_codes)
+            where = f" WHERE f.ETF_Code IN ({', '.join('?' for _ in codes)})"
+            params = codes
+        with self._lock:
+            base = pd.read_sql_query(
+                f"SELECT {', '.join('f.' + c for c in FUND_FIELDS)} FROM latest_fund f{where} ORDER BY f.ETF_Code",
+                self._conn, params=params
+            )
+            holdings = pd.read_sql_query(
+                f"SELECT f.Fund_Date, h.ETF_Code, {', '.join('h.' + c for c in HOLDING_FIELDS)}, f.source "
+                f"FROM latest_holding h JOIN latest_fund f ON f.ETF_Code = h.ETF_Code{where} ORDER BY h.ETF_Code, h.seq",
+                self._conn, params=params
+            )
+        for df in (base, holdings):
+            df['Fund_Date'] = pd.to_datetime(df['Fund_Date']).astype('datetime64[ns]')
+            for col in df.columns:
+                if col not in ('Fund_Date', 'Cash_Component', 'Shares_Outstanding', 'Shares_Amount', 'Stock_Price'):
+                    df[col] = df[col].astype('string')
+                elif col != 'Fund_Date':
+                    df[col] = df[col].astype('float64')
+        return base[BASE_COLUMNS], holdings[HOLDING_COLUMNS]
+
+    def summary(self):
+        """ベンダー・Fund_Date ごとのETF数"""
+        with self._lock:
+            return pd.read_sql_query(
+                'SELECT source, Fund_Date, COUNT(*) AS etfs FROM latest_fund GROUP BY source, Fund_Date '
+                'ORDER BY Fund_Date DESC, source', self._conn
+            )
+
+
+def update_latest(base, holdings, parse_date=None, path=LATEST_DB, priority=None):
+    """最新のPCFのストアを開いて更新する"""
+    with LatestStore(path) as store:
+        counts = store.update(base, holdings, parse_date, priority)
+    logging.info(f"Latest holdings store: {counts['added']} new, {counts['replaced']} updated, "
+                 f"{counts['kept']} unchanged ETFs")
+    return counts
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Maintain and read the latest PCF of every ETF.")
+    parser.add_argument("--db", default=LATEST_DB, help=f"Latest holdings store (default: {LATEST_DB}).")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('update', help="Apply the parsed CSV output of one or more dates (parse_pcfs_by_date.py does this automatically).")
+    p.add_argument("dates", nargs='+', help="Parse dates (YYYY-MM-DD).")
+    p.add_argument("--data-dir", default='data', help="Directory containing the parsed output (default: data).")
+    p.add_argument("--vendor-priority",
+                   help=f"Comma-separated vendor priority for ETFs published by more than one vendor "
+                        f"(default: {','.join(DEFAULT_PRIORITY)}).")
+
+    p = sub.add_parser('export', help="Write the latest base info and holdings to CSV files.")
+    p.add_argument("--etf", nargs='+', default=None, help="ETF codes to export (default: all).")
+    p.add_argument("--output-dir", default='.', help="Directory for latest_base_info.csv and latest_holdings.csv.")
+
+    sub.add_parser('summary', help="Count ETFs by vendor and Fund_Date.")
+    args = parser.parse_args()
+
+    if args.command == 'update':
+        from load_pcfs import read_parsed_csv
+        priority = parse_priority(args.vendor_priority)
+        for d in sorted(args.dates):
+            base, holdings = read_parsed_csv(d, args.data_dir)
+            if base is None:
+                logging.warning(f"No parsed data found for {d}")
+                continue
+            update_latest(base, holdings, d, args.db, priority)
+        return
+
+    with LatestStore(args.db) as store:
+        if args.command == 'summary':
+            print(store.summary().to_string(index=False))
+            return
+        base, holdings = store.load(args.etf)
+    os.makedirs(args.output_dir, exist_ok=True)
+    for name, df in [('latest_base_info', base), ('latest_holdings', holdings)]:
+        path = os.path.join(args.output_dir, f"{name}.csv")
+        df.assign(Fund_Date=df['Fund_Date'].dt.strftime('%Y-%m-%d')).to_csv(path, index=False, encoding='utf-8-sig')
+        logging.info(f"Saved {len(df)} rows to {path}")
+
+
+if __name__ == '__main__':
+    main()
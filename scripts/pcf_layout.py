@@ -0,0 +1,272 @@
+import os
+import json
+import hashlib
+import sqlite3
+import logging
+import argparse
+import threading
+from datetime import datetime
+
+from pcf_encoding import UTF8_BOM
+
+# PCF CSVのレイアウト (基本情報・保有銘柄のヘッダーが何行目にあるか、どの列があるか) の登録簿。
+# ファイルの先頭 FINGERPRINT_LINES 行から指紋を作り、既知の指紋であれば登録済みの行位置から
+# 各ブロックの範囲を求める (ヘッダーを探して行を分割する走査は不要になる)。
+# 指紋の作り方:
+#   'ETF Code' / 'Code' の列を含む行 (ヘッダー) は各列の見出し (前後の空白を除いたもの) を位置の順に、
+#   空行は空、それ以外 (データ行) は列数だけを使う (値は指紋に含めない)。
+#   split_pcf_sections が見るのは「'ETF Code' / 'Code' の列を含む行がどこにあるか」だけなので、
+#   同じ指紋のファイルは必ず同じ行位置になる。
+# 未知の指紋は登録し、ログに出力する (ベンダーの書式変更を検出するため)。
+# 指紋の作り方を変えた場合は FINGERPRINT_VERSION を上げる。登録簿の PRAGMA user_version が異なる場合は
+# 登録済みの指紋をすべて消して作り直す (古い作り方の指紋を新しいレイアウトとして警告しないため)。
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(script_dir)
+
+LAYOUT_DB = os.path.join(project_root, 'data', 'pcf_layouts.db')
+
+# 指紋に使う先頭の行数 (基本情報のヘッダー・値、空行、保有銘柄のヘッダーまで)
+FINGERPRINT_LINES = 4
+
+# 指紋の作り方の版 (1: ヘッダーの列の見出しと各行の列数のみ)
+FINGERPRINT_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS layouts (
+    fingerprint      TEXT    NOT NULL PRIMARY KEY,
+    base_line        INTEGER,
+    holdings_line    INTEGER,
+    scan             INTEGER NOT NULL DEFAULT 0,
+    skeleton         TEXT,
+    base_columns     TEXT,
+    holdings_columns TEXT,
+    example_file     TEXT,
+    first_seen_at    TEXT
+) WITHOUT ROWID
+"""
+
+
+# bytes.strip() と同じ空白文字
+_WHITESPACE = frozenset(b' \t\n\r\x0b\x0c')
+
+
+def content_bounds(raw, encoding):
+    """
+    前後の空白を除いた範囲 (開始, 終了) を返す (BOMはUTF-8として読む場合のみ除く)。
+    raw.strip() と違いファイル全体をコピーしない。
+    """
+    start, end = 0, len(raw)
+    while start < end and raw[start] in _WHITESPACE:
+        start += 1
+    while end > start and raw[end - 1] in _WHITESPACE:
+        end -= 1
+    if encoding.lower().replace('_', '-').startswith('utf-8') and raw.startswith(UTF8_BOM, start, end):
+        start += len(UTF8_BOM)
+    return start, end
+
+
+# ヘッダーの行を見分ける列の見出し (split_pcf_sections と同じ)
+_HEADER_LABELS = frozenset([b'ETF Code', b'Code'])
+
+
+def _fields(line):
+    return [col.strip() for col in line.split(b',')]
+
+
+def _head_lines(raw, encoding, max_lines=FINGERPRINT_LINES):
+    """
+    split_pcf_sections と同じ規則で前後の空白・BOMを除き、先頭の最大 max_lines 行の (開始, 終了) を返す。
+    戻り値: (行のリスト, 全体の終了位置, ファイル全体が max_lines 行以内か)
+    """
+    start, end = content_bounds(raw, encoding)
+    lines = []
+    pos = start
+    while pos < end and len(lines) < max_lines:
+        newline = raw.find(b'\n', pos, end)
+        line_end = end if newline == -1 else newline
+        lines.append((pos, line_end))
+        pos = end if newline == -1 else line_end + 1
+    return lines, end, pos >= end
+
+
+def _skeleton(raw, lines, complete):
+    """指紋の元になる各行の表現 (ヘッダーの行は列の見出しをカンマでつないだもの、空行は空、それ以外は '#列数')"""
+    skeleton = []
+    for line_start, line_end in lines:
+        line = raw[line_start:line_end].strip()
+        fields = _fields(line) if b'Code' in line else []
+        if _HEADER_LABELS.intersection(fields):
+            skeleton.append(b','.join(fields))
+        elif not line:
+            skeleton.append(b'')
+        else:
+            skeleton.append(b'#%d' % (line.count(b',') + 1))
+    if complete:
+        skeleton.append(b'$')
+    return skeleton
+
+
+def fingerprint(skeleton):
+    return hashlib.sha1(b'\n'.join(skeleton)).hexdigest()[:16]
+
+
+def plan_from_skeleton(skeleton):
+    """
+    指紋の元の行から (基本情報ヘッダーの行, 保有銘柄ヘッダーの行) を求める。
+    先頭の行だけでは決まらない場合 (ヘッダーがもっと後ろにある場合など) は None を返す。
+    """
+    complete = bool(skeleton) and skeleton[-1] == b'$'
+    lines = skeleton[:-1] if complete else skeleton
+    base_line = holdings_line = None
+    for i, line in enumerate(lines):
+        fields = _fields(line) if b'Code' in line else []
+        if base_line is None and b'ETF Code' in fields:
+            base_line = i
+        if holdings_line is None and b'Code' in fields:
+            holdings_line = i
+    if not complete:
+        # 基本情報の値の行と保有銘柄のヘッダーが先頭の行に収まっていない
+        if base_line is None or holdings_line is None or base_line + 1 >= len(lines):
+            return None
+    return base_line, holdings_line
+
+
+class LayoutRegistry:
+    """
+    指紋 -> 抽出方法 (ヘッダーの行位置・列名) の登録簿 (SQLite)。
+    登録済みの指紋はプロセス内の辞書に読み込み、ファイルごとの参照はDBにアクセスしない。
+    """
+
+    def __init__(self, path=LAYOUT_DB):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._migrate()
+        self._plans = {}
+        for fp, base_line, holdings_line, scan in self._conn.execute(
+            'SELECT fingerprint, base_line, holdings_line, scan FROM layouts'
+        ):
+            self._plans[fp] = None if scan else (base_line, holdings_line)
+        # 空の登録簿 (初回・指紋の版の変更で作り直した場合) に登録する指紋は書式の変更ではない
+        self._seeding = not self._plans
+
+    def _migrate(self):
+        """テーブルを作り、指紋の作り方が異なる版で登録した指紋があれば消す"""
+        self._conn.execute('BEGIN IMMEDIATE')
+        try:
+            version = self._conn.execute('PRAGMA user_version').fetchone()[0]
+            if version != FINGERPRINT_VERSION:
+                exists = self._conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE name = 'layouts'").fetchone()[0]
+                if exists:
+                    cleared = self._conn.execute('SELECT COUNT(*) FROM layouts').fetchone()[0]
+                    self._conn.execute('DROP TABLE layouts')
+                    if cleared:
+                        logging.info(f"Cleared {cleared} layout(s) fingerprinted with version {version} in {self.path}; "
+                                     f"they are registered again with version {FINGERPRINT_VERSION}.")
+                self._conn.execute(f'PRAGMA user_version = {FINGERPRINT_VERSION}')
+            self._conn.execute(SCHEMA)
+        except BaseException:
+            self._conn.execute('ROLLBACK')
+            raise
+        self._conn.execute('COMMIT')
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def sections(self, raw, encoding, file_name=""):
+        """
+        レイアウトの登録簿から基本情報・保有銘柄ブロックの範囲を求める
+        (戻り値は split_pcf_sections と同じ)。
+        先頭の行だけではレイアウトが決まらない場合は None を返す (呼び出し側で走査する)。
+        """
+        lines, end, complete = _head_lines(raw, encoding)
+        skeleton = _skeleton(raw, lines, complete)
+        fp = fingerprint(skeleton)
+        if fp in self._plans:
+            plan = self._plans[fp]
+        else:
+            plan = self._register(fp, skeleton, encoding, file_name)
+        if plan is None:
+            return None
+        base_line, holdings_line = plan
+        base_span = None
+        if base_line is not None:
+            base_end = lines[base_line + 1][1] if base_line + 1 < len(lines) else end
+            base_span = (lines[base_line][0], base_end)
+        holdings_span = (lines[holdings_line][0], end) if holdings_line is not None else None
+        return base_span, holdings_span
+
+    def _register(self, fp, skeleton, encoding, file_name):
+        """新しい指紋の抽出方法を求めて登録する"""
+        plan = plan_from_skeleton(skeleton)
+        columns = {}
+        for key, index in [('base', plan[0] if plan else None), ('holdings', plan[1] if plan else None)]:
+            if index is None:
+                columns[key] = []
+            else:
+                columns[key] = [c.decode(encoding, 'replace') for c in _fields(skeleton[index])]
+        with self._lock:
+            cur = self._conn.execute(
+                'INSERT OR IGNORE INTO layouts (fingerprint, base_line, holdings_line, scan, skeleton, base_columns, '
+                'holdings_columns, example_file, first_seen_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (fp, plan[0] if plan else None, plan[1] if plan else None, int(plan is None),
+                 b'\n'.join(skeleton).decode(encoding, 'replace'),
+                 json.dumps(columns['base'], ensure_ascii=False), json.dumps(columns['holdings'], ensure_ascii=False),
+                 file_name, datetime.now().isoformat(timespec='seconds'))
+            )
+            self._plans[fp] = plan
+        if cur.rowcount:
+            # 空の登録簿から始めた場合以外は書式の変更の可能性があるため警告する
+            log = logging.info if self._seeding else logging.warning
+            log(f"New PCF layout fingerprint {fp} in {file_name}: "
+                f"holdings columns {columns['holdings'] or '(not in the first lines)'}")
+        return plan
+
+    def to_rows(self):
+        with self._lock:
+            cur = self._conn.execute('SELECT * FROM layouts ORDER BY first_seen_at, fingerprint')
+            names = [d[0] for d in cur.description]
+            return [dict(zip(names, row)) for row in cur.fetchall()]
+
+
+# プロセスごとに開く既定の登録簿 (フォークしたワーカーでは開き直す)
+_default_registry = None
+_default_pid = None
+
+
+def default_registry():
+    global _default_registry, _default_pid
+    if _default_registry is None or _default_pid != os.getpid():
+        _default_registry = LayoutRegistry(LAYOUT_DB)
+        _default_pid = os.getpid()
+    return _default_registry
+
+
+def main():
+    parser = argparse.ArgumentParser(description="List the PCF CSV layouts recorded by the parser.")
+    parser.add_argument("--db", default=LAYOUT_DB, help=f"Layout registry file (default: {LAYOUT_DB}).")
+    args = parser.parse_args()
+
+    with LayoutRegistry(args.db) as registry:
+        rows = registry.to_rows()
+    for row in rows:
+        where = 'scan' if row['scan'] else f"base line {row['base_line']}, holdings line {row['holdings_line']}"
+        print(f"{row['fingerprint']}  first seen {row['first_seen_at']} in {row['example_file']} ({where})")
+        print(f"    base: {', '.join(json.loads(row['base_columns']))}")
+        print(f"    holdings: {', '.join(json.loads(row['holdings_columns']))}")
+    print(f"{len(rows)} layout(s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,258 @@
+import os
+import json
+import struct
+import hashlib
+import logging
+import sqlite3
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import datetime
+
+import pyarrow as pa
+
+from pcf_blobstore import open_archive
+
+# アーカイブ (ZIP) ごとのメンバー一覧 (マニフェスト) と、メンバーごとの解析結果のキャッシュ。
+# マニフェストはZIPの中央ディレクトリだけから作るため、メンバーを展開せずに前回からの変更を検出できる。
+# 解析結果は (source, CRC32, 展開後のサイズ, 解析処理のバージョン) をキーに保存するため、
+# ベンダーが一部のファイルだけを差し替えた場合も、変更されたメンバーだけを再解析すればよい。
+# analyze_csv_structure.py の構造解析の結果もアーカイブごとに保存し、マニフェストが変わったものだけを解析し直す。
+# 解析結果のDataFrameは Arrow IPC、構造解析の結果は JSON で保存する (pickle は使わない)。
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(script_dir)
+
+CACHE_DB = os.path.join(project_root, 'data', 'parse_cache.db')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS archive_manifest (
+    source          TEXT    NOT NULL,
+    archive         TEXT    NOT NULL,
+    name            TEXT    NOT NULL,
+    crc32           INTEGER NOT NULL,
+    compress_size   INTEGER NOT NULL,
+    file_size       INTEGER NOT NULL,
+    header_offset   INTEGER NOT NULL,
+    PRIMARY KEY (source, archive, name)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS parse_cache (
+    source          TEXT    NOT NULL,
+    crc32           INTEGER NOT NULL,
+    file_size       INTEGER NOT NULL,
+    parser_version  TEXT    NOT NULL,
+    result          BLOB    NOT NULL,
+    created_at      TEXT,
+    PRIMARY KEY (source, crc32, file_size, parser_version)
+);
+
+CREATE TABLE IF NOT EXISTS structure_cache (
+    source          TEXT    NOT NULL,
+    archive         TEXT    NOT NULL,
+    signature       TEXT    NOT NULL,
+    result          BLOB    NOT NULL,
+    created_at      TEXT,
+    PRIMARY KEY (source, archive)
+) WITHOUT ROWID;
+"""
+
+# ZIPメンバー1件分のマニフェスト
+MemberInfo = namedtuple('MemberInfo', ['name', 'crc32', 'compress_size', 'file_size', 'header_offset'])
+
+
+def archive_key(zip_path):
+    """
+    マニフェストのキー (source, アーカイブのファイル名)。
+    実行するディレクトリによらないよう、パスではなくベンダーのディレクトリ名とファイル名を使う。
+    """
+    return os.path.basename(os.path.dirname(zip_path)), os.path.basename(zip_path)
+
+
+def read_manifest(zip_path):
+    """ZIPの中央ディレクトリ (ブロブストアの場合は索引) からCSVメンバーのマニフェストを作る (メンバーの中身は読まない)"""
+    with open_archive(zip_path) as zf:
+        return [
+            MemberInfo(info.filename, info.CRC, info.compress_size, info.file_size, info.header_offset)
+            for info in zf.infolist()
+            if info.filename.lower().endswith('.csv')
+        ]
+
+
+def manifest_signature(members, version=''):
+    """マニフェスト (MemberInfoのリスト) の要約。メンバーの追加・削除・内容の変更で値が変わる"""
+    digest = hashlib.sha1(str(version).encode())
+    for member in sorted(members):
+        digest.update(f"\n{member.name}\t{member.crc32}\t{member.file_size}".encode())
+    return digest.hexdigest()
+
+
+# 解析結果 (df_base, df_holdings) の保存形式: 各表の Arrow IPC ストリームの長さ (ない表は0) の後に各ストリームを続ける
+_RESULT_HEADER = struct.Struct('<QQ')
+
+
+def encode_result(result):
+    """解析結果 (df_base, df_holdings。どちらもNoneの場合がある) をバイト列にする"""
+    streams = []
+    for df in result:
+        if df is None:
+            streams.append(b'')
+            continue
+        table = pa.Table.from_pandas(df)
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        streams.append(sink.getvalue().to_pybytes())
+    return _RESULT_HEADER.pack(*(len(stream) for stream in streams)) + b''.join(streams)
+
+
+def decode_result(blob):
+    """encode_result の逆変換 (列名・型・indexも元のDataFrameと同じになる)"""
+    sizes = _RESULT_HEADER.unpack_from(blob)
+    offset = _RESULT_HEADER.size
+    frames = []
+    for size in sizes:
+        if size == 0:
+            frames.append(None)
+        else:
+            frames.append(pa.ipc.open_stream(blob[offset:offset + size]).read_all().to_pandas())
+        offset += size
+    return tuple(frames)
+
+
+def diff_manifest(previous, current):
+    """
+    前回のマニフェスト ({メンバー名: MemberInfo}) と今回のマニフェスト (MemberInfoのリスト) を比べる。
+    戻り値: (追加されたメンバー名, 内容が変わったメンバー名, 削除されたメンバー名)
+    """
+    added, changed = [], []
+    for member in current:
+        old = previous.get(member.name)
+        if old is None:
+            added.append(member.name)
+        elif (old.crc32, old.file_size) != (member.crc32, member.file_size):
+            changed.append(member.name)
+    names = {member.name for member in current}
+    removed = [name for name in previous if name not in names]
+    return added, changed, removed
+
+
+class ParseCache:
+    """
+    マニフェストと解析結果のキャッシュ (SQLite)。
+    parser_version: 解析処理のバージョン。値が変わると以前の解析結果は使われない。
+    """
+
+    def __init__(self, path=CACHE_DB, parser_version='1'):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.parser_version = str(parser_version)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @contextmanager
+    def transaction(self):
+        """複数の更新を1トランザクションにまとめる"""
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield self
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+            self._conn.execute('COMMIT')
+
+    def manifest(self, zip_path):
+        """前回保存したマニフェストを {メンバー名: MemberInfo} で返す (なければ空の辞書)"""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT name, crc32, compress_size, file_size, header_offset FROM archive_manifest '
+                'WHERE source = ? AND archive = ?',
+                archive_key(zip_path)
+            ).fetchall()
+        return {row[0]: MemberInfo(*row) for row in rows}
+
+    def save_manifest(self, zip_path, members):
+        """アーカイブのマニフェストを置き換える"""
+        source, archive = archive_key(zip_path)
+        with self.transaction():
+            self._conn.execute('DELETE FROM archive_manifest WHERE source = ? AND archive = ?', (source, archive))
+            self._conn.executemany(
+                'INSERT INTO archive_manifest (source, archive, name, crc32, compress_size, file_size, header_offset) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                [(source, archive, *member) for member in members]
+            )
+
+    def get(self, source, member):
+        """
+        メンバーの解析結果 (df_base, df_holdings) を返す。キャッシュにない場合はNone。
+        (解析できなかったメンバーも (None, None) として保存し、再解析しない)
+        """
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT result FROM parse_cache WHERE source = ? AND crc32 = ? AND file_size = ? AND parser_version = ?',
+                (source, member.crc32, member.file_size, self.parser_version)
+            ).fetchone()
+        if row is None:
+            return None
+        try:
+            return decode_result(row[0])
+        except Exception:
+            # 保存形式の変更などで読めなくなった結果は再解析する
+            return None
+
+    def put_many(self, entries):
+        """entries: (source, MemberInfo, (df_base, df_holdings)) の反復"""
+        now = datetime.now().isoformat(timespec='seconds')
+        rows = []
+        for source, member, result in entries:
+            try:
+                blob = encode_result(result)
+            except (pa.ArrowException, ValueError, TypeError) as e:
+                # Arrowで表せない表 (列名の重複など) はキャッシュせず、次回も解析する
+                logging.debug(f"Not caching the parse result of {member.name}: {e}")
+                continue
+            rows.append((source, member.crc32, member.file_size, self.parser_version, blob, now))
+        with self.transaction():
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO parse_cache (source, crc32, file_size, parser_version, result, created_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                rows
+            )
+
+    def structure(self, zip_path, signature):
+        """アーカイブの構造解析の結果を返す。保存時とマニフェストが変わった場合・未保存の場合はNone"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT signature, result FROM structure_cache WHERE source = ? AND archive = ?',
+                archive_key(zip_path)
+            ).fetchone()
+        if row is None or row[0] != signature:
+            return None
+        try:
+            return json.loads(row[1])
+        except Exception:
+            return None
+
+    def put_structure(self, zip_path, signature, result):
+        """result: 構造解析の結果 (文字列のリストのリスト)"""
+        blob = json.dumps(result, ensure_ascii=False).encode('utf-8')
+        with self.transaction():
+            self._conn.execute(
+                'INSERT OR REPLACE INTO structure_cache (source, archive, signature, result, created_at) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (*archive_key(zip_path), signature, blob, datetime.now().isoformat(timespec='seconds'))
+            )
@@ -0,0 +1,407 @@
+import re
+import logging
+
+import pandas as pd
+
+# 解析結果 (ベンダーごとに列名が異なる) を create_table.sql の列名・型に揃える。
+# 列名は create_table.sql に合わせ、DECIMAL列はfloat64、日付はdatetime64で扱う。
+
+# ETF基本情報 (HISTORY_FUND_DAILY + MASTER_FUND.ETF_Name)
+BASE_COLUMNS = ['Fund_Date', 'ETF_Code', 'ETF_Name', 'Cash_Component', 'Shares_Outstanding', 'source']
+
+# 保有銘柄 (HOLDING_DETAIL + MASTER_STOCK)
+HOLDING_COLUMNS = [
+    'Fund_Date', 'ETF_Code', 'ISIN', 'Local_Code', 'Stock_Name', 'Exchange', 'Currency',
+    'Shares_Amount', 'Stock_Price', 'source',
+]
+
+# 正規化後の列名 -> 元の列名の候補 (先に見つかった値を優先する)
+BASE_ALIASES = {
+    'ETF_Code': ['ETF Code'],
+    'ETF_Name': ['ETF Name'],
+    'Cash_Component': ['Fund Cash Component', 'Cash & Others'],
+    'Shares_Outstanding': ['Shares Outstanding'],
+}
+HOLDING_ALIASES = {
+    'ISIN': ['ISIN', 'Isin'],
+    'Local_Code': ['Code'],
+    'Stock_Name': ['Name'],
+    'Exchange': ['Exchange'],
+    'Currency': ['Currency'],
+    'Shares_Amount': ['Shares Amount', 'Shares'],
+    'Stock_Price': ['Stock Price'],
+}
+
+# 一部のベンダーのみが出力する評価額の列 (normalize_holdings(valuation=True) で HOLDING_COLUMNS の後に付ける)
+VALUATION_ALIASES = {
+    'Market_Value': ['Market Value'],
+    'FX_Rate': ['FX Rate'],
+    'Future_Multiplier': ['Future multiplier'],
+}
+VALUATION_COLUMNS = list(VALUATION_ALIASES)
+
+# 一部のベンダーのみが出力する純資産総額の列 (normalize_base(valuation=True) で BASE_COLUMNS の後に付ける)
+BASE_VALUATION_ALIASES = {
+    'AUM': ['AUM'],
+}
+BASE_VALUATION_COLUMNS = list(BASE_VALUATION_ALIASES)
+
+# ISINの桁数 (VARCHAR(12))
+ISIN_LENGTH = 12
+# ISINとして残す値 (ASCIIの英数字12文字。全角の数字などを含む値は12文字でも固定長のバイト列にならないため除く)
+_ISIN_FORMAT = r'[0-9A-Za-z]{%d}' % ISIN_LENGTH
+_ISIN_RE = re.compile(_ISIN_FORMAT)
+
+# この行数以上の表 (1日分をまとめたものなど) は値ごとの処理ではなくpandasの文字列操作で正規化する
+VECTORIZE_MIN_ROWS = 5000
+
+
+def _coalesce(df, candidates):
+    """候補の列のうち、行ごとに最初の欠損でない値を返す"""
+    result = None
+    for col in candidates:
+        if col not in df.columns:
+            continue
+        result = df[col] if result is None else result.fillna(df[col])
+    if result is None:
+        return pd.Series(pd.NA, index=df.index, dtype='object')
+    return result
+
+
+def _text_values(series, code=False):
+    """
+    前後の空白を除去し、空文字・欠損を None にした値のリストを返す。
+    code=True の場合、CSVの読み込みで数値になった値は '1301.0' ではなく '1301' にする。
+    (ETF1件分の小さな列が大半のため、pandasの文字列操作より値ごとの処理の方が速い)
+    """
+    values = []
+    for v in series.tolist():
+        if v is None or v is pd.NA or v != v:
+            values.append(None)
+            continue
+        if code and isinstance(v, float) and v.is_integer():
+            v = int(v)
+        v = str(v).strip()
+        if code and v.endswith('.0') and v[:-2].isdigit():
+            v = v[:-2]
+        values.append(v or None)
+    return values
+
+
+def _text_series(series, code=False):
+    """_text_values と同じ処理をpandasの文字列操作で行う (1日分をまとめて処理する大きな列向け)"""
+    if code and pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        values = series.astype('float64')
+        integral = values.notna() & (values % 1 == 0)
+        text = values.astype(str).astype('string')
+        text[integral] = values[integral].astype('int64').astype(str)
+        return text.mask(values.isna())
+    text = series.astype('string').str.strip()
+    if code:
+        text = text.str.replace(r'^(\d+)\.0$', r'\1', regex=True)
+    return text.mask(text == '')
+
+
+def _clean_text(series):
+    """前後の空白を除去し、空文字を欠損にした文字列の列を返す"""
+    if len(series) >= VECTORIZE_MIN_ROWS:
+        return _text_series(series)
+    return pd.Series(_text_values(series), index=series.index, dtype='string')
+
+
+def _clean_code(series):
+    """
+    コード列 (ETFコード・銘柄コード) を文字列にする。
+    CSVの読み込みで数値になった値は '1301.0' ではなく '1301' にする。
+    """
+    if len(series) >= VECTORIZE_MIN_ROWS:
+        return _text_series(series, code=True)
+    return pd.Series(_text_values(series, code=True), index=series.index, dtype='string')
+
+
+def _to_number(series):
+    """桁区切りのカンマを含む文字列も数値に変換する"""
+    if pd.api.types.is_numeric_dtype(series):
+        return series.astype('float64')
+    if series.dtype == object or pd.api.types.is_string_dtype(series):
+        series = series.astype('string').str.replace(',', '', regex=False)
+    return pd.to_numeric(series, errors='coerce').astype('float64')
+
+
+def parse_fund_date(series, default=None):
+    """
+    'Fund Date' (例: 20251205, '2025/12/05') を日付に変換する。
+    変換できない値は default (ファイルの日付など) で補う。
+    """
+    text = _clean_code(series)
+    dates = pd.to_datetime(text, format='%Y%m%d', errors='coerce')
+    rest = dates.isna() & text.notna()
+    if rest.any():
+        dates[rest] = pd.to_datetime(text[rest], errors='coerce')
+    if default is not None:
+        dates = dates.fillna(pd.Timestamp(default))
+    return dates.dt.normalize().astype('datetime64[ns]')
+
+
+def normalize_base(df_base, default_date=None, valuation=False):
+    """
+    ETF基本情報を BASE_COLUMNS に揃える。
+    default_date: 'Fund Date' がない・読めない場合に使う日付
+    valuation: True の場合は BASE_VALUATION_COLUMNS (純資産総額。ない場合は欠損) も付ける
+    """
+    # 列を1つずつ追加するとETF1件分の小さな表では追加のコストが大半になるため、まとめて作る
+    cols = {'Fund_Date': parse_fund_date(_coalesce(df_base, ['Fund Date']), default_date)}
+    cols['ETF_Code'] = _clean_code(_coalesce(df_base, BASE_ALIASES['ETF_Code']))
+    cols['ETF_Name'] = _clean_text(_coalesce(df_base, BASE_ALIASES['ETF_Name']))
+    for col in ['Cash_Component', 'Shares_Outstanding']:
+        cols[col] = _to_number(_coalesce(df_base, BASE_ALIASES[col]))
+    cols['source'] = df_base['source'].astype('string')
+    columns = BASE_COLUMNS
+    if valuation:
+        for col in BASE_VALUATION_COLUMNS:
+            cols[col] = _to_number(_coalesce(df_base, BASE_VALUATION_ALIASES[col]))
+        columns = BASE_COLUMNS + BASE_VALUATION_COLUMNS
+    out = pd.DataFrame(cols, index=df_base.index)
+    out = out.dropna(subset=['ETF_Code'])
+    return out[columns].reset_index(drop=True)
+
+
+def normalize_holdings(df_holdings, base, valuation=False):
+    """
+    保有銘柄を HOLDING_COLUMNS に揃える。
+    base: normalize_base() の結果 (ETFコードとsourceから Fund_Date を引くために使う)
+    valuation: True の場合は VALUATION_COLUMNS (評価額・為替レート・先物の乗数。ない場合は欠損) も付ける
+    ISINはASCIIの英数字12桁の値のみ残し、それ以外 ('FORWARD' や全角の文字を含むものなど) は欠損にする。
+    """
+    columns = HOLDING_COLUMNS + VALUATION_COLUMNS if valuation else HOLDING_COLUMNS
+    if len(df_holdings) >= VECTORIZE_MIN_ROWS:
+        return _normalize_holdings_frame(df_holdings, base, columns)
+    cols = {
+        'ETF_Code': _text_values(df_holdings['ETF Code'], code=True),
+        'ISIN': _text_values(_coalesce(df_holdings, HOLDING_ALIASES['ISIN'])),
+        'Local_Code': _text_values(_coalesce(df_holdings, HOLDING_ALIASES['Local_Code']), code=True),
+    }
+    for col in ['Stock_Name', 'Exchange', 'Currency']:
+        cols[col] = _text_values(_coalesce(df_holdings, HOLDING_ALIASES[col]))
+    source = df_holdings['source'].tolist()
+
+    invalid = sum(1 for v in cols['ISIN'] if v is not None and not _ISIN_RE.fullmatch(v))
+    if invalid:
+        logging.debug(f"Dropped {invalid} identifiers that are not {ISIN_LENGTH}-character ISINs")
+        cols['ISIN'] = [v if v is None or _ISIN_RE.fullmatch(v) else None for v in cols['ISIN']]
+
+    # (source, ETF_Code) -> Fund_Date (同じキーが複数ある場合は先の行を使う)
+    fund_dates = {}
+    for key, fund_date in zip(zip(base['source'].tolist(), base['ETF_Code'].tolist()), base['Fund_Date'].tolist()):
+        fund_dates.setdefault(key, fund_date)
+
+    out = pd.DataFrame({
+        'Fund_Date': pd.Series([fund_dates.get(key) for key in zip(source, cols['ETF_Code'])], dtype='datetime64[ns]'),
+        **{col: pd.Series(values, dtype='string') for col, values in cols.items()},
+        'Shares_Amount': _to_number(_coalesce(df_holdings, HOLDING_ALIASES['Shares_Amount'])).to_numpy(),
+        'Stock_Price': _to_number(_coalesce(df_holdings, HOLDING_ALIASES['Stock_Price'])).to_numpy(),
+        'source': pd.Series(source, dtype='string'),
+        **{col: _to_number(_coalesce(df_holdings, VALUATION_ALIASES[col])).to_numpy()
+           for col in VALUATION_COLUMNS if col in columns},
+    })
+    unmatched = out['ETF_Code'].isna() | out['Fund_Date'].isna()
+    if unmatched.any():
+        logging.warning(f"Dropped {int(unmatched.sum())} holdings rows without a matching ETF base info row")
+        out = out[~unmatched]
+    return out[columns].reset_index(drop=True)
+
+
+def _normalize_holdings_frame(df_holdings, base, columns=HOLDING_COLUMNS):
+    """normalize_holdings と同じ結果を列単位の処理で求める (大きな表向け)"""
+    out = pd.DataFrame({
+        'ETF_Code': _text_series(df_holdings['ETF Code'], code=True),
+        'ISIN': _text_series(_coalesce(df_holdings, HOLDING_ALIASES['ISIN'])),
+        'Local_Code': _text_series(_coalesce(df_holdings, HOLDING_ALIASES['Local_Code']), code=True),
+        **{col: _text_series(_coalesce(df_holdings, HOLDING_ALIASES[col])) for col in ['Stock_Name', 'Exchange', 'Currency']},
+        'Shares_Amount': _to_number(_coalesce(df_holdings, HOLDING_ALIASES['Shares_Amount'])),
+        'Stock_Price': _to_number(_coalesce(df_holdings, HOLDING_ALIASES['Stock_Price'])),
+        'source': df_holdings['source'].astype('string'),
+        **{col: _to_number(_coalesce(df_holdings, VALUATION_ALIASES[col]))
+           for col in VALUATION_COLUMNS if col in columns},
+    }).reset_index(drop=True)
+
+    invalid = out['ISIN'].notna() & ~out['ISIN'].str.fullmatch(_ISIN_FORMAT).fillna(False).astype(bool)
+    if invalid.any():
+        logging.debug(f"Dropped {int(invalid.sum())} identifiers that are not {ISIN_LENGTH}-character ISINs")
+        out['ISIN'] = out['ISIN'].mask(invalid)
+
+    # (source, ETF_Code) -> Fund_Date (同じキーが複数ある場合は先の行を使う)
+    fund_dates = base[['source', 'ETF_Code', 'Fund_Date']].drop_duplicates(['source', 'ETF_Code'])
+    out = out.merge(fund_dates.astype({'source': 'string', 'ETF_Code': 'string'}), on=['source', 'ETF_Code'], how='left')
+    unmatched = out['ETF_Code'].isna() | out['Fund_Date'].isna()
+    if unmatched.any():
+        logging.warning(f"Dropped {int(unmatched.sum())} holdings rows without a matching ETF base info row")
+        out = out[~unmatched]
+    out['Fund_Date'] = out['Fund_Date'].astype('datetime64[ns]')
+    return out[columns].reset_index(drop=True)
+
+
+
+# 円換算の基準の通貨
+BASE_CURRENCY = 'JPY'
+
+
+def market_values(holdings, label=None):
+    """
+    保有銘柄ごとの評価額 (現地通貨, 円換算) を返す。
+    評価額は 'Market Value' があればその値、なければ 株数 x 価格 x 'Future multiplier' (ない場合は1)。
+    円換算は その行の 'FX Rate' を掛ける (円建ては1)。'FX Rate' のない円建て以外の行の円換算額は欠損のままにし、
+    行数と通貨をログに出力する (label を指定した場合は警告、それ以外はデバッグ)。
+    """
+    valuation = {col: holdings[col] if col in holdings.columns else pd.Series(float('nan'), index=holdings.index)
+                 for col in VALUATION_COLUMNS}
+    value = holdings['Shares_Amount'] * holdings['Stock_Price'] * valuation['Future_Multiplier'].fillna(1.0)
+    value = valuation['Market_Value'].fillna(value).astype('float64')
+
+    currency = holdings['Currency'].astype('string').str.upper()
+    rates = valuation['FX_Rate'].astype('float64').mask(currency == BASE_CURRENCY, 1.0)
+    missing = rates.isna() & value.notna()
+    if missing.any():
+        currencies = sorted(currency[missing].dropna().unique())
+        log = logging.warning if label else logging.debug
+        log(f"{label or 'Holdings'}: {int(missing.sum())} rows without an FX rate "
+            f"({', '.join(currencies) or 'unknown currency'}) have no JPY value")
+    return value, value * rates
+
+
+# 数値 (float64) の列 (正規化後の表をCSVから読み戻す際に使う)
+NUMBER_COLUMNS = {
+    'base_info': ['Cash_Component', 'Shares_Outstanding'] + BASE_VALUATION_COLUMNS,
+    'holdings': ['Shares_Amount', 'Stock_Price'] + VALUATION_COLUMNS,
+}
+
+
+def restore_types(df, table='holdings', valuation=False):
+    """
+    正規化後の列名のまま文字列として読み込んだ表 (pcf_stream の CsvSink の出力など) を
+    normalize_base / normalize_holdings の結果と同じ列・型にする。
+    valuation: True の場合は評価額の列も付ける (ない場合は欠損)
+    """
+    columns = {'base_info': BASE_COLUMNS, 'holdings': HOLDING_COLUMNS}[table]
+    if valuation:
+        columns = columns + (BASE_VALUATION_COLUMNS if table == 'base_info' else VALUATION_COLUMNS)
+    numbers = set(NUMBER_COLUMNS[table])
+    cols = {}
+    for col in columns:
+        if col not in df.columns:
+            cols[col] = pd.Series(float('nan') if col in numbers else pd.NA, index=df.index,
+                                  dtype='float64' if col in numbers else 'string')
+        elif col == 'Fund_Date':
+            cols[col] = pd.to_datetime(df[col], format='%Y-%m-%d').astype('datetime64[ns]')
+        elif col in numbers:
+            cols[col] = _to_number(df[col])
+        else:
+            cols[col] = _text_series(df[col])
+    return pd.DataFrame(cols, index=df.index).reset_index(drop=True)
+
+# --- メモリ上で保持するための省メモリな型 ---
+# 正規化後の表 (BASE_COLUMNS / HOLDING_COLUMNS) を次の型に変換する (compact) ・元に戻す (expand)。
+#   - 値の種類が少ない文字列の列 (ETFコード・銘柄コード・市場・通貨・source など) はカテゴリ型 (辞書エンコード)
+#   - ISINは12バイトの固定長バイト列 (Arrowの fixed_size_binary[12])
+#   - Fund_Date は1970-01-01からの日数 (int32)
+#   - 株数は値がすべて整数の場合のみ int64 (欠損を含む場合は Int64)。小数を含む場合は float64 のまま
+# ISINの変換にのみ pyarrow が必要。
+
+CATEGORY_COLUMNS = {
+    'base_info': ['ETF_Code', 'ETF_Name', 'source'],
+    'holdings': ['ETF_Code', 'Local_Code', 'Stock_Name', 'Exchange', 'Currency', 'source'],
+}
+INTEGER_COLUMNS = {
+    'base_info': ['Shares_Outstanding'],
+    'holdings': ['Shares_Amount'],
+}
+TABLE_COLUMNS = {'base_info': BASE_COLUMNS, 'holdings': HOLDING_COLUMNS}
+
+# float64で誤差なく表せる整数の上限
+_MAX_EXACT_INTEGER = 2 ** 53
+
+
+def to_day_number(dates):
+    """日付の列を1970-01-01からの日数 (int32) にする"""
+    return pd.Series(dates.to_numpy().astype('datetime64[D]').astype('int64').astype('int32'), index=dates.index)
+
+
+def from_day_number(days):
+    """to_day_number の逆変換 (datetime64[ns])"""
+    return pd.Series(pd.to_datetime(days.astype('int64'), unit='D'), index=days.index).astype('datetime64[ns]')
+
+
+def exact_integers(series):
+    """値がすべて整数なら int64 (欠損を含む場合は Int64) に、それ以外はそのまま返す"""
+    values = series.dropna()
+    if not (values % 1 == 0).all() or (values.abs() >= _MAX_EXACT_INTEGER).any():
+        return series
+    return series.astype('int64' if len(values) == len(series) else 'Int64')
+
+
+def _isin_to_fixed(series):
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    values = pa.array(series.astype('string'), type=pa.string(), from_pandas=True)
+    values = pc.cast(pc.cast(values, pa.binary()), pa.binary(ISIN_LENGTH))
+    return pd.Series(pd.arrays.ArrowExtensionArray(values), index=series.index)
+
+
+def _isin_from_fixed(series):
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    values = pc.cast(pc.cast(series.array._pa_array.combine_chunks(), pa.binary()), pa.string())
+    return pd.Series(values.to_pandas(), index=series.index).astype('string')
+
+
+def compact(df, table='holdings'):
+    """正規化後の表を省メモリな型に変換する"""
+    cols = {}
+    for col in df.columns:
+        series = df[col]
+        if col == 'Fund_Date':
+            series = to_day_number(series)
+        elif col == 'ISIN':
+            series = _isin_to_fixed(series)
+        elif col in CATEGORY_COLUMNS[table]:
+            series = series.astype('category')
+        elif col in INTEGER_COLUMNS[table]:
+            series = exact_integers(series)
+        cols[col] = series
+    return pd.DataFrame(cols, index=df.index)
+
+
+def expand(df, table='holdings'):
+    """compact の逆変換 (normalize_base / normalize_holdings と同じ型に戻す)"""
+    cols = {}
+    for col in df.columns:
+        series = df[col]
+        if col == 'Fund_Date':
+            series = from_day_number(series)
+        elif col == 'ISIN':
+            series = _isin_from_fixed(series)
+        elif col in CATEGORY_COLUMNS[table]:
+            series = series.astype('string')
+        elif col in INTEGER_COLUMNS[table]:
+            series = series.astype('float64')
+        cols[col] = series
+    return pd.DataFrame(cols, index=df.index)
+
+
+def concat_compact(frames, table='holdings'):
+    """
+    compact した表を連結する。カテゴリ型の列はカテゴリを合わせて連結する
+    (そのまま pd.concat するとカテゴリが異なる列は文字列に戻ってしまう)。
+    """
+    from pandas.api.types import union_categoricals
+
+    frames = [df for df in frames if df is not None and not df.empty]
+    if not frames:
+        return pd.DataFrame(columns=TABLE_COLUMNS[table])
+    cols = {}
+    for col in frames[0].columns:
+        if col in CATEGORY_COLUMNS[table]:
+            cols[col] = pd.Series(union_categoricals([df[col] for df in frames]))
+        else:
+            cols[col] = pd.concat([df[col] for df in frames], ignore_index=True)
+    return pd.DataFrame(cols)
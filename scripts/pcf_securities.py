@@ -0,0 +1,481 @@
+import os
+import sqlite3
+import logging
+import argparse
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import zenhan
+from rapidfuzz import fuzz, process
+
+from pcf_dedup import DEFAULT_PRIORITY
+
+# 銘柄マスタ (MASTER_STOCK) の名寄せ。ベンダーごとに表記の異なる銘柄名 (略称・全角・末尾の 'ORD' など) から
+# ISINごとに1つの銘柄名を選ぶ。結果は SQLite に保存し、次回以降は新しく現れた銘柄名だけを比べる。
+#   1. 銘柄名を zenhan で正規化する (全角英数字 -> 半角、半角カナ -> 全角)。1日分の一意な銘柄名をまとめて1回で変換する
+#   2. ISINごとの銘柄名の候補のうち、他の候補との類似度 (rapidfuzz) の合計が最も大きいものを選ぶ
+#      (候補をまとめた行列を process.cdist で一括で求め、同じISINの組だけを使う)
+#   3. ISINのない行は、取引所・通貨・銘柄コードの先頭 (ブロック) が同じ銘柄とだけ比べ、類似度が MATCH_SCORE 以上の
+#      銘柄が1つに決まる場合にそのISINを name_match に記録する (先物・現金などはどの銘柄とも一致しない)。
+#      銘柄名から推定したISINは確認用で、保有銘柄には付けない (HOLDING_DETAIL の主キーには使わない)
+# 保有銘柄で置き換えるのは銘柄名だけで、行ごとの銘柄コード・取引所・通貨はベンダーの値のまま残す。
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(script_dir)
+
+SECURITIES_DB = os.path.join(project_root, 'data', 'securities.db')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS security_name (
+    ISIN        TEXT NOT NULL,
+    source      TEXT NOT NULL,
+    Stock_Name  TEXT NOT NULL,
+    name_key    TEXT NOT NULL,
+    Local_Code  TEXT,
+    Exchange    TEXT,
+    Currency    TEXT,
+    first_seen  TEXT,
+    last_seen   TEXT,
+    PRIMARY KEY (ISIN, source, Stock_Name)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS security (
+    ISIN        TEXT NOT NULL PRIMARY KEY,
+    Stock_Name  TEXT NOT NULL,
+    name_key    TEXT NOT NULL,
+    Local_Code  TEXT,
+    Exchange    TEXT,
+    Currency    TEXT,
+    names       INTEGER,
+    min_score   REAL,
+    updated_at  TEXT
+) WITHOUT ROWID;
+
+-- ISINのない行の照合の候補 (ブロックごとの銘柄)
+CREATE TABLE IF NOT EXISTS security_block (
+    block       TEXT NOT NULL,
+    ISIN        TEXT NOT NULL,
+    PRIMARY KEY (block, ISIN)
+) WITHOUT ROWID;
+
+-- ISINのない銘柄名の照合結果 (確認用。candidates: 照合したときのブロックの銘柄数。増えた場合は照合し直す)
+CREATE TABLE IF NOT EXISTS name_match (
+    block       TEXT NOT NULL,
+    name_key    TEXT NOT NULL,
+    ISIN        TEXT,
+    score       REAL,
+    candidates  INTEGER,
+    resolved_at TEXT,
+    PRIMARY KEY (block, name_key)
+) WITHOUT ROWID;
+"""
+
+# 銘柄名の選択に使う類似度 (略称・途中で切れた名前にも高い値を返す)
+CANONICAL_SCORER = fuzz.WRatio
+# ISINのない行の照合に使う類似度と、一致とみなす値
+MATCH_SCORER = fuzz.token_sort_ratio
+MATCH_SCORE = 90
+# 同じISINの銘柄名の類似度がこれより低いものがある場合 (社名変更・ベンダーの誤りなど) は警告を出す
+CONFLICT_SCORE = 50
+
+# 銘柄名の代わりに識別コード (CUSIP・SEDOL など) が入っている値。銘柄名として選ばない
+_CODE_LIKE_PATTERN = r'(?=.*\d)[A-Z0-9]{6,12}'
+
+# ブロックに使う銘柄コードの先頭の文字数
+CODE_PREFIX = 2
+
+# 1回の process.cdist で比べる銘柄名の数 (行列の大きさはこの2乗)
+_CDIST_CHUNK = 2000
+
+# SQLiteの変数の上限より少ない、IN句1回あたりの値の数
+_IN_CHUNK = 500
+
+# ブロックに使う取引所コード (ベンダーごとに異なる表記を MIC にそろえる。ない場合はそのまま使う)
+EXCHANGE_ALIASES = {
+    'TSE': 'XTKS', 'JT': 'XTKS', 'JP': 'XTKS', 'OSE': 'XOSE',
+    'NYSE': 'XNYS', 'UN': 'XNYS', 'NASDAQ': 'XNAS', 'UW': 'XNAS', 'UQ': 'XNAS', 'XNGS': 'XNAS', 'XNMS': 'XNAS',
+    'HK': 'XHKG', 'LN': 'XLON', 'GY': 'XETR', 'AT': 'XASX', 'AU': 'XASX', 'DH': 'XADS', 'NONE': '',
+}
+
+# 照合用のキーで空白にする文字 (英数字・かな・漢字以外)。pyarrow の文字列では \w が ASCII のみになるため文字の範囲で指定する
+_SYMBOL_PATTERN = r'[^0-9A-Z々ぁ-ヿ㐀-鿿]+'
+
+# 照合用のキーで末尾から除く語 (法人格・株式の種類などベンダーによって付いたり付かなかったりするもの)
+_SUFFIX_PATTERN = (
+    r'(?:\s+(?:ORD|ORDINARY|SHS|INC|CORP|CORPORATION|CO|LTD|LIMITED|PLC|AG|SA|NV|KK|HOLDINGS?|REIT|UNITS?|D|N))+$'
+)
+
+
+def clean_names(names):
+    """
+    銘柄名を正規化する (全角英数字・空白 -> 半角、半角カナ -> 全角、連続する空白を1つに)。
+    zenhan の変換は文字ごとのPythonの処理のため、一意な値を改行でつないだ1つの文字列にまとめて1回で変換する。
+    """
+    text = pd.Series(names, dtype='string').str.replace(r'[\r\n]+', ' ', regex=True)
+    uniques = text.dropna().unique()
+    if len(uniques) == 0:
+        return text
+    joined = zenhan.h2z(zenhan.z2h('\n'.join(uniques), zenhan.ASCII | zenhan.DIGIT), zenhan.KANA)
+    converted = pd.Series(joined.split('\n'), index=uniques, dtype='string')
+    text = text.map(converted).astype('string').str.replace(r'\s+', ' ', regex=True).str.strip()
+    return text.mask(text == '')
+
+
+def name_keys(cleaned):
+    """照合用のキー (大文字にして記号を空白にし、末尾の法人格などを除いたもの)"""
+    key = cleaned.str.upper().str.replace(_SYMBOL_PATTERN, ' ', regex=True).str.strip()
+    key = key.str.replace(_SUFFIX_PATTERN, '', regex=True).str.replace('株式会社', '', regex=False).str.strip()
+    return key.fillna('')
+
+
+def block_keys(df, with_code=True):
+    """取引所|通貨|銘柄コードの先頭 のブロックのキー (with_code=False の場合は銘柄コードの部分を空にする)"""
+    exchange = df['Exchange'].astype('string').str.upper().replace(EXCHANGE_ALIASES).fillna('')
+    currency = df['Currency'].astype('string').str.upper().fillna('')
+    prefix = df['Local_Code'].astype('string').str.upper().str[:CODE_PREFIX].fillna('') if with_code else ''
+    return (exchange + '|' + currency + '|' + prefix).astype(object)
+
+
+def _none(values):
+    """欠損 (NaN/NA) を None にした値のリスト (sqlite3 に渡すため)"""
+    return [None if v is None or v is pd.NA or v != v else v for v in values]
+
+
+class SecurityMaster:
+    """銘柄マスタの名寄せの結果を保存するストア"""
+
+    def __init__(self, path=SECURITIES_DB):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @contextmanager
+    def transaction(self):
+        """複数の更新を1トランザクションにまとめる"""
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield self
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+            self._conn.execute('COMMIT')
+
+    def _select_in(self, sql, column, values, columns):
+        """sql の {where} を column IN (...) にして、values を _IN_CHUNK 件ずつ問い合わせる"""
+        values = list(values)
+        rows = []
+        with self._lock:
+            for i in range(0, len(values), _IN_CHUNK):
+                chunk = values[i:i + _IN_CHUNK]
+                rows += self._conn.execute(
+                    sql.format(where=f"{column} IN ({', '.join('?' for _ in chunk)})"), chunk
+                ).fetchall()
+        return pd.DataFrame(rows, columns=columns)
+
+    def update(self, holdings, seen_date=None, priority=None):
+        """
+        正規化済みの保有銘柄に現れた ISIN ごとの銘柄名を保存し、新しい銘柄名が現れたISINだけ銘柄名を選び直す。
+        戻り値: 件数の辞書 (securities: ISINの数, new_names: 新しい銘柄名の数, rescored: 銘柄名を選び直したISINの数)
+        """
+        counts = {'securities': 0, 'new_names': 0, 'rescored': 0}
+        rows = holdings[holdings['ISIN'].notna()]
+        if rows.empty:
+            return counts
+        rows = rows[['ISIN', 'source', 'Stock_Name', 'Local_Code', 'Exchange', 'Currency']].assign(
+            Stock_Name=clean_names(rows['Stock_Name']).to_numpy()
+        )
+        rows = rows[rows['Stock_Name'].notna()].drop_duplicates(['ISIN', 'source', 'Stock_Name'])
+        rows = rows.assign(name_key=name_keys(rows['Stock_Name']).to_numpy())
+        counts['securities'] = int(rows['ISIN'].nunique())
+
+        stored = self._select_in('SELECT ISIN, source, Stock_Name FROM security_name WHERE {where}', 'ISIN',
+                                 rows['ISIN'].unique(), ['ISIN', 'source', 'Stock_Name'])
+        marked = rows.merge(stored.assign(_stored=True), on=['ISIN', 'source', 'Stock_Name'], how='left')
+        new = rows[marked['_stored'].isna().to_numpy()]
+        counts['new_names'] = len(new)
+
+        seen = seen_date or datetime.now().strftime('%Y-%m-%d')
+        fields = ['ISIN', 'source', 'Stock_Name', 'name_key', 'Local_Code', 'Exchange', 'Currency']
+        with self.transaction():
+            self._conn.executemany(
+                f"INSERT INTO security_name ({', '.join(fields)}, first_seen, last_seen) "
+                f"VALUES ({', '.join('?' for _ in fields)}, ?, ?) "
+                "ON CONFLICT (ISIN, source, Stock_Name) DO UPDATE SET "
+                "Local_Code = COALESCE(excluded.Local_Code, Local_Code), Exchange = COALESCE(excluded.Exchange, Exchange), "
+                "Currency = COALESCE(excluded.Currency, Currency), last_seen = MAX(last_seen, excluded.last_seen)",
+                list(zip(*[_none(rows[col].tolist()) for col in fields], [seen] * len(rows), [seen] * len(rows)))
+            )
+        if new.empty:
+            return counts
+
+        affected = new['ISIN'].unique()
+        variants = self._select_in(f"SELECT {', '.join(fields)} FROM security_name WHERE {{where}}", 'ISIN',
+                                   affected, fields)
+        chosen = choose_names(variants, priority)
+        counts['rescored'] = len(chosen)
+        _log_conflicts(chosen, variants)
+
+        blocks = pd.concat([
+            pd.DataFrame({'block': block_keys(variants), 'ISIN': variants['ISIN']}),
+            pd.DataFrame({'block': block_keys(variants, with_code=False), 'ISIN': variants['ISIN']}),
+        ]).drop_duplicates()
+        now = datetime.now().isoformat(timespec='seconds')
+        master_fields = ['ISIN', 'Stock_Name', 'name_key', 'Local_Code', 'Exchange', 'Currency', 'names', 'min_score']
+        with self.transaction():
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO security ({', '.join(master_fields)}, updated_at) "
+                f"VALUES ({', '.join('?' for _ in master_fields)}, ?)",
+                list(zip(*[_none(chosen[col].tolist()) for col in master_fields], [now] * len(chosen)))
+            )
+            self._conn.executemany('INSERT OR IGNORE INTO security_block (block, ISIN) VALUES (?, ?)',
+                                   list(zip(blocks['block'], blocks['ISIN'])))
+        return counts
+
+    def resolve(self, holdings):
+        """
+        ISINのない行の銘柄名をブロック内の銘柄と照合する。保存済みの結果はブロックの銘柄が増えていなければそのまま使う。
+        戻り値: 行ごとのISIN (holdings と同じ index。一致しない行・ISINのある行は欠損)
+        """
+        result = pd.Series(pd.NA, index=holdings.index, dtype='string')
+        rows = holdings[holdings['ISIN'].isna() & holdings['Stock_Name'].notna()]
+        if rows.empty:
+            return result
+        queries = pd.DataFrame({
+            'block': block_keys(rows).to_numpy(),
+            'name_key': name_keys(clean_names(rows['Stock_Name'])).to_numpy(),
+        }, index=rows.index)
+        queries = queries[queries['name_key'] != '']
+        unique = queries.drop_duplicates()
+
+        sizes = self._select_in('SELECT block, COUNT(*) FROM security_block WHERE {where} GROUP BY block', 'block',
+                                unique['block'].unique(), ['block', 'size'])
+        cached = self._select_in('SELECT block, name_key, ISIN, candidates FROM name_match WHERE {where}', 'block',
+                                 unique['block'].unique(), ['block', 'name_key', 'ISIN', 'candidates'])
+        unique = unique.merge(sizes, on='block', how='left').merge(cached, on=['block', 'name_key'], how='left')
+        unique['size'] = unique['size'].fillna(0).astype('int64')
+        stale = unique['candidates'].isna() | (unique['candidates'] != unique['size'])
+        matches = unique.loc[~stale, ['block', 'name_key', 'ISIN']]
+
+        scored = [self._match_block(block, group['name_key'].tolist(), size)
+                  for (block, size), group in unique[stale].groupby(['block', 'size'], sort=False)]
+        if scored:
+            scored = pd.concat(scored, ignore_index=True)
+            now = datetime.now().isoformat(timespec='seconds')
+            with self.transaction():
+                self._conn.executemany(
+                    'INSERT OR REPLACE INTO name_match (block, name_key, ISIN, score, candidates, resolved_at) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    list(zip(scored['block'], scored['name_key'], _none(scored['ISIN'].tolist()),
+                             scored['score'].tolist(), scored['candidates'].tolist(), [now] * len(scored)))
+                )
+            matches = pd.concat([matches, scored[['block', 'name_key', 'ISIN']]], ignore_index=True)
+            logging.info(f"Matched {len(scored)} new security names without an ISIN "
+                         f"({int(scored['ISIN'].notna().sum())} resolved)")
+
+        isin = matches.set_index(['block', 'name_key'])['ISIN']
+        found = isin.reindex(pd.MultiIndex.from_frame(queries[['block', 'name_key']])).to_numpy()
+        result.loc[queries.index] = pd.array(found, dtype='string')
+        return result
+
+    def _match_block(self, block, keys, size):
+        """1つのブロックの銘柄名をブロック内の銘柄と一括で照合する"""
+        out = pd.DataFrame({'block': block, 'name_key': keys, 'ISIN': None, 'score': 0.0, 'candidates': size})
+        if size == 0:
+            return out
+        with self._lock:
+            candidates = pd.DataFrame(self._conn.execute(
+                'SELECT s.ISIN, s.name_key FROM security_block b JOIN security s ON s.ISIN = b.ISIN WHERE b.block = ?',
+                (block,)
+            ).fetchall(), columns=['ISIN', 'name_key'])
+        if candidates.empty:
+            return out
+        scores = process.cdist(keys, candidates['name_key'].tolist(), scorer=MATCH_SCORER, workers=-1)
+        best = scores.argmax(axis=1)
+        best_score = scores[np.arange(len(keys)), best]
+        isins = candidates['ISIN'].to_numpy()
+        # 最も高い値の銘柄が複数のISINにある場合は決めない
+        ties = (scores == best_score[:, None]) & (isins[None, :] != isins[best][:, None])
+        resolved = (best_score >= MATCH_SCORE) & ~ties.any(axis=1)
+        out['ISIN'] = np.where(resolved, isins[best], None)
+        out['score'] = best_score.astype('float64')
+        return out
+
+    def apply(self, holdings, seen_date=None, priority=None):
+        """
+        update() と resolve() を行い、ISINのある行の銘柄名をISINごとに選んだ銘柄名にした保有銘柄を返す
+        (MASTER_STOCK が ISIN ごとに1つの銘柄名になる)。
+        ISIN・銘柄コード・取引所・通貨は変えない。ISINのない行の照合結果は name_match に記録するだけで
+        (matched() / unresolved() で確認する)、保有銘柄には付けない。
+        """
+        if holdings is None or holdings.empty:
+            return holdings
+        counts = self.update(holdings, seen_date, priority)
+        matched = self.resolve(holdings)
+
+        master = self.lookup(holdings['ISIN'].dropna().unique())
+        if not master.empty:
+            holdings = holdings.copy()
+            names = master.set_index('ISIN')['Stock_Name']
+            known = holdings['ISIN'].isin(names.index)
+            values = holdings.loc[known, 'ISIN'].map(names).astype(holdings['Stock_Name'].dtype)
+            holdings.loc[known, 'Stock_Name'] = values.fillna(holdings.loc[known, 'Stock_Name'])
+        logging.info(f"Security master: {counts['securities']} securities, {counts['new_names']} new names, "
+                     f"{counts['rescored']} names chosen again; {int(matched.notna().sum())} rows without an ISIN "
+                     f"matched a security by name (recorded for review, not loaded)")
+        return holdings
+
+    def lookup(self, isins):
+        """ISINごとに選んだ銘柄名など (security の行)"""
+        return self._select_in(
+            'SELECT ISIN, Stock_Name, Local_Code, Exchange, Currency, names, min_score FROM security WHERE {where}',
+            'ISIN', isins, ['ISIN', 'Stock_Name', 'Local_Code', 'Exchange', 'Currency', 'names', 'min_score'])
+
+    def names(self, isins):
+        """ISINごとのベンダーの銘柄名の一覧"""
+        return self._select_in(
+            'SELECT ISIN, source, Stock_Name, Local_Code, Exchange, first_seen, last_seen FROM security_name '
+            'WHERE {where} ORDER BY ISIN, source', 'ISIN', isins,
+            ['ISIN', 'source', 'Stock_Name', 'Local_Code', 'Exchange', 'first_seen', 'last_seen'])
+
+    def matched(self):
+        """ISINのない行の銘柄名から推定したISINと、そのISINで選んだ銘柄名 (確認用)"""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT m.block, m.name_key, m.ISIN, s.Stock_Name, m.score, m.resolved_at FROM name_match m '
+                'LEFT JOIN security s ON s.ISIN = m.ISIN WHERE m.ISIN IS NOT NULL ORDER BY m.block, m.name_key'
+            ).fetchall()
+        return pd.DataFrame(rows, columns=['block', 'name_key', 'ISIN', 'Stock_Name', 'score', 'resolved_at'])
+
+    def unresolved(self):
+        """照合してもISINが決まらなかった銘柄名 (先物・現金など)"""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT block, name_key, score, resolved_at FROM name_match WHERE ISIN IS NULL ORDER BY block, name_key'
+            ).fetchall()
+        return pd.DataFrame(rows, columns=['block', 'name_key', 'score', 'resolved_at'])
+
+    def export(self):
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT ISIN, Local_Code, Stock_Name, Exchange, Currency FROM security ORDER BY ISIN').fetchall()
+        return pd.DataFrame(rows, columns=['ISIN', 'Local_Code', 'Stock_Name', 'Exchange', 'Currency'])
+
+
+def choose_names(variants, priority=None):
+    """
+    ISINごとに、同じISINの他の銘柄名との類似度の合計が最も大きい銘柄名を選ぶ
+    (識別コードのような値は他にない場合のみ選ぶ。同じ値の場合はベンダーの優先順位、長い名前の順)。
+    ISINの境界で区切った _CDIST_CHUNK 件ずつの類似度の行列を process.cdist で求め、同じISINの組だけを合計する。
+    戻り値: ISINごとに1行 (variants の列と names: 銘柄名の数, min_score: 選んだ銘柄名と他の銘柄名の類似度の最小値)
+    """
+    order = {vendor: i for i, vendor in enumerate(priority or DEFAULT_PRIORITY)}
+    variants = variants.sort_values(['ISIN', 'source', 'Stock_Name'], kind='stable').reset_index(drop=True)
+    isins = variants['ISIN'].to_numpy()
+    keys = variants['name_key'].tolist()
+
+    total = np.zeros(len(variants))
+    min_score = np.full(len(variants), 100.0)
+    # ISINの境界が _CDIST_CHUNK 件ごとの区切りにかからないよう、区切りをISINの先頭の行にずらす
+    starts = np.flatnonzero(np.r_[True, isins[1:] != isins[:-1]])
+    bounds = [0]
+    for start in starts:
+        if start - bounds[-1] >= _CDIST_CHUNK:
+            bounds.append(start)
+    bounds.append(len(variants))
+    for lo, hi in zip(bounds[:-1], bounds[1:]):
+        scores = process.cdist(keys[lo:hi], keys[lo:hi], scorer=CANONICAL_SCORER, workers=-1)
+        same = isins[lo:hi, None] == isins[None, lo:hi]
+        total[lo:hi] = np.where(same, scores, 0).sum(axis=1)
+        min_score[lo:hi] = np.where(same, scores, 100.0).min(axis=1)
+
+    variants = variants.assign(
+        _code=variants['Stock_Name'].str.fullmatch(_CODE_LIKE_PATTERN).to_numpy(dtype=bool),
+        _total=total, min_score=min_score,
+        _rank=variants['source'].map(order).fillna(len(order)).to_numpy(),
+        _length=variants['Stock_Name'].str.len().to_numpy(),
+        names=variants.groupby('ISIN')['ISIN'].transform('size').to_numpy(),
+    )
+    chosen = variants.sort_values(['ISIN', '_code', '_total', '_rank', '_length'],
+                                  ascending=[True, True, False, True, False], kind='stable').drop_duplicates('ISIN')
+    return chosen.drop(columns=['_code', '_total', '_rank', '_length']).reset_index(drop=True)
+
+
+def _log_conflicts(chosen, variants, limit=10):
+    conflicts = chosen[chosen['min_score'] < CONFLICT_SCORE]
+    if conflicts.empty:
+        return
+    logging.warning(f"{len(conflicts)} ISINs have dissimilar names across vendors (renamed or mislabeled)")
+    for row in conflicts.head(limit).itertuples(index=False):
+        others = variants.loc[(variants['ISIN'] == row.ISIN) & (variants['Stock_Name'] != row.Stock_Name), 'Stock_Name']
+        logging.warning(f"  {row.ISIN}: using {row.Stock_Name!r}, also {', '.join(map(repr, others.unique()))}")
+
+
+def resolve_securities(holdings, seen_date=None, path=SECURITIES_DB, priority=None):
+    """銘柄マスタのストアを開いて SecurityMaster.apply() を行う"""
+    with SecurityMaster(path) as master:
+        return master.apply(holdings, seen_date, priority)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Resolve one clean security name per ISIN across vendors.")
+    parser.add_argument("--db", default=SECURITIES_DB, help=f"Security master store (default: {SECURITIES_DB}).")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('update', help="Add the names in the parsed CSV output of one or more dates (load_pcfs.py does this automatically).")
+    p.add_argument("dates", nargs='+', help="Parse dates (YYYY-MM-DD).")
+    p.add_argument("--data-dir", default='data', help="Directory containing the parsed output (default: data).")
+
+    p = sub.add_parser('show', help="Show the chosen name and all vendor names of ISINs.")
+    p.add_argument("isins", nargs='+', help="ISINs, e.g. JP3633400001.")
+
+    sub.add_parser('matched', help="List names without an ISIN and the ISIN inferred from them, for review (never loaded).")
+    sub.add_parser('unresolved', help="List names without an ISIN that matched no security.")
+
+    p = sub.add_parser('export', help="Write one row per ISIN (the MASTER_STOCK columns) to a CSV file.")
+    p.add_argument("--output", default='security_master.csv', help="Output CSV file (default: security_master.csv).")
+    args = parser.parse_args()
+
+    with SecurityMaster(args.db) as master:
+        if args.command == 'update':
+            from load_pcfs import read_parsed_csv
+            for d in sorted(args.dates):
+                _, holdings = read_parsed_csv(d, args.data_dir)
+                if holdings is None:
+                    logging.warning(f"No parsed data found for {d}")
+                    continue
+                master.apply(holdings, d)
+        elif args.command == 'show':
+            print(master.lookup(args.isins).to_string(index=False))
+            print()
+            print(master.names(args.isins).to_string(index=False))
+        elif args.command == 'matched':
+            print(master.matched().to_string(index=False))
+        elif args.command == 'unresolved':
+            print(master.unresolved().to_string(index=False))
+        else:
+            df = master.export()
+            df.to_csv(args.output, index=False, encoding='utf-8-sig')
+            logging.info(f"Saved {len(df)} securities to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,245 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+import pandas as pd
+
+# このスクリプトがどこから実行されても正しくパスを解決するための設定
+script_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(script_dir)
+
+STATE_DB = os.path.join(project_root, 'data', 'pcf_state.db')
+LEGACY_LOG_CSV = os.path.join(project_root, 'download_log.csv')
+
+# 状態を表す列 (0: 未完了, 1: 完了)
+STATUS_COLUMNS = ['download_status', 'unzip_status', 'parse_status', 'load_status']
+
+# download_log.csv の列名 -> 状態ストアの列名
+# (旧ログの flag_load_* は「ダウンロード済み」を意味する)
+LEGACY_FLAGS = {
+    'flag_load': 'download_status',
+    'flag_unzip': 'unzip_status',
+}
+LEGACY_VENDORS = ['ice', 'ihs', 'solactive']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS archive_state (
+    vendor          TEXT    NOT NULL,
+    date            TEXT    NOT NULL,
+    download_status INTEGER NOT NULL DEFAULT 0,
+    unzip_status    INTEGER NOT NULL DEFAULT 0,
+    parse_status    INTEGER NOT NULL DEFAULT 0,
+    load_status     INTEGER NOT NULL DEFAULT 0,
+    size            INTEGER,
+    sha256          TEXT,
+    etag            TEXT,
+    last_modified   TEXT,
+    checked_at      TEXT,
+    changed_at      TEXT,
+    miss_count      INTEGER NOT NULL DEFAULT 0,
+    miss_reason     TEXT,
+    last_miss_at    TEXT,
+    updated_at      TEXT,
+    PRIMARY KEY (vendor, date)
+) WITHOUT ROWID;
+"""
+
+# 既存のDBに後から追加した列 (列名 -> 型)
+ADDED_COLUMNS = {
+    'etag': 'TEXT',
+    'last_modified': 'TEXT',
+    'checked_at': 'TEXT',
+    'changed_at': 'TEXT',
+    'miss_count': 'INTEGER NOT NULL DEFAULT 0',
+    'miss_reason': 'TEXT',
+    'last_miss_at': 'TEXT',
+}
+
+
+def to_date_key(d):
+    """日付 (str/date/datetime/Timestamp) を 'YYYY-MM-DD' のキーに変換する"""
+    if isinstance(d, str):
+        return pd.Timestamp(d).strftime('%Y-%m-%d')
+    return d.strftime('%Y-%m-%d')
+
+
+class StateStore:
+    """
+    (vendor, date) をキーとするアーカイブ処理状態のストア (SQLite)。
+    1件の更新は主キーに対するUPSERT 1回で完了し、ファイル全体を書き直すことはない。
+    WALモードで開くため、複数スレッド・複数プロセスから同時に読み書きできる。
+    """
+
+    def __init__(self, path=STATE_DB):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(SCHEMA)
+        self._migrate()
+
+    def _migrate(self):
+        """古いスキーマで作成されたDBに不足している列を追加する"""
+        existing = {row['name'] for row in self._conn.execute('PRAGMA table_info(archive_state)')}
+        for col, col_type in ADDED_COLUMNS.items():
+            if col not in existing:
+                self._conn.execute(f'ALTER TABLE archive_state ADD COLUMN {col} {col_type}')
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @contextmanager
+    def transaction(self):
+        """複数の更新を1トランザクションにまとめる"""
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield self
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+            self._conn.execute('COMMIT')
+
+    def get(self, vendor, date):
+        """1件の状態を辞書で返す。存在しない場合はNone"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT * FROM archive_state WHERE vendor = ? AND date = ?',
+                (vendor, to_date_key(date))
+            ).fetchone()
+        return dict(row) if row else None
+
+    def update(self, vendor, date, **fields):
+        """
+        1件の状態を更新する (行がなければ作成する)。
+        例: store.update('ice', '2025-12-05', download_status=1, size=123, sha256='...')
+        """
+        if not fields:
+            return
+        fields['updated_at'] = datetime.now().isoformat(timespec='seconds')
+        cols = list(fields)
+        placeholders = ', '.join('?' for _ in cols)
+        assignments = ', '.join(f'{c} = excluded.{c}' for c in cols)
+        sql = (
+            f"INSERT INTO archive_state (vendor, date, {', '.join(cols)}) VALUES (?, ?, {placeholders}) "
+            f"ON CONFLICT (vendor, date) DO UPDATE SET {assignments}"
+        )
+        with self._lock:
+            self._conn.execute(sql, (vendor, to_date_key(date), *fields.values()))
+
+    def dates_with(self, vendor, start=None, end=None, **conditions):
+        """
+        条件に一致する日付キーの集合を返す。
+        例: store.dates_with('ice', '2025-07-01', '2025-07-31', download_status=1)
+        """
+        sql = 'SELECT date FROM archive_state WHERE vendor = ?'
+        params = [vendor]
+        if start is not None:
+            sql += ' AND date >= ?'
+            params.append(to_date_key(start))
+        if end is not None:
+            sql += ' AND date <= ?'
+            params.append(to_date_key(end))
+        for col, value in conditions.items():
+            sql += f' AND {col} = ?'
+            params.append(value)
+        with self._lock:
+            return {row['date'] for row in self._conn.execute(sql, params)}
+
+    def records(self, vendor, start=None, end=None):
+        """期間内のレコードを {日付キー: 辞書} で返す"""
+        sql = 'SELECT * FROM archive_state WHERE vendor = ?'
+        params = [vendor]
+        if start is not None:
+            sql += ' AND date >= ?'
+            params.append(to_date_key(start))
+        if end is not None:
+            sql += ' AND date <= ?'
+            params.append(to_date_key(end))
+        with self._lock:
+            return {row['date']: dict(row) for row in self._conn.execute(sql, params)}
+
+    def record_miss(self, vendor, date, reason):
+        """未公開 (404・ZIP以外の応答など) だったことを記録する"""
+        now = datetime.now().isoformat(timespec='seconds')
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO archive_state (vendor, date, miss_count, miss_reason, last_miss_at, checked_at, updated_at) "
+                "VALUES (?, ?, 1, ?, ?, ?, ?) "
+                "ON CONFLICT (vendor, date) DO UPDATE SET miss_count = miss_count + 1, miss_reason = excluded.miss_reason, "
+                "last_miss_at = excluded.last_miss_at, checked_at = excluded.checked_at, updated_at = excluded.updated_at",
+                (vendor, to_date_key(date), reason, now, now, now)
+            )
+
+    def to_frame(self):
+        """全件をDataFrameで返す"""
+        with self._lock:
+            return pd.read_sql_query('SELECT * FROM archive_state ORDER BY date, vendor', self._conn)
+
+    def is_empty(self):
+        with self._lock:
+            return self._conn.execute('SELECT 1 FROM archive_state LIMIT 1').fetchone() is None
+
+    def import_legacy_log(self, csv_path=LEGACY_LOG_CSV):
+        """
+        旧形式の download_log.csv (日付 x ベンダーのフラグ列) を取り込む。
+        取り込んだ行数を返す。
+        """
+        if not os.path.exists(csv_path):
+            return 0
+        log_df = pd.read_csv(csv_path, dtype={'date': str})
+        rows = []
+        for vendor in LEGACY_VENDORS:
+            cols = [f'{flag}_{vendor}' for flag in LEGACY_FLAGS]
+            if not all(c in log_df.columns for c in cols):
+                continue
+            flags = log_df[cols].fillna(0).astype(int)
+            for date, values in zip(log_df['date'], flags.itertuples(index=False)):
+                rows.append((vendor, to_date_key(date), *values))
+        status_cols = ', '.join(LEGACY_FLAGS.values())
+        with self.transaction():
+            self._conn.executemany(
+                f"INSERT OR IGNORE INTO archive_state (vendor, date, {status_cols}) VALUES (?, ?, ?, ?)",
+                rows
+            )
+        return len(rows)
+
+    def export_legacy_log(self, csv_path=LEGACY_LOG_CSV):
+        """
+        状態を旧形式の download_log.csv として書き出す (一時ファイル経由で置き換え)。
+        """
+        df = self.to_frame()
+        if df.empty:
+            return
+        legacy = {}
+        for flag, col in LEGACY_FLAGS.items():
+            wide = df.pivot(index='date', columns='vendor', values=col)
+            for vendor in LEGACY_VENDORS:
+                legacy[f'{flag}_{vendor}'] = wide[vendor] if vendor in wide.columns else 0
+        cols = [f'{flag}_{vendor}' for vendor in LEGACY_VENDORS for flag in LEGACY_FLAGS]
+        out = pd.DataFrame(legacy)[cols].fillna(0).astype(int).sort_index(ascending=False)
+        tmp_path = csv_path + '.tmp'
+        out.to_csv(tmp_path, index_label='date')
+        os.replace(tmp_path, csv_path)
+
+
+def open_store(path=STATE_DB, legacy_log=LEGACY_LOG_CSV):
+    """
+    状態ストアを開く。新規作成時は既存の download_log.csv を取り込む。
+    """
+    store = StateStore(path)
+    if store.is_empty():
+        store.import_legacy_log(legacy_log)
+    return store
@@ -0,0 +1,318 @@
+import os
+import time
+import logging
+import argparse
+from collections import deque
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from parse_pcfs_by_date import find_archives, list_work_items, parse_member, OUTPUT_DIR
+from pcf_schema import normalize_base, normalize_holdings, BASE_COLUMNS, HOLDING_COLUMNS
+from pcf_dedup import fund_hashes, parse_priority, DEFAULT_PRIORITY, FUND_KEY
+
+# 解析結果をZIPメンバー (ETF) 単位のバッチとして順に受け取り、出力先 (シンク) に一定の行数ごとに書き出す。
+# 1日分の全ETFを連結してから保存する parse_by_date と違い、同時にメモリに載るのは
+# 解析中のバッチ (最大 window 件) とシンクのバッファ (最大 chunk_rows 行) だけになる。
+
+# 各シンクが1回に書き出す行数
+DEFAULT_CHUNK_ROWS = 50000
+
+TABLES = {'base_info': BASE_COLUMNS, 'holdings': HOLDING_COLUMNS}
+
+
+def parse_member_normalized(work_item):
+    """
+    1つのZIPメンバーを解析し、pcf_schema の列 (評価額の列を含む) に揃えた (基本情報, 保有銘柄) を返す (ワーカーからも呼ばれる)。
+    work_item: (zipファイルのパス, メンバー名, source, 解析日)
+    """
+    zip_path, csv_file_name, source, run_date = work_item
+    df_base, df_holdings = parse_member((zip_path, csv_file_name, source))
+    if df_base is None:
+        return None, None
+    base = normalize_base(df_base, default_date=run_date, valuation=True)
+    holdings = normalize_holdings(df_holdings, base, valuation=True) if df_holdings is not None else None
+    return base, holdings
+
+
+def _ordered_map(func, items, executor=None, window=16):
+    """
+    items に func を適用した結果を入力順に返すジェネレータ。
+    executor を指定した場合も、同時に実行中・結果待ちのタスクは window 件までに抑える。
+    """
+    if executor is None:
+        for item in items:
+            yield func(item)
+        return
+    pending = deque()
+    for item in items:
+        pending.append(executor.submit(func, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def iter_batches(target_date_str, workers=1, executor=None, vendors=None, window=None, priority=None):
+    """
+    指定日のアーカイブを解析し、ZIPメンバーごとに正規化した (基本情報, 保有銘柄) を順に返すジェネレータ。
+    アーカイブはベンダーの優先順位 priority の順に処理する (同じETFは優先するベンダーのものが先に出現する)。
+    """
+    target_date = datetime.strptime(target_date_str, '%Y-%m-%d')
+    order = {vendor: i for i, vendor in enumerate(priority or DEFAULT_PRIORITY)}
+    archives = sorted(find_archives(target_date, vendors), key=lambda item: order.get(item[0], len(order)))
+    found_files = [path for _, path in archives]
+    if not found_files:
+        logging.warning(f"No zip files found for date {target_date_str}")
+        return
+    work_items = [item + (target_date_str,) for item in list_work_items(found_files)]
+    window = window or max(1, workers) * 4
+    for base, holdings in _ordered_map(parse_member_normalized, work_items, executor, window):
+        if base is not None:
+            yield base, holdings
+
+
+class ChunkedSink:
+    """
+    バッチを受け取り、テーブルごとに chunk_rows 行たまるたびに _write_chunk() で書き出すシンクの基底クラス
+    """
+
+    def __init__(self, run_date, chunk_rows=DEFAULT_CHUNK_ROWS):
+        self.run_date = run_date
+        self.chunk_rows = chunk_rows
+        self.rows = {table: 0 for table in TABLES}
+        self._buffers = {table: [] for table in TABLES}
+        self._buffered = {table: 0 for table in TABLES}
+        self._chunks = {table: 0 for table in TABLES}
+
+    def open(self):
+        pass
+
+    def write(self, base, holdings):
+        for table, df in [('base_info', base), ('holdings', holdings)]:
+            if df is None or df.empty:
+                continue
+            self._buffers[table].append(df)
+            self._buffered[table] += len(df)
+            if self._buffered[table] >= self.chunk_rows:
+                self._flush(table)
+
+    def _flush(self, table):
+        if not self._buffers[table]:
+            return
+        df = pd.concat(self._buffers[table], ignore_index=True)
+        self._buffers[table] = []
+        self._buffered[table] = 0
+        self._write_chunk(table, df, self._chunks[table])
+        self._chunks[table] += 1
+        self.rows[table] += len(df)
+
+    def close(self):
+        for table in TABLES:
+            self._flush(table)
+        self._finish()
+
+    def abort(self):
+        pass
+
+    def _write_chunk(self, table, df, chunk):
+        raise NotImplementedError
+
+    def _finish(self):
+        pass
+
+
+class CsvSink(ChunkedSink):
+    """
+    正規化した列 (評価額の列を含む) のCSVに追記する (data/fund_daily_<日付>.csv, data/holding_detail_<日付>.csv)。
+    書き込み中は一時ファイルに書き、close() で置き換える。
+    load_pcfs.read_parsed_csv は parse_pcfs_by_date.py の出力がない日付ではこのファイルを読む。
+    """
+
+    FILE_NAMES = {'base_info': 'fund_daily', 'holdings': 'holding_detail'}
+
+    def __init__(self, run_date, output_dir=OUTPUT_DIR, chunk_rows=DEFAULT_CHUNK_ROWS):
+        super().__init__(run_date, chunk_rows)
+        self.paths = {table: os.path.join(output_dir, f"{name}_{run_date}.csv") for table, name in self.FILE_NAMES.items()}
+        os.makedirs(output_dir, exist_ok=True)
+
+    def _write_chunk(self, table, df, chunk):
+        df = df.assign(Fund_Date=df['Fund_Date'].dt.strftime('%Y-%m-%d'))
+        df.to_csv(self.paths[table] + '.tmp', mode='w' if chunk == 0 else 'a', header=chunk == 0,
+                  index=False, encoding='utf-8-sig' if chunk == 0 else 'utf-8')
+
+    def _finish(self):
+        for table, path in self.paths.items():
+            if self._chunks[table]:
+                os.replace(path + '.tmp', path)
+                logging.info(f"Saved {self.rows[table]} rows to {path}")
+
+    def abort(self):
+        for path in self.paths.values():
+            if os.path.exists(path + '.tmp'):
+                os.remove(path + '.tmp')
+
+
+class ColumnarSink(ChunkedSink):
+    """列指向ストア (data/columnar) に chunk_rows 行ごとのファイルとして追加する"""
+
+    def __init__(self, run_date, fmt='parquet', output_dir=OUTPUT_DIR, chunk_rows=DEFAULT_CHUNK_ROWS):
+        super().__init__(run_date, chunk_rows)
+        self.fmt = fmt
+        self.base_dir = os.path.join(output_dir, 'columnar')
+
+    def open(self):
+        from pcf_columnar import clear_run
+        for table in TABLES:
+            clear_run(table, self.run_date, self.fmt, base_dir=self.base_dir)
+
+    def _write_chunk(self, table, df, chunk):
+        from pcf_columnar import write_partitions
+        write_partitions(df, table, self.run_date, self.fmt, base_dir=self.base_dir, part=chunk)
+
+    def _finish(self):
+        logging.info(f"Saved {self.rows['base_info']} base info and {self.rows['holdings']} holdings rows to {self.base_dir} ({self.fmt})")
+
+
+class DatabaseSink(ChunkedSink):
+    """
+    load_pcfs のローダーでステージングテーブルに chunk_rows 行ごとに追加し、close() でまとめて反映する
+    (1日分を1トランザクションで登録する)。
+    同じETFを複数のベンダーが公開した場合は先に受け取ったベンダー (iter_batches の優先順位で先のもの) を残し、
+    後から来たベンダーのものは内容のハッシュを比べてログに出力したうえで登録しない
+    (チャンクをまたいでも基本情報と保有銘柄でベンダーが混ざらないようにする)。
+    """
+
+    def __init__(self, run_date, loader, chunk_rows=DEFAULT_CHUNK_ROWS):
+        super().__init__(run_date, chunk_rows)
+        self.loader = loader
+        # (Fund_Date, ETF_Code) -> (登録するベンダー, 内容のハッシュ)
+        self._staged = {}
+        self.skipped = {'identical': 0, 'divergent': 0}
+
+    def open(self):
+        self.loader.begin()
+        self._staged = {}
+        self.skipped = {'identical': 0, 'divergent': 0}
+
+    def write(self, base, holdings):
+        if base is None or base.empty:
+            return
+        dropped = []
+        for row in fund_hashes(base, holdings).itertuples(index=False):
+            key = (row.Fund_Date, row.ETF_Code)
+            staged = self._staged.setdefault(key, (row.source, row.content_hash))
+            if staged[0] == row.source:
+                continue
+            dropped.append(key)
+            if staged[1] == row.content_hash:
+                self.skipped['identical'] += 1
+            else:
+                self.skipped['divergent'] += 1
+                logging.warning(f"Divergent copies of {row.ETF_Code} on {pd.Timestamp(row.Fund_Date).date()}: "
+                                f"kept {staged[0]}, dropped {row.source} ({row.holdings_rows} rows)")
+        if dropped:
+            base = base[~base.set_index(FUND_KEY).index.isin(dropped)]
+            if holdings is not None and not holdings.empty:
+                holdings = holdings[~holdings.set_index(FUND_KEY).index.isin(dropped)]
+        super().write(base, holdings)
+
+    def _write_chunk(self, table, df, chunk):
+        from load_pcfs import stage_frames
+        if table == 'base_info':
+            stage_frames(self.loader, df, None)
+        else:
+            stage_frames(self.loader, None, df)
+
+    def close(self):
+        try:
+            super().close()
+        except BaseException:
+            self.abort()
+            raise
+
+    def _finish(self):
+        merged = self.loader.merge()
+        self.loader.commit()
+        if any(self.skipped.values()):
+            logging.info(f"Skipped {sum(self.skipped.values())} duplicate ETF copies from lower-priority vendors "
+                         f"({self.skipped['identical']} identical, {self.skipped['divergent']} divergent)")
+        logging.info(f"Loaded {self.run_date} into the database: {merged}")
+
+    def abort(self):
+        self.loader.rollback()
+
+
+def stream_date(target_date_str, sinks, workers=1, executor=None, vendors=None, priority=None):
+    """
+    1日分の解析結果をすべてのシンクに流す。戻り値: 処理したバッチ (ZIPメンバー) の数
+    priority: ベンダーの優先順位 (アーカイブを処理する順序)
+    """
+    count = 0
+    for sink in sinks:
+        sink.open()
+    try:
+        for base, holdings in iter_batches(target_date_str, workers, executor, vendors, priority=priority):
+            for sink in sinks:
+                sink.write(base, holdings)
+            count += 1
+    except BaseException:
+        for sink in sinks:
+            sink.abort()
+        raise
+    for sink in sinks:
+        sink.close()
+    return count
+
+
+def make_sinks(names, run_date, output_dir=OUTPUT_DIR, chunk_rows=DEFAULT_CHUNK_ROWS, loader=None):
+    sinks = []
+    for name in names:
+        if name == 'csv':
+            sinks.append(CsvSink(run_date, output_dir, chunk_rows))
+        elif name in ('parquet', 'arrow'):
+            sinks.append(ColumnarSink(run_date, name, output_dir, chunk_rows))
+        elif name == 'db':
+            sinks.append(DatabaseSink(run_date, loader, chunk_rows))
+    return sinks
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Stream parsed PCF data for one or more dates into CSV, columnar files or a database.")
+    parser.add_argument("dates", nargs='+', help="Dates to process (YYYY-MM-DD).")
+    parser.add_argument("--sink", nargs='+', choices=['csv', 'parquet', 'arrow', 'db'], default=['csv'],
+                        help="Where to write the normalized records (default: csv).")
+    parser.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS,
+                        help=f"Rows buffered per table before each write (default: {DEFAULT_CHUNK_ROWS}).")
+    parser.add_argument("--workers", type=int, default=1, help="Number of worker processes (default: 1).")
+    parser.add_argument("--backend", choices=['mssql', 'sqlite'], default='mssql', help="Database for the db sink (default: mssql).")
+    parser.add_argument("--sqlite-path", default=None, help="SQLite database file for --backend sqlite.")
+    parser.add_argument("--vendor-priority",
+                        help=f"Comma-separated vendor priority for ETFs published by more than one vendor; archives are "
+                             f"streamed in this order and the db sink keeps the first copy (default: {','.join(DEFAULT_PRIORITY)}).")
+    args = parser.parse_args()
+    priority = parse_priority(args.vendor_priority)
+
+    loader = None
+    if 'db' in args.sink:
+        from load_pcfs import SQLiteLoader, MSSQLLoader, SQLITE_DB
+        loader = SQLiteLoader(args.sqlite_path or SQLITE_DB) if args.backend == 'sqlite' else MSSQLLoader()
+
+    executor = ProcessPoolExecutor(max_workers=args.workers) if args.workers > 1 else None
+    try:
+        for d in args.dates:
+            started = time.perf_counter()
+            sinks = make_sinks(args.sink, d, chunk_rows=args.chunk_rows, loader=loader)
+            count = stream_date(d, sinks, args.workers, executor, priority=priority)
+            logging.info(f"--- {d}: {count} files streamed in {time.perf_counter() - started:.2f}s ---")
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        if loader is not None:
+            loader.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,216 @@
+import os
+import logging
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from pcf_dedup import FUND_KEY
+from pcf_schema import ISIN_LENGTH, market_values
+
+# 解析結果 (正規化済みの1日分) の検証。すべて1日分の表全体に対する列の演算と集約で行い、行やETFごとのループは行わない。
+#   - ISIN の形式 (国コード2文字 + 英数字9文字 + 数字1文字) とチェックディジット (Luhn)
+#   - ISINと評価額のある行 (一部のベンダーのみ) で 株数 x 価格 x 先物の乗数 が Market Value と一致するか (相対誤差 VALUE_RTOL 以内)
+#   - 純資産総額のあるETF (一部のベンダーのみ) で 保有銘柄の円換算の評価額の合計 + 現金等 が AUM と一致するか (NAV_RTOL 以内)
+# 結果はETFごとの品質の一覧と、隔離する保有銘柄の行 (理由つき) として返し、data/quality/ に日付ごとに保存する。
+
+# 解析結果の出力先 (parse_pcfs_by_date.OUTPUT_DIR) の下に保存する
+QUALITY_DIR = os.path.join('data', 'quality')
+
+# 評価額・純資産総額の照合の許容誤差 (相対)
+VALUE_RTOL = 0.005
+NAV_RTOL = 0.01
+
+# ETFごとの品質の一覧の列
+REPORT_COLUMNS = FUND_KEY + [
+    'source', 'rows', 'no_isin', 'invalid_isin', 'duplicate_isin', 'value_checked', 'value_mismatch',
+    'holdings_value', 'Cash_Component', 'AUM', 'nav_diff', 'status',
+]
+
+# 隔離の理由 (1行に複数ある場合は先のもの)
+REASON_ISIN = 'invalid_isin'
+REASON_VALUE = 'market_value'
+REASON_NAV = 'unreconciled'
+
+_ISIN_PATTERN = r'[A-Z]{2}[A-Z0-9]{9}[0-9]'
+
+
+def isin_valid(isins):
+    """
+    ISIN の形式とチェックディジットが正しいかどうかの配列 (bool)。欠損は False。
+    英字を2桁の数 (A=10 ... Z=35) に展開した数字の列に Luhn のチェックを行う。
+    展開後の桁の位置は行ごとに異なるため、12文字を右から1文字ずつ列単位で処理し、行ごとの位置を持ち回る。
+    """
+    text = pd.Series(isins, dtype='string').str.upper()
+    ok = text.str.fullmatch(_ISIN_PATTERN).fillna(False).to_numpy(dtype=bool)
+    chars = np.full((len(text), ISIN_LENGTH), ord('0'), dtype='u1')
+    if ok.any():
+        encoded = text[ok].astype(object).to_numpy().astype(f'S{ISIN_LENGTH}')
+        chars[ok] = np.frombuffer(encoded.tobytes(), dtype='u1').reshape(-1, ISIN_LENGTH)
+    values = np.where(chars >= ord('A'), chars - (ord('A') - 10), chars - ord('0')).astype('int64')
+
+    total = np.zeros(len(text), dtype='int64')
+    position = np.zeros(len(text), dtype='int64')  # 次の数字の右からの位置 (奇数の位置を2倍する)
+    for j in range(ISIN_LENGTH - 1, -1, -1):
+        v = values[:, j]
+        letter = v >= 10
+        total += _luhn_digit(v % 10, position)
+        position += 1
+        total += np.where(letter, _luhn_digit(v // 10, position), 0)
+        position += letter
+    return ok & (total % 10 == 0)
+
+
+def _luhn_digit(digit, position):
+    doubled = np.where(position % 2 == 1, digit * 2, digit)
+    return np.where(doubled > 9, doubled - 9, doubled)
+
+
+def validate(base, holdings, value_rtol=VALUE_RTOL, nav_rtol=NAV_RTOL, label=None):
+    """
+    正規化済みの解析結果 (評価額・純資産総額の列があれば照合に使う) を検証する。
+    ETFは (Fund_Date, ETF_Code, source) ごとに扱う (ベンダーごとの重複は解消しなくてよい)。
+    戻り値: (ETFごとの品質の一覧 (REPORT_COLUMNS), 隔離する保有銘柄の行 (holdings の行と index に reason 列を付けたもの))
+    status: 'ok' / 'quarantined' (隔離する行がある) / 'unreconciled' (AUM と一致しない。すべての行を隔離する)
+    円換算できない行 (円建て以外で 'FX Rate' がない) を含むETFは AUM と照合しない。label はログに出力する名前
+    """
+    key = FUND_KEY + ['source']
+    if holdings is None:
+        holdings = pd.DataFrame(columns=key + ['ISIN', 'Shares_Amount', 'Stock_Price'])
+
+    has_isin = holdings['ISIN'].notna().to_numpy()
+    invalid_isin = has_isin & ~isin_valid(holdings['ISIN'])
+    duplicate_isin = has_isin & holdings.duplicated(key + ['ISIN']).to_numpy()
+
+    value_checked = np.zeros(len(holdings), dtype=bool)
+    value_mismatch = np.zeros(len(holdings), dtype=bool)
+    if 'Market_Value' in holdings.columns:
+        shares = holdings['Shares_Amount'].to_numpy(dtype='float64', na_value=np.nan)
+        price = holdings['Stock_Price'].to_numpy(dtype='float64', na_value=np.nan)
+        multiplier = holdings['Future_Multiplier'].fillna(1).to_numpy(dtype='float64', na_value=np.nan)
+        market_value = holdings['Market_Value'].to_numpy(dtype='float64', na_value=np.nan)
+        computed = shares * price * multiplier
+        # HOLDING_DETAIL に登録しないISINのない行 (現金・為替予約など。Market Value が円建ての場合がある) と
+        # 株数・価格が0の行は照合しない
+        with np.errstate(invalid='ignore'):
+            value_checked = has_isin & ~np.isnan(market_value) & ~np.isnan(computed) & (shares != 0) & (price != 0)
+            value_mismatch = value_checked & (np.abs(computed - market_value) > value_rtol * np.abs(market_value))
+
+    _, value_jpy = market_values(holdings, label) if len(holdings) else (None, pd.Series(dtype='float64'))
+    flags = pd.DataFrame({
+        'rows': 1,
+        'no_isin': ~has_isin,
+        'invalid_isin': invalid_isin,
+        'duplicate_isin': duplicate_isin,
+        'value_checked': value_checked,
+        'value_mismatch': value_mismatch,
+        'holdings_value': value_jpy.to_numpy(dtype='float64', na_value=np.nan),
+        'unvalued': value_jpy.isna().to_numpy(),
+    }, index=holdings.index)
+    per_fund = flags.groupby([holdings[col] for col in key], sort=False, dropna=False).sum(min_count=1)
+
+    aum = base['AUM'] if 'AUM' in base.columns else pd.Series(np.nan, index=base.index)
+    report = base[key + ['Cash_Component']].assign(AUM=aum).drop_duplicates(key)
+    report = report.merge(per_fund, left_on=key, right_index=True, how='left')
+    counts = ['rows', 'no_isin', 'invalid_isin', 'duplicate_isin', 'value_checked', 'value_mismatch', 'unvalued']
+    report[counts] = report[counts].fillna(0).astype('int64')
+
+    # すべての行の評価額が求められるETFのみ AUM と照合する
+    nav = report['holdings_value'] + report['Cash_Component'].fillna(0)
+    reconcilable = report['AUM'].notna() & (report['AUM'] != 0) & (report['rows'] > 0) & (report['unvalued'] == 0)
+    report['nav_diff'] = (nav / report['AUM'] - 1).where(reconcilable)
+    unreconciled = report['nav_diff'].abs() > nav_rtol
+    report['status'] = np.select(
+        [unreconciled, (report['invalid_isin'] > 0) | (report['value_mismatch'] > 0)],
+        [REASON_NAV, 'quarantined'], 'ok',
+    )
+
+    # 隔離する行 (AUM と一致しないETFはすべての行)
+    funds = holdings[key].merge(report.loc[unreconciled, key].assign(_nav=True), on=key, how='left')
+    nav_rows = funds['_nav'].notna().to_numpy()
+    reason = np.select([invalid_isin, value_mismatch, nav_rows], [REASON_ISIN, REASON_VALUE, REASON_NAV], '')
+    quarantine = holdings[reason != ''].assign(reason=reason[reason != ''])
+    return report[REPORT_COLUMNS].reset_index(drop=True), quarantine
+
+
+def exclude_quarantined(base, holdings, report, quarantine):
+    """隔離した行と、AUM と一致しないETFの基本情報を除いた (base, holdings) を返す"""
+    key = FUND_KEY + ['source']
+    unreconciled = report.loc[report['status'] == REASON_NAV, key]
+    if not unreconciled.empty:
+        marked = base[key].merge(unreconciled.assign(_drop=True), on=key, how='left')
+        base = base[marked['_drop'].isna().to_numpy()]
+    if holdings is not None and not quarantine.empty:
+        holdings = holdings.drop(index=quarantine.index)
+    return base, holdings
+
+
+def summarize(report, quarantine, label):
+    """品質の一覧の要約をログに出力する"""
+    reconciled = report['nav_diff'].notna()
+    logging.info(
+        f"Quality of {label}: {len(report)} ETFs, {int(report['rows'].sum())} holdings rows; "
+        f"{int(report['invalid_isin'].sum())} invalid ISINs, "
+        f"{int(report['value_mismatch'].sum())}/{int(report['value_checked'].sum())} market values off, "
+        f"{int((report['status'] == REASON_NAV).sum())}/{int(reconciled.sum())} ETFs not reconciled with AUM; "
+        f"{len(quarantine)} rows quarantined"
+    )
+    for reason, rows in quarantine.groupby('reason')['ETF_Code'].agg(['size', 'nunique']).iterrows():
+        logging.warning(f"  Quarantined {rows['size']} rows of {rows['nunique']} ETFs: {reason}")
+
+
+def save_report(report, quarantine, target_date_str, quality_dir=QUALITY_DIR):
+    """
+    品質の一覧を quality_<日付>.csv に、隔離した行を quarantine_<日付>.csv に保存する
+    (隔離した行がない場合は以前の quarantine_<日付>.csv を削除する)
+    """
+    os.makedirs(quality_dir, exist_ok=True)
+    report_path = os.path.join(quality_dir, f"quality_{target_date_str}.csv")
+    quarantine_path = os.path.join(quality_dir, f"quarantine_{target_date_str}.csv")
+    _write_csv(report, report_path)
+    if quarantine.empty:
+        if os.path.exists(quarantine_path):
+            os.remove(quarantine_path)
+    else:
+        _write_csv(quarantine, quarantine_path)
+    return report_path
+
+
+def _write_csv(df, path):
+    df = df.assign(Fund_Date=df['Fund_Date'].dt.strftime('%Y-%m-%d'))
+    tmp_path = path + '.tmp'
+    df.to_csv(tmp_path, index=False, encoding='utf-8-sig')
+    os.replace(tmp_path, path)
+
+
+def validate_date(base, holdings, target_date_str, quality_dir=QUALITY_DIR):
+    """1日分を検証して結果を保存する。戻り値: (品質の一覧, 隔離した行)"""
+    report, quarantine = validate(base, holdings, label=target_date_str)
+    summarize(report, quarantine, target_date_str)
+    path = save_report(report, quarantine, target_date_str, quality_dir)
+    logging.info(f"Quality report saved to {path}")
+    return report, quarantine
+
+
+def main():
+    from load_pcfs import read_parsed_csv
+
+    parser = argparse.ArgumentParser(description="Validate the parsed output and write per-date quality reports.")
+    parser.add_argument("dates", nargs='+', help="Parse dates whose CSV output to check (YYYY-MM-DD).")
+    parser.add_argument("--data-dir", default='data', help="Directory containing the parsed output (default: data).")
+    parser.add_argument("--quality-dir", default=None,
+                        help="Directory for the quality reports (default: <data-dir>/quality).")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    quality_dir = args.quality_dir or os.path.join(args.data_dir, 'quality')
+    for d in args.dates:
+        base, holdings = read_parsed_csv(d, args.data_dir, valuation=True)
+        if base is None:
+            logging.warning(f"No parsed data found for {d}")
+            continue
+        validate_date(base, holdings, d, quality_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+import os
+from datetime import datetime, timedelta
+from dateutil.relativedelta import relativedelta
+
+from tse_calendar import is_business_day
+
+# このスクリプトがどこから実行されても正しくパスを解決するための設定
+script_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(script_dir)
+
+BASE_DIR = os.path.join(project_root, 'data', 'downloads')
+
+# ベンダーごとの設定
+# - url: ダウンロードURLのテンプレート ({ds} に日付文字列が入る)
+# - date_format: URL・ファイル名で使う日付の書式
+# - lookback: 日次実行で遡る期間
+# - backfill: --backfill 指定時に遡る期間
+# - retry_budget: 1回の実行で許容する再試行回数の合計
+# - calendar: 公開日の判定方法 ('tse': 東証営業日のみ, 'weekdays': 土日以外)
+#   (Solactiveは日本の祝日にもファイルを公開するため 'weekdays')
+VENDORS = {
+    'ice': {
+        'url': "https://inav.ice.com/pcf-download/all/all_pcf_{ds}.zip",
+        'date_format': '%Y%m%d',
+        'lookback': relativedelta(days=10),
+        'backfill': relativedelta(days=14),
+        'retry_budget': 30,
+        'calendar': 'tse',
+    },
+    'ihs': {
+        'url': "https://api.ebs.ihsmarkit.com/inav/getfile?filename=all_pcf_{ds}.zip",
+        'date_format': '%Y%m%d',
+        'lookback': relativedelta(days=10),
+        'backfill': relativedelta(months=4),
+        'retry_budget': 30,
+        'calendar': 'tse',
+    },
+    'solactive': {
+        'url': "https://www.solactive.com/downloads/etfservices/tse-pcf/bulk/{ds}.zip",
+        'date_format': '%Y-%m-%d',
+        'lookback': relativedelta(days=10),
+        'backfill': relativedelta(years=4, months=2),
+        'retry_budget': 100,
+        'calendar': 'weekdays',
+    },
+}
+
+
+def format_date(vendor, dt):
+    """ベンダーの書式で日付文字列を返す"""
+    return dt.strftime(VENDORS[vendor]['date_format'])
+
+
+def archive_url(vendor, dt):
+    """指定日のアーカイブのダウンロードURLを返す"""
+    return VENDORS[vendor]['url'].format(ds=format_date(vendor, dt))
+
+
+def archive_path(vendor, dt, base_dir=BASE_DIR):
+    """指定日のアーカイブの保存先パスを返す (例: data/downloads/ice/ice_20251205.zip)"""
+    return os.path.join(base_dir, vendor, f"{vendor}_{format_date(vendor, dt)}.zip")
+
+
+def archive_date(vendor, file_name):
+    """アーカイブのファイル名 (例: ice_20251205.zip) から日付を返す。ベンダーの書式に合わない場合はNone"""
+    stem = os.path.splitext(os.path.basename(file_name))[0]
+    prefix = f"{vendor}_"
+    if not stem.startswith(prefix):
+        return None
+    try:
+        return datetime.strptime(stem[len(prefix):], VENDORS[vendor]['date_format']).date()
+    except ValueError:
+        return None
+
+
+def is_publishing_day(vendor, d):
+    """ベンダーがその日付のファイルを公開する可能性があるか"""
+    if VENDORS[vendor]['calendar'] == 'tse':
+        return is_business_day(d)
+    return d.weekday() < 5
+
+
+def publishing_days(vendor, start, end):
+    """start から end まで (両端を含む) のうち、ベンダーの公開日を昇順で返す"""
+    days = []
+    d = start
+    while d <= end:
+        if is_publishing_day(vendor, d):
+            days.append(d)
+        d += timedelta(days=1)
+    return days
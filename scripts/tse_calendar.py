@@ -0,0 +1,131 @@
+import argparse
+from datetime import date, timedelta
+from functools import lru_cache
+
+# 東証の営業日カレンダー
+# 祝日法の規則から祝日を計算し、規則で表せない休場日は下の表で補う。
+# ネットワークには一切アクセスしない。
+
+# 規則で表せない休日・休場日 (日付 -> 名称)
+SPECIAL_HOLIDAYS = {
+    date(2019, 4, 30): '国民の休日',
+    date(2019, 5, 1): '天皇の即位の日',
+    date(2019, 5, 2): '国民の休日',
+    date(2019, 10, 22): '即位礼正殿の儀の行われる日',
+}
+
+# 祝日以外の臨時休場日 (日付 -> 理由)
+MARKET_CLOSURES = {
+    date(2020, 10, 1): 'システム障害による終日売買停止',
+}
+
+# 東京オリンピック・パラリンピックに伴う祝日の移動 (年 -> {名称: 日付})
+MOVED_HOLIDAYS = {
+    2020: {'海の日': date(2020, 7, 23), 'スポーツの日': date(2020, 7, 24), '山の日': date(2020, 8, 10)},
+    2021: {'海の日': date(2021, 7, 22), 'スポーツの日': date(2021, 7, 23), '山の日': date(2021, 8, 8)},
+}
+
+
+def _nth_monday(year, month, n):
+    """指定月の第n月曜日"""
+    first = date(year, month, 1)
+    offset = (7 - first.weekday()) % 7
+    return first + timedelta(days=offset + 7 * (n - 1))
+
+
+def _vernal_equinox(year):
+    """春分日 (1980-2099年の近似式)"""
+    return date(year, 3, int(20.8431 + 0.242194 * (year - 1980) - (year - 1980) // 4))
+
+
+def _autumnal_equinox(year):
+    """秋分日 (1980-2099年の近似式)"""
+    return date(year, 9, int(23.2488 + 0.242194 * (year - 1980) - (year - 1980) // 4))
+
+
+def _statutory_holidays(year):
+    """振替休日・国民の休日を除く、祝日法に定められた祝日 (日付 -> 名称)"""
+    moved = MOVED_HOLIDAYS.get(year, {})
+    days = {
+        date(year, 1, 1): '元日',
+        _nth_monday(year, 1, 2): '成人の日',
+        date(year, 2, 11): '建国記念の日',
+        _vernal_equinox(year): '春分の日',
+        date(year, 4, 29): '昭和の日' if year >= 2007 else 'みどりの日',
+        date(year, 5, 3): '憲法記念日',
+        date(year, 5, 4): 'みどりの日' if year >= 2007 else '国民の休日',
+        date(year, 5, 5): 'こどもの日',
+        moved.get('海の日', _nth_monday(year, 7, 3)): '海の日',
+        _nth_monday(year, 9, 3): '敬老の日',
+        _autumnal_equinox(year): '秋分の日',
+        moved.get('スポーツの日', _nth_monday(year, 10, 2)): 'スポーツの日' if year >= 2020 else '体育の日',
+        date(year, 11, 3): '文化の日',
+        date(year, 11, 23): '勤労感謝の日',
+    }
+    if year >= 2016:
+        days[moved.get('山の日', date(year, 8, 11))] = '山の日'
+    if year <= 2018:
+        days[date(year, 12, 23)] = '天皇誕生日'
+    elif year >= 2020:
+        days[date(year, 2, 23)] = '天皇誕生日'
+    return days
+
+
+@lru_cache(maxsize=None)
+def national_holidays(year):
+    """指定年の国民の祝日・休日 (振替休日・国民の休日を含む) を返す (日付 -> 名称)"""
+    days = _statutory_holidays(year)
+    # 振替休日: 祝日が日曜日の場合、その後の最初の祝日でない日を休日とする
+    for d in sorted(days):
+        if d.weekday() == 6:
+            sub = d + timedelta(days=1)
+            while sub in days:
+                sub += timedelta(days=1)
+            days[sub] = '振替休日'
+    # 国民の休日: 前日と翌日が祝日である平日
+    for d in sorted(days):
+        between = d + timedelta(days=1)
+        if between not in days and between + timedelta(days=1) in days and between.weekday() != 6:
+            days[between] = '国民の休日'
+    for d, name in SPECIAL_HOLIDAYS.items():
+        if d.year == year:
+            days[d] = name
+    return dict(sorted(days.items()))
+
+
+@lru_cache(maxsize=None)
+def market_holidays(year):
+    """指定年の東証の休業日 (土日を除く) を返す (日付 -> 名称)"""
+    days = dict(national_holidays(year))
+    # 年末年始の休業日 (12/31, 1/1-1/3)
+    for d, name in [(date(year, 1, 2), '年始休業日'), (date(year, 1, 3), '年始休業日'), (date(year, 12, 31), '年末休業日')]:
+        days.setdefault(d, name)
+    for d, name in MARKET_CLOSURES.items():
+        if d.year == year:
+            days.setdefault(d, name)
+    return {d: name for d, name in sorted(days.items()) if d.weekday() < 5}
+
+
+def is_business_day(d):
+    """東証の営業日かどうか"""
+    return d.weekday() < 5 and d not in market_holidays(d.year)
+
+
+def business_days(start, end):
+    """start から end まで (両端を含む) の東証営業日を昇順で返す"""
+    days = []
+    d = start
+    while d <= end:
+        if is_business_day(d):
+            days.append(d)
+        d += timedelta(days=1)
+    return days
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Print TSE market holidays for the given years.")
+    parser.add_argument("years", nargs='+', type=int, help="Years to print, e.g. 2025 2026")
+    args = parser.parse_args()
+    for year in args.years:
+        for d, name in market_holidays(year).items():
+            print(f"{d.isoformat()},{name}")
@@ -0,0 +1,22 @@
+import os
+import sys
+
+import pytest
+
+# scripts/ のモジュールはパッケージではないため、スクリプトと同じく直接 import できるようにする
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts')
+if SCRIPTS_DIR not in sys.path:
+    sys.path.insert(0, SCRIPTS_DIR)
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+@pytest.fixture(autouse=True)
+def layout_registry(tmp_path, monkeypatch):
+    """解析時に登録されるレイアウトの指紋を、data/ ではなくテストごとの一時ディレクトリに保存する"""
+    import pcf_layout
+    monkeypatch.setattr(pcf_layout, 'LAYOUT_DB', str(tmp_path / 'pcf_layouts.db'))
+    monkeypatch.setattr(pcf_layout, '_default_registry', None)
+    yield
+    if pcf_layout._default_registry is not None:
+        pcf_layout._default_registry.close()
@@ -0,0 +1,105 @@
+import pandas as pd
+
+from pcf_dedup import resolve_duplicates, fund_hashes, parse_priority, DEFAULT_PRIORITY
+
+FUND_DATE = pd.Timestamp('2025-12-05')
+
+
+def _frames():
+    """
+    正規化済みの1日分:
+      1306: ice と ihs が同じ内容を公開
+      1321: ice と solactive が異なる内容を公開 (solactive にだけ ISIN が1つ多い)
+      1475: ihs のみ
+    """
+    base = pd.DataFrame({
+        'Fund_Date': [FUND_DATE] * 5,
+        'ETF_Code': ['1306', '1321', '1306', '1321', '1475'],
+        'ETF_Name': ['TOPIX', 'N225', 'TOPIX', 'N225', 'TOPIX Core'],
+        'Cash_Component': [100.0, 200.0, 100.0, 200.0, 300.0],
+        'Shares_Outstanding': [10.0, 20.0, 10.0, 20.0, 30.0],
+        'source': ['ice', 'ice', 'ihs', 'solactive', 'ihs'],
+    }).astype({'ETF_Code': 'string', 'ETF_Name': 'string', 'source': 'string'})
+    rows = [
+        ('1306', 'JP3633400001', 1000.0, 'ice'), ('1306', 'JP3435000009', 500.0, 'ice'),
+        ('1321', 'JP3633400001', 200.0, 'ice'),
+        # ihs は行の順序が異なるだけ
+        ('1306', 'JP3435000009', 500.0, 'ihs'), ('1306', 'JP3633400001', 1000.0, 'ihs'),
+        ('1321', 'JP3633400001', 200.0, 'solactive'), ('1321', 'JP3902900004', 300.0, 'solactive'),
+        ('1475', 'JP3633400001', 50.0, 'ihs'),
+    ]
+    holdings = pd.DataFrame(rows, columns=['ETF_Code', 'ISIN', 'Shares_Amount', 'source'])
+    holdings.insert(0, 'Fund_Date', FUND_DATE)
+    holdings = holdings.astype({'ETF_Code': 'string', 'ISIN': 'string', 'source': 'string'})
+    return base, holdings
+
+
+def _kept(base, holdings):
+    """ETFコード -> 残ったベンダー (基本情報と保有銘柄でベンダーが1つに揃っていることも確認する)"""
+    kept = dict(zip(base['ETF_Code'], base['source']))
+    assert len(kept) == len(base)
+    for etf, sources in holdings.groupby('ETF_Code')['source'].unique().items():
+        assert list(sources) == [kept[etf]]
+    return kept
+
+
+def test_default_priority():
+    base, holdings, report = resolve_duplicates(*_frames())
+    assert _kept(base, holdings) == {'1306': 'ice', '1321': 'solactive', '1475': 'ihs'}
+    assert len(holdings) == 5
+
+    report = report.set_index('ETF_Code')
+    assert report.loc['1306', ['kept', 'dropped']].tolist() == ['ice', 'ihs']
+    assert bool(report.loc['1306', 'identical'])
+    assert report.loc['1321', ['kept', 'dropped']].tolist() == ['solactive', 'ice']
+    assert not bool(report.loc['1321', 'identical'])
+    assert report.loc['1321', ['only_kept', 'only_dropped']].tolist() == [1, 0]
+
+
+def test_custom_priority():
+    base, holdings, report = resolve_duplicates(*_frames(), priority=['ihs', 'ice', 'solactive'])
+    assert _kept(base, holdings) == {'1306': 'ihs', '1321': 'ice', '1475': 'ihs'}
+    assert len(report) == 2
+
+
+def test_unlisted_vendor_ranks_last():
+    base, holdings, _ = resolve_duplicates(*_frames(), priority=['ice'])
+    assert _kept(base, holdings)['1306'] == 'ice'
+    # 優先順位にないベンダー同士はベンダー名の順
+    base, holdings, _ = resolve_duplicates(*_frames(), priority=['solactive'])
+    assert _kept(base, holdings) == {'1306': 'ice', '1321': 'solactive', '1475': 'ihs'}
+
+
+def test_no_duplicates_is_unchanged():
+    base, holdings = _frames()
+    base, holdings = base[base['source'] == 'ice'], holdings[holdings['source'] == 'ice']
+    resolved_base, resolved_holdings, report = resolve_duplicates(base, holdings)
+    assert resolved_base is base and resolved_holdings is holdings
+    assert report.empty
+
+
+def test_content_hash_ignores_row_order():
+    base, holdings = _frames()
+    hashes = fund_hashes(base, holdings).set_index(['ETF_Code', 'source'])['content_hash']
+    assert hashes[('1306', 'ice')] == hashes[('1306', 'ihs')]
+    assert hashes[('1321', 'ice')] != hashes[('1321', 'solactive')]
+
+
+def test_content_hash_with_fund_without_holdings():
+    base, holdings = _frames()
+    alone = fund_hashes(base, holdings).set_index(['ETF_Code', 'source'])['content_hash']
+    # 保有銘柄のないETF (1308) を同じ表に含めても、他のETFのハッシュは変わらない (float64 を経由しない)
+    empty_fund = pd.DataFrame({
+        'Fund_Date': [FUND_DATE], 'ETF_Code': ['1308'], 'ETF_Name': ['TOPIX 2'],
+        'Cash_Component': [0.0], 'Shares_Outstanding': [1.0], 'source': ['ice'],
+    }).astype(base.dtypes.to_dict())
+    batched = fund_hashes(pd.concat([base, empty_fund], ignore_index=True), holdings)
+    assert batched['content_hash'].dtype == 'uint64'
+    batched = batched.set_index(['ETF_Code', 'source'])
+    assert batched['content_hash'].drop(('1308', 'ice')).sort_index().equals(alone.sort_index())
+    assert batched.loc[('1308', 'ice'), 'holdings_rows'] == 0
+
+
+def test_parse_priority():
+    assert parse_priority(None) == DEFAULT_PRIORITY
+    assert parse_priority(' ihs, ice ,') == ['ihs', 'ice']
@@ -0,0 +1,88 @@
+import pandas as pd
+
+from pcf_delta import day_state, compute_delta, apply_delta, save_snapshot, save_delta, rebuild, _same_state
+
+
+def _day(fund_date, funds, positions):
+    """
+    正規化済みの1日分 (1ベンダー) を作って状態の形にする。
+    funds: {ETFコード: 現金部分}, positions: [(ETFコード, ISIN, 銘柄コード, 銘柄名, 株数), ...]
+    """
+    fund_date = pd.Timestamp(fund_date)
+    base = pd.DataFrame({
+        'Fund_Date': [fund_date] * len(funds),
+        'ETF_Code': list(funds),
+        'ETF_Name': list(funds),
+        'Cash_Component': list(funds.values()),
+        'Shares_Outstanding': [1000.0] * len(funds),
+        'source': ['ice'] * len(funds),
+    }).astype({'Fund_Date': 'datetime64[ns]', 'ETF_Code': 'string', 'ETF_Name': 'string', 'source': 'string'})
+    holdings = pd.DataFrame(positions, columns=['ETF_Code', 'ISIN', 'Local_Code', 'Stock_Name', 'Shares_Amount'])
+    holdings.insert(0, 'Fund_Date', pd.Series(fund_date, index=holdings.index, dtype='datetime64[ns]'))
+    holdings['source'] = 'ice'
+    holdings = holdings.astype({col: 'string' for col in ['ETF_Code', 'ISIN', 'Local_Code', 'Stock_Name', 'source']})
+    holdings['Shares_Amount'] = holdings['Shares_Amount'].astype('float64')
+    return day_state(base, holdings)
+
+
+DAY1 = ('2025-12-04', {'1306': 100.0, '1321': 200.0, '1475': 300.0}, [
+    ('1306', 'JP3633400001', '7203', 'Toyota', 1000),
+    ('1306', 'JP3435000009', '6758', 'Sony', 500),
+    ('1321', 'JP3633400001', '7203', 'Toyota', 200),
+    ('1321', None, None, 'JPY CASH', 1),
+    ('1475', 'JP3902900004', '8306', 'MUFG', 50),
+])
+DAY2 = ('2025-12-05', {'1306': 110.0, '1321': 200.0, '2558': 400.0}, [
+    ('1306', 'JP3633400001', '7203', 'Toyota', 1000),   # 変化なし
+    ('1306', 'JP3435000009', '6758', 'Sony', 600),      # 株数の変更
+    ('1306', 'JP3902900004', '8306', 'MUFG', 10),       # 追加
+    ('1321', None, None, 'JPY CASH', 2),                # ISINのない行の変更 (Toyota は削除)
+    ('2558', None, 'SPX', 'S&P500 FUT', 3),             # 新しいETF
+])
+
+
+def test_delta_counts():
+    state, day = _day(*DAY1), _day(*DAY2)
+    fund_delta, position_delta = compute_delta(state, day)
+    counts = fund_delta.set_index('ETF_Code')[['Added', 'Removed', 'Changed']]
+    assert counts.loc['1306'].tolist() == [1, 0, 1]
+    assert counts.loc['1321'].tolist() == [0, 1, 1]
+    assert counts.loc['2558'].tolist() == [1, 0, 0]
+    # 公開されなかったETF (1475) は差分に含めない
+    assert '1475' not in counts.index
+    assert set(position_delta['Position_Key']) >= {'N:JPY CASH', 'L:SPX'}
+
+
+def test_apply_delta_round_trip():
+    state, day = _day(*DAY1), _day(*DAY2)
+    funds, positions = apply_delta(state, compute_delta(state, day))
+
+    # 公開されたETFはその日の状態、公開されなかったETFは前回の状態のまま
+    expected_funds = pd.concat([day[0], state[0][state[0]['ETF_Code'] == '1475']])
+    expected_funds = expected_funds.sort_values('ETF_Code').reset_index(drop=True)
+    expected_positions = pd.concat([day[1], state[1][state[1]['ETF_Code'] == '1475']])
+    expected_positions = expected_positions.sort_values(['ETF_Code', 'Position_Key']).reset_index(drop=True)
+    pd.testing.assert_frame_equal(funds, expected_funds)
+    pd.testing.assert_frame_equal(positions, expected_positions)
+
+    # 同じ日をもう一度適用しても変わらない
+    again = apply_delta((funds, positions), compute_delta((funds, positions), day))
+    assert _same_state(again, (funds, positions))
+
+
+def test_older_fund_date_is_ignored():
+    state = _day(*DAY2)
+    fund_delta, position_delta = compute_delta(state, _day(*DAY1))
+    assert set(fund_delta['ETF_Code']) == {'1475'}
+    assert set(position_delta['ETF_Code']) == {'1475'}
+
+
+def test_rebuild_from_files(tmp_path):
+    state, day = _day(*DAY1), _day(*DAY2)
+    delta = compute_delta(state, day)
+    save_snapshot(state, '2025-12-04', str(tmp_path))
+    save_delta(delta, '2025-12-05', str(tmp_path))
+    funds, positions, applied = rebuild('2025-12-05', str(tmp_path))
+    assert applied == '2025-12-05'
+    assert _same_state((funds, positions), apply_delta(state, delta))
+    assert rebuild('2025-12-03', str(tmp_path)) is None
@@ -0,0 +1,30 @@
+import os
+from datetime import datetime
+
+from conftest import FIXTURES_DIR
+from parse_pcfs_by_date import find_archives, list_work_items, parse_work_items, collect_results, save_results
+
+# tests/fixtures/downloads/ のアーカイブ (ice・ihs の一部のメンバーのみ)
+FIXTURE_DATE = '2025-12-05'
+
+
+def _parse_to_csv(output_dir, workers):
+    found_files = [path for _, path in find_archives(datetime.strptime(FIXTURE_DATE, '%Y-%m-%d'),
+                                                     download_dir=os.path.join(FIXTURES_DIR, 'downloads'))]
+    results = parse_work_items(list_work_items(found_files), workers=workers)
+    final_base_df, final_holdings_df = collect_results(results)
+    save_results(final_base_df, final_holdings_df, FIXTURE_DATE, output_dir=str(output_dir),
+                 index=False, latest=False, validate=False)
+    outputs = {}
+    for name in ['base_info', 'holdings']:
+        with open(os.path.join(output_dir, f"{name}_{FIXTURE_DATE}.csv"), 'rb') as f:
+            outputs[name] = f.read()
+    return outputs
+
+
+def test_process_pool_matches_serial(tmp_path):
+    serial = _parse_to_csv(tmp_path / 'serial', workers=1)
+    pooled = _parse_to_csv(tmp_path / 'pool', workers=2)
+    assert serial['base_info'].count(b'\n') > 1
+    assert serial['holdings'].count(b'\n') > 1
+    assert pooled == serial
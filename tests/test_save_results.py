@@ -0,0 +1,43 @@
+import os
+from datetime import datetime
+
+import pytest
+
+from conftest import FIXTURES_DIR
+from parse_pcfs_by_date import find_archives, list_work_items, parse_work_items, collect_results, save_results
+
+# tests/fixtures/downloads/ のアーカイブ (ice・ihs の一部のメンバーのみ)
+FIXTURE_DATE = '2025-12-05'
+
+
+def _parse(vendors=None):
+    found_files = [path for _, path in find_archives(datetime.strptime(FIXTURE_DATE, '%Y-%m-%d'), vendors,
+                                                     download_dir=os.path.join(FIXTURES_DIR, 'downloads'))]
+    return collect_results(parse_work_items(list_work_items(found_files)))
+
+
+def _derived_outputs(output_dir, subdirs):
+    """output_dir の下の subdirs (quality・index) にあるファイルの中身"""
+    outputs = {}
+    for sub in subdirs:
+        for name in sorted(os.listdir(os.path.join(output_dir, sub))):
+            with open(os.path.join(output_dir, sub, name), 'rb') as f:
+                outputs[f"{sub}/{name}"] = f.read()
+    return outputs
+
+
+@pytest.mark.parametrize('fmt', ['csv', 'parquet', 'arrow'])
+def test_partial_saves_keep_other_vendors(tmp_path, fmt):
+    """
+    ベンダーごとに分けて保存しても、品質の一覧・隔離した行・逆引き索引は1日分をまとめて保存した場合と同じになる
+    (後から保存したベンダーの検証で、先に保存したベンダーの隔離した行が消えない)
+    """
+    full_dir, partial_dir = str(tmp_path / 'full'), str(tmp_path / 'partial')
+    save_results(*_parse(), FIXTURE_DATE, fmt, output_dir=full_dir, latest=False)
+    for vendor in ['ice', 'ihs']:
+        save_results(*_parse([vendor]), FIXTURE_DATE, fmt, output_dir=partial_dir, replace_sources=[vendor],
+                     latest=False)
+    full = _derived_outputs(full_dir, ['quality', 'index'])
+    assert f"index/holdings_{FIXTURE_DATE}.idx" in full
+    assert f"quality/quarantine_{FIXTURE_DATE}.csv" in full
+    assert _derived_outputs(partial_dir, ['quality', 'index']) == full
@@ -0,0 +1,85 @@
+import os
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import pcf_schema
+from conftest import FIXTURES_DIR
+from parse_pcfs_by_date import find_archives, list_work_items, parse_work_items, collect_results
+from pcf_schema import normalize_base, normalize_holdings
+
+
+@pytest.fixture(scope='module')
+def parsed(tmp_path_factory):
+    """tests/fixtures/downloads/ のアーカイブを解析した (基本情報, 保有銘柄) (正規化前)"""
+    import pcf_layout
+    # conftest の layout_registry はテストごとのため、モジュール単位の解析でも data/ に書かないようにする
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(pcf_layout, 'LAYOUT_DB', str(tmp_path_factory.mktemp('layouts') / 'pcf_layouts.db'))
+        mp.setattr(pcf_layout, '_default_registry', None)
+        try:
+            found_files = [path for _, path in find_archives(datetime(2025, 12, 5),
+                                                             download_dir=os.path.join(FIXTURES_DIR, 'downloads'))]
+            return collect_results(parse_work_items(list_work_items(found_files)))
+        finally:
+            if pcf_layout._default_registry is not None:
+                pcf_layout._default_registry.close()
+
+
+def _edge_cases():
+    """
+    値ごとの処理と列単位の処理で扱いが分かれやすい値 (数値になったコード・空白・空文字・桁区切り・不正なISIN。
+    12文字でも全角の数字・記号を含むものはISINとして扱わない)
+    """
+    base = pd.DataFrame({
+        'ETF Code': [1306.0, ' 1321 ', np.nan],
+        'ETF Name': [' TOPIX ETF ', '', 'x'],
+        'Fund Date': ['20251205', '2025/12/05', None],
+        'Fund Cash Component': ['1,234.5', '', '7'],
+        'Shares Outstanding': [100.0, np.nan, 3.0],
+        'AUM': ['5,000', None, '1'],
+        'source': ['ice', 'ihs', 'ice'],
+    })
+    holdings = pd.DataFrame({
+        'ETF Code': [1306.0, 1306.0, '1321', '1321', '9999', '1321', 1306.0],
+        'Code': [7203.0, np.nan, '8306.0', ' 6758 ', 'X', '9984', '6501'],
+        'Name': [' Toyota ', '', None, 'Sony', 'y', 'SoftBank', 'Hitachi'],
+        'ISIN': ['JP3633400001', 'FORWARD', None, ' JP3435000009 ', 'JP3633400001', 'JP343600000１', 'JP-788000003'],
+        'Exchange': ['TSE', '', 'TSE', 'TSE', 'TSE', 'TSE', 'TSE'],
+        'Currency': ['JPY', 'USD', 'JPY', '', 'JPY', 'JPY', 'JPY'],
+        'Shares Amount': ['1,000', '2', np.nan, '3.5', '1', '4', '5'],
+        'Stock Price': [2500.0, 1.0, np.nan, 12000.0, 1.0, 9000.0, 4000.0],
+        'Market Value': ['2,500,000', None, None, '42000', '1', None, None],
+        'FX Rate': [1.0, 150.0, np.nan, np.nan, 1.0, 1.0, 1.0],
+        'source': ['ice', 'ice', 'ihs', 'ihs', 'ice', 'ihs', 'ice'],
+    })
+    return base, holdings
+
+
+def _normalize(base, holdings, min_rows, valuation, monkeypatch):
+    monkeypatch.setattr(pcf_schema, 'VECTORIZE_MIN_ROWS', min_rows)
+    normalized = normalize_base(base, default_date='2025-12-05', valuation=valuation)
+    return normalized, normalize_holdings(holdings, normalized, valuation=valuation)
+
+
+@pytest.mark.parametrize('valuation', [False, True])
+@pytest.mark.parametrize('case', ['fixture', 'edge_cases'])
+def test_vectorized_normalization_matches_per_value(parsed, case, valuation, monkeypatch):
+    base, holdings = parsed if case == 'fixture' else _edge_cases()
+    per_value = _normalize(base, holdings, 10 ** 9, valuation, monkeypatch)
+    vectorized = _normalize(base, holdings, 0, valuation, monkeypatch)
+    assert len(per_value[1]) > 0
+    pd.testing.assert_frame_equal(vectorized[0], per_value[0])
+    pd.testing.assert_frame_equal(vectorized[1], per_value[1])
+
+
+@pytest.mark.parametrize('min_rows', [10 ** 9, 0])
+def test_non_ascii_isins_are_dropped(min_rows, monkeypatch):
+    base, holdings = _normalize(*_edge_cases(), min_rows, False, monkeypatch)
+    isins = dict(zip(holdings['Local_Code'], holdings['ISIN']))
+    assert pd.isna(isins['9984']) and pd.isna(isins['6501'])
+    # 固定長のバイト列への変換が表全体で失敗しない
+    restored = pcf_schema.expand(pcf_schema.compact(holdings))
+    assert restored['ISIN'].tolist() == holdings['ISIN'].tolist()
@@ -0,0 +1,64 @@
+import random
+import string
+
+import numpy as np
+import pandas as pd
+
+from pcf_validate import isin_valid
+
+
+def _luhn_isin(isin):
+    """比較用: 英字を数字に展開した文字列に1件ずつ Luhn のチェックを行う"""
+    if len(isin) != 12 or not isin[:2].isalpha() or not isin[-1].isdigit() or not isin.isalnum():
+        return False
+    digits = ''.join(str(int(c, 36)) for c in isin.upper())
+    total = 0
+    for i, c in enumerate(reversed(digits)):
+        d = int(c) * (2 if i % 2 == 1 else 1)
+        total += d - 9 if d > 9 else d
+    return total % 10 == 0
+
+
+def test_known_isins():
+    cases = {
+        'JP3633400001': True,   # トヨタ自動車
+        'US0378331005': True,   # Apple
+        'AU0000XVGZA3': True,   # 途中に英字を含む
+        'IE00B4L5Y983': True,
+        'DE000BAY0017': True,
+        'us0378331005': True,   # 小文字も大文字として扱う
+        'US0378331006': False,  # チェックディジットが異なる
+        'JP3633400002': False,
+        'JP363340000': False,   # 11桁
+        'JP36334000011': False,  # 13桁
+        '123456789012': False,  # 国コードが数字
+        'JP363340000A': False,  # チェックディジットが英字
+        'FORWARD': False,
+        '': False,
+    }
+    result = isin_valid(list(cases))
+    assert result.dtype == bool
+    assert result.tolist() == list(cases.values())
+
+
+def test_missing_values_are_invalid():
+    result = isin_valid(pd.Series(['JP3633400001', None, np.nan, pd.NA], dtype=object))
+    assert result.tolist() == [True, False, False, False]
+
+
+def test_empty_input():
+    assert isin_valid([]).tolist() == []
+
+
+def test_matches_reference_implementation():
+    rng = random.Random(0)
+    alphabet = string.ascii_uppercase + string.digits
+    isins = []
+    for _ in range(2000):
+        body = ''.join(rng.choice(string.ascii_uppercase) for _ in range(2)) + \
+            ''.join(rng.choice(alphabet) for _ in range(9))
+        isins.append(body + rng.choice(string.digits))
+    expected = [_luhn_isin(isin) for isin in isins]
+    assert isin_valid(isins).tolist() == expected
+    # 乱数の入力でも有効なものと無効なものの両方を含む (チェックディジットは10通りなので約1割が有効)
+    assert 0 < sum(expected) < len(expected)